@@ -0,0 +1,8 @@
+# trover - support code for the KSU T-Rover STEM Kit.
+#
+# The rover itself is still started with raspberrypi_trover.py (on the
+# Raspberry Pi) and termux_trover.py (on the phone). The modules in this
+# package are the pieces shared by those scripts and by the development
+# tools that run on a laptop, e.g.
+#
+#   python3 -m trover.replay field_day.nmea --speed 10
@@ -0,0 +1,530 @@
+#!/usr/bin/env python3
+# bench - micro benchmarks for the hot paths of the rover stack.
+#
+# Usage (from the repository root):
+#   python3 -m trover.bench                        # run everything, print a table
+#   python3 -m trover.bench --json results.json    # also save the results
+#   python3 -m trover.bench --baseline results.json --max-slowdown 0.2
+#
+# With --baseline the run is compared benchmark by benchmark against a
+# saved results file and exits with status 1 if any median got more than
+# --max-slowdown (a fraction, 0.2 = 20%) slower. Inputs are synthetic and
+# generated from a fixed seed so runs are comparable between machines and
+# commits; only the timings change.
+#
+#   python3 -m trover.bench --cold-start 10
+#   python3 -m trover.bench --cold-start 5 --route-points 100000 --first-fix 1.0
+#
+# starts raspberrypi_trover.py 10 times and reports the time from launching
+# the interpreter to the first servo command. Without --first-fix the sim
+# backend provides a fix at once; with it the mock backend is used and the
+# benchmark sends the first GPS datagram to UDP port 20001 on 127.0.0.1 that
+# many seconds after launch, like a phone that is still acquiring.
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+from trover import bridge
+from trover import ekf
+from trover import fixgate
+from trover import geo
+from trover import hardware
+from trover import imustream
+from trover import magcal
+from trover import purepursuit
+from trover import replay
+from trover import route
+from trover import rover
+from trover import track
+
+SEED = 2021
+ORIGIN = (33.903134, -84.5893325)  # KSU Marietta campus, like ccsvtrack.txt
+
+BENCHMARKS = []
+
+
+# benchmark - registers a benchmark. The decorated function takes the
+# input size and returns (fn, ops): fn is called repeatedly, and each call
+# performs `ops` operations of the thing being measured.
+def benchmark(name):
+    def register(setup):
+        BENCHMARKS.append((name, setup))
+        return setup
+    return register
+
+
+######################
+# Synthetic inputs
+######################
+
+# syntheticRoute - a smooth random walk of n coarse [lat, lon] waypoints
+# with step[0]-step[1] m between them.
+def syntheticRoute(n, seed=SEED, step=(2.0, 5.0)):
+    rng = random.Random(seed)
+    lat, lon = ORIGIN
+    heading = 0.0
+    pts = []
+    for i in range(n):
+        pts.append([lat, lon])
+        heading += rng.uniform(-0.3, 0.3)
+        ds = rng.uniform(step[0], step[1])
+        lat += ds * math.sin(heading) / 111320.0
+        lon += ds * math.cos(heading) / (111320.0 * math.cos(math.radians(ORIGIN[0])))
+    return pts
+
+
+# smoothedRoute - the syntheticRoute run through the Pi's route pipeline.
+def smoothedRoute(n):
+    wp_utm = route.projectWaypoints(syntheticRoute(n))
+    sxx, syy, suu = route.smoothWaypoints(wp_utm, route.spacingBetweenCoarseWaypoints)
+    return sxx, syy
+
+
+# nmeaChunk - n epochs of RMC+GGA as the USB bridge would deliver them.
+def nmeaChunk(n):
+    pts = syntheticRoute(n + 1)
+    text = ''
+    for i in range(n):
+        text += replay.epochText(i * 0.1, pts[i][0], pts[i][1], 45.0, 1.5)
+    return text
+
+
+######################
+# Benchmarks
+######################
+
+@benchmark('deg2utm')
+def benchDeg2utm(size):
+    pts = syntheticRoute(size)
+    def fn():
+        for p in pts:
+            geo.deg2utm(p[0], p[1])
+    return fn, len(pts)
+
+
+@benchmark('smoothWaypoints')
+def benchSmoothWaypoints(size):
+    wp_utm = route.projectWaypoints(syntheticRoute(size // 10))
+    def fn():
+        route.smoothWaypoints(wp_utm, route.spacingBetweenCoarseWaypoints)
+    return fn, 1
+
+
+@benchmark('densifyWaypoints')
+def benchDensifyWaypoints(size):
+    wp_utm = route.projectWaypoints(syntheticRoute(size // 10))
+    def fn():
+        route.densifyWaypoints(wp_utm, 3)
+    return fn, 1
+
+
+@benchmark('loadRoute')
+def benchLoadRoute(size):
+    from trover import ingest
+    fd, fname = tempfile.mkstemp(suffix='.txt')
+    f = os.fdopen(fd, 'w')
+    for p in syntheticRoute(size * 10):
+        f.write('%.10f,%.10f\n' % (p[0], p[1]))
+    f.close()
+    def fn():
+        ingest.loadRoute(fname)
+    fn.cleanup = lambda: os.remove(fname)
+    return fn, 1
+
+
+@benchmark('simplifyTrack')
+def benchSimplifyTrack(size):
+    from trover import simplify
+    pts = np.array(syntheticRoute(size * 10, step=(0.0, 0.3)))
+    def fn():
+        simplify.simplifyTrack(pts[:, 0], pts[:, 1], 0.05)
+    return fn, 1
+
+
+@benchmark('readTrackCsv')
+def benchReadTrackCsv(size):
+    from trover import ingest
+    fd, fname = tempfile.mkstemp(suffix='.txt')
+    f = os.fdopen(fd, 'w')
+    for p in syntheticRoute(size * 10):
+        f.write('%.10f,%.10f\n' % (p[1], p[0]))  # lon,lat like stemcamptrack.txt
+    f.close()
+    def fn():
+        ingest.readTrack(fname)
+    fn.cleanup = lambda: os.remove(fname)
+    return fn, 1
+
+
+@benchmark('findGoalPoint')
+def benchFindGoalPoint(size):
+    sxx, syy = smoothedRoute(size // 10)
+    # poses a quarter, half and three quarters of the way along the route
+    poses = [(sxx[k], syy[k]) for k in (len(sxx) // 4, len(sxx) // 2, 3 * len(sxx) // 4)]
+    def fn():
+        for x, y in poses:
+            purepursuit.findGoalPoint(sxx, syy, x, y, 3)
+    return fn, len(poses)
+
+
+@benchmark('map match step')
+def benchMapMatch(size):
+    from trover import mapmatch
+    sxx, syy = smoothedRoute(size // 10)
+    matcher = mapmatch.MapMatcher(sxx, syy)
+    rng = random.Random(SEED)
+    # noisy positions along the first part of the route
+    poses = [(sxx[k] + rng.gauss(0, 1), syy[k] + rng.gauss(0, 1)) for k in range(0, min(len(sxx), 2000), 20)]
+    def fn():
+        for x, y in poses:
+            matcher.step(x, y)
+            matcher.goalPoint(x, y, 3)
+    return fn, len(poses)
+
+
+@benchmark('cross track')
+def benchCrossTrack(size):
+    from trover import crosstrack
+    sxx, syy = smoothedRoute(size // 10)
+    scorer = crosstrack.CrossTrack(sxx, syy)
+    rng = random.Random(SEED)
+    # noisy poses along the first part of the route, in order
+    poses = [(sxx[k] + rng.gauss(0, 0.5), syy[k] + rng.gauss(0, 0.5), rng.uniform(-math.pi, math.pi))
+             for k in range(0, min(len(sxx), 2000), 20)]
+    def fn():
+        scorer.farthest = 0.0
+        for x, y, h in poses:
+            scorer.update(x, y, h)
+    return fn, len(poses)
+
+
+@benchmark('purePursuit')
+def benchPurePursuit(size):
+    rng = random.Random(SEED)
+    cases = []
+    for i in range(size):
+        pose = (rng.uniform(-5, 5), rng.uniform(-5, 5), rng.uniform(-math.pi, math.pi))
+        cases.append((pose, rng.uniform(-5, 5), rng.uniform(-5, 5), rng.uniform(0.5, 3)))
+    def fn():
+        for pose, lx, ly, d in cases:
+            purepursuit.purePursuit(pose, lx, ly, d)
+    return fn, len(cases)
+
+
+@benchmark('nmeaToDatagrams')
+def benchNmea(size):
+    text = nmeaChunk(size // 10)
+    def fn():
+        bridge.nmeaToDatagrams(text, bridge.newNmeaState())
+    return fn, size // 10
+
+
+@benchmark('nmeaToDatagrams GGA')
+def benchNmeaGgaOnly(size):
+    text = ''.join(l for l in nmeaChunk(size).splitlines(True) if 'GGA' in l)
+    def fn():
+        bridge.nmeaToDatagrams(text, bridge.newNmeaState(ggaOnly=True))
+    return fn, size
+
+
+@benchmark('track course')
+def benchTrackCourse(size):
+    h = track.TrackHistory()
+    fixes = [geo.deg2utm(p[0], p[1])[:2] for p in syntheticRoute(size, step=(0.1, 0.3))]
+    def fn():
+        t = h.n * 0.1
+        for x, y in fixes:
+            t += 0.1
+            h.add(t, x, y)
+            h.estimate()
+    return fn, len(fixes)
+
+
+@benchmark('decodeGpsDatagram')
+def benchDecodeDatagram(size):
+    msgs = [('%s,%s,%s' % (45.0 + i % 90, p[0], p[1])).encode() for i, p in enumerate(syntheticRoute(size))]
+    msgs[::7] = [b'None,33.903134,-84.5893325'] * len(msgs[::7])
+    sensorDict = {"compass": 90}
+    def fn():
+        for m in msgs:
+            rover.decodeGpsDatagram(m, sensorDict)
+    return fn, len(msgs)
+
+
+@benchmark('fix gate')
+def benchFixGate(size):
+    rng = random.Random(SEED)
+    fixes = [(i * 0.1, i * 0.15 + rng.gauss(0, 1), rng.gauss(0, 1), (1, rng.uniform(0.5, 3), 9)) for i in range(size)]
+    def fn():
+        gate = fixgate.FixGate()
+        for t, x, y, quality in fixes:
+            gate.check(t, x, y, quality)
+    return fn, len(fixes)
+
+
+@benchmark('imu ingest')
+def benchImuIngest(size):
+    rng = random.Random(SEED)
+    msgs = [('%.3f,3,%.4f,%.4f,%.4f,4,%.4f,%.4f,%.4f,5,%.4f,%.4f,%.4f'
+             % ((i * 0.005,) + tuple(rng.uniform(-20, 20) for j in range(9)))).encode() for i in range(size)]
+    batches = [msgs[i:i + 16] for i in range(0, len(msgs), 16)]  # 10 ms of a 1600 Hz stream
+    stream = imustream.ImuStream()
+    sensorDict = {}
+    def fn():
+        for b in batches:
+            stream.ingest(b, sensorDict)
+    return fn, len(msgs)
+
+
+@benchmark('ekf predict')
+def benchEkfPredict(size):
+    f = ekf.PoseEkf()
+    f.start(0.0, 0.0, 0.0, 0.5)
+    rng = random.Random(SEED)
+    rates = [rng.uniform(-0.5, 0.5) for i in range(size)]
+    def fn():
+        t = f.t
+        for w in rates:
+            t += 0.02
+            f.predict(t, w)
+    return fn, len(rates)
+
+
+@benchmark('ekf update')
+def benchEkfUpdate(size):
+    f = ekf.PoseEkf()
+    f.start(0.0, 0.0, 0.0, 0.5)
+    rng = random.Random(SEED)
+    fixes = [(rng.gauss(0, 1), rng.gauss(0, 1)) for i in range(size)]
+    def fn():
+        for x, y in fixes:
+            f.updatePosition(x, y)
+            f.updateHeading(0.5)
+    return fn, len(fixes)
+
+
+@benchmark('magcal correct')
+def benchMagCorrect(size):
+    cal = magcal.MagCalibration((4.0, 15.0, -9.0), ((1.1, 0.1, 0.0), (0.1, 0.8, 0.06), (0.0, 0.06, 1.0)), 48.0)
+    rng = random.Random(SEED)
+    samples = [[rng.uniform(-50, 50) for j in range(3)] for i in range(size)]
+    def fn():
+        for m in samples:
+            cal.correct(m)
+    return fn, len(samples)
+
+
+@benchmark('controlTick')
+def benchControlTick(size):
+    sxx, syy = smoothedRoute(size // 10)
+    troverGoal = (sxx[-1], syy[-1])
+    fixes = syntheticRoute(size // 10)[1:-1]
+    rover.servo = hardware.MockServo(keep=1)
+    def fn():
+        for lat, lon in fixes:
+            rover.sensorDict["gps"] = [lat, lon]
+            rover.controlTick(sxx, syy, troverGoal)
+    return fn, len(fixes)
+
+
+######################
+# Runner
+######################
+
+# timeIt - times fn: calibrates a loop count so a sample takes at least
+# minTime seconds, then takes `repeat` samples. Returns per-op seconds.
+def timeIt(fn, ops, repeat, minTime):
+    loops = 1
+    while True:
+        t0 = time.perf_counter()
+        for k in range(loops):
+            fn()
+        dt = time.perf_counter() - t0
+        if dt >= minTime or loops >= 1 << 20:
+            break
+        loops *= 2 if dt <= 0 else max(2, min(10, int(minTime / dt * 1.2) + 1))
+    samples = [dt / (loops * ops)]
+    for r in range(repeat - 1):
+        t0 = time.perf_counter()
+        for k in range(loops):
+            fn()
+        samples.append((time.perf_counter() - t0) / (loops * ops))
+    return samples
+
+
+def runBenchmarks(size=1000, repeat=7, minTime=0.05, only=None):
+    results = {}
+    for name, setup in BENCHMARKS:
+        if only and not any(o in name for o in only):
+            continue
+        fn, ops = setup(size)
+        try:
+            samples = sorted(timeIt(fn, ops, repeat, minTime))
+        finally:
+            if hasattr(fn, 'cleanup'):
+                fn.cleanup()
+        results[name] = {
+            'unit': 'us/op',
+            'median': samples[len(samples) // 2] * 1e6,
+            'min': samples[0] * 1e6,
+            'mean': sum(samples) / len(samples) * 1e6,
+            'ops': ops,
+            'samples': len(samples),
+        }
+    return results
+
+
+# coldStart - launches raspberrypi_trover.py on a synthetic route `runs`
+# times. The route is a recorded track (0.1-0.3 m between points, a 10 Hz
+# log at walking pace) of routePoints points. With firstFix=None the sim
+# backend provides the fix; otherwise the mock backend is used and fixes
+# are sent over UDP starting firstFix seconds after launch. Returns a list
+# of seconds from starting the process to its first servo command.
+def coldStart(runs=10, routePoints=100, firstFix=None):
+    repo = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    tmp = tempfile.mkdtemp()
+    pts = syntheticRoute(routePoints, step=(0.1, 0.3))
+    f = open(os.path.join(tmp, 'route.txt'), 'w')
+    for p in pts:
+        f.write('%.10f,%.10f\n' % (p[0], p[1]))
+    f.close()
+    f = open(os.path.join(tmp, 'raspberrypi_trover_conf.txt'), 'w')
+    if firstFix is None:
+        f.write('L=3\nwaypointsfname = route.txt\nbindaddress = any\nservobackend = sim\n')
+    else:
+        f.write('L=3\nwaypointsfname = route.txt\nbindaddress = 127.0.0.1\nservobackend = mock\n')
+    f.close()
+    env = dict(os.environ)
+    env['PYTHONPATH'] = repo + os.pathsep + env.get('PYTHONPATH', '')
+    datagram = ('90,%.10f,%.10f' % (pts[0][0], pts[0][1])).encode()
+    times = []
+    for r in range(runs):
+        t0 = time.time()
+        proc = subprocess.Popen([sys.executable, os.path.join(repo, 'raspberrypi_trover.py')], cwd=tmp, env=env,
+                                stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+        done = threading.Event()
+        if firstFix is not None:
+            threading.Thread(target=sendFixes, args=(datagram, t0 + firstFix, done), daemon=True).start()
+        for line in proc.stdout:
+            if line.startswith('First servo command'):
+                times.append(time.time() - t0)
+                break
+        done.set()
+        proc.kill()
+        proc.wait()
+    for fname in os.listdir(tmp):
+        os.remove(os.path.join(tmp, fname))
+    os.rmdir(tmp)
+    return times
+
+
+# sendFixes - plays the phone for coldStart: sends a GPS datagram to the
+# rover every 100 ms from Unix time `start` until `done` is set.
+def sendFixes(datagram, start, done, port=20001):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    wait = start - time.time()
+    if wait > 0:
+        done.wait(wait)
+    while not done.is_set():
+        sock.sendto(datagram, ('127.0.0.1', port))
+        done.wait(0.1)
+    sock.close()
+
+
+def machineInfo(size):
+    return {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'machine': platform.machine(),
+        'platform': platform.platform(),
+        'size': size,
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+
+
+# compare - returns a list of (name, baseline, current, ratio) for every
+# benchmark present in both result sets.
+def compare(baseline, current):
+    rows = []
+    for name, cur in current.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        rows.append((name, base['median'], cur['median'], cur['median'] / base['median']))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the T-Rover hot paths.')
+    parser.add_argument('--size', type=int, default=1000, help='input size (fixes, coarse waypoints x10, ...)')
+    parser.add_argument('--repeat', type=int, default=7)
+    parser.add_argument('--quick', action='store_true', help='fewer, shorter samples')
+    parser.add_argument('--filter', action='append', help='only run benchmarks whose name contains this')
+    parser.add_argument('--json', help='write results to this file')
+    parser.add_argument('--baseline', help='results file to compare against')
+    parser.add_argument('--max-slowdown', type=float, default=0.25,
+                        help='fail if a median is this fraction slower than the baseline')
+    parser.add_argument('--list', action='store_true', help='list the benchmarks and exit')
+    parser.add_argument('--cold-start', type=int, metavar='RUNS',
+                        help='measure process start to first servo command instead')
+    parser.add_argument('--route-points', type=int, default=100, help='route size for --cold-start')
+    parser.add_argument('--first-fix', type=float, metavar='SECONDS',
+                        help='for --cold-start: send the first GPS fix this long after launch')
+    args = parser.parse_args(argv)
+
+    if args.cold_start:
+        times = sorted(coldStart(args.cold_start, args.route_points, args.first_fix))
+        if not times:
+            print('raspberrypi_trover.py never reported a servo command.')
+            return 1
+        print('Cold start to first servo command over %d runs: median %.1f ms, min %.1f ms, max %.1f ms'
+              % (len(times), times[len(times) // 2] * 1e3, times[0] * 1e3, times[-1] * 1e3))
+        return 0
+
+    if args.list:
+        for name, setup in BENCHMARKS:
+            print(name)
+        return 0
+
+    repeat, minTime = (3, 0.01) if args.quick else (args.repeat, 0.05)
+    results = runBenchmarks(args.size, repeat, minTime, args.filter)
+    print('%-22s %12s %12s %12s' % ('benchmark', 'median us', 'min us', 'mean us'))
+    for name, r in results.items():
+        print('%-22s %12.3f %12.3f %12.3f' % (name, r['median'], r['min'], r['mean']))
+
+    if args.json:
+        f = open(args.json, 'w')
+        json.dump({'meta': machineInfo(args.size), 'benchmarks': results}, f, indent=2)
+        f.close()
+        print('Results written to %s' % args.json)
+
+    status = 0
+    if args.baseline:
+        f = open(args.baseline, 'r')
+        baseline = json.load(f)['benchmarks']
+        f.close()
+        print(' ')
+        print('%-22s %12s %12s %8s' % ('vs baseline', 'base us', 'now us', 'ratio'))
+        for name, base, cur, ratio in compare(baseline, results):
+            flag = ''
+            if ratio > 1 + args.max_slowdown:
+                flag = '  SLOWER'
+                status = 1
+            print('%-22s %12.3f %12.3f %8.2f%s' % (name, base, cur, ratio, flag))
+        if status:
+            print('Regression: some benchmarks are more than %d%% slower than the baseline.' % round(args.max_slowdown * 100))
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,224 @@
+# bridge - the GPS bridge that runs in Termux on the smartphone.
+#
+# Reads NMEA from the USB Serial Port to TCP/IP Socket app, turns each
+# RMC+GGA pair into a "heading,lat,lon,quality,hdop,sats" datagram (the
+# GGA fix quality, HDOP and satellite count, for the RPi's fix gate) and
+# sends it to the Raspberry Pi over the hotspot. Started by termux_trover.py (run());
+# importing the module has no side effects.
+import socket
+import signal
+import sys
+import pynmea2
+import time
+import io
+from trover import config
+from trover import trace
+
+# Settings of termux_trover_conf.txt: (key, type, default, help). Any of
+# them can also be given on the command line as key=value (see
+# trover/config.py).
+OPTIONS = (
+    ('RasberryPi_IP_Address', str, 'x.x.x.x', 'IP address of the RPi on the smartphone hotspot'),
+    ('UsbBridge_IP_Address', str, '192.0.0.2', 'USB Serial Port to TCP/IP Socket app'),
+    ('UsbBridge_Port', int, 1236, 'TCP port of the USB bridge app'),
+    ('Trace', int, 0, '1 = add latency trace fields to every datagram (see trover/trace.py)'),
+    ('MetricsPort', int, 0, 'local HTTP port for live metrics, 0 = off (see trover/metrics.py)'),
+    ('RPi_Port', int, 20001, 'UDP port the RPi receives GPS on (its gpsport setting)'),
+    ('GgaOnly', int, 0, '1 = skip RMC and send every GGA fix without a course (set trackcourse = 1 on the RPi)'),
+)
+
+conf = config.defaults(OPTIONS)
+thisRpiIP = conf['RasberryPi_IP_Address']
+thisBridgeIP = conf['UsbBridge_IP_Address']
+thisBridgePort = conf['UsbBridge_Port']
+thisTrace = conf['Trace']
+thisMetricsPort = conf['MetricsPort']
+thisGgaOnly = conf['GgaOnly']
+
+# loadConfig - reads termux_trover_conf.txt and the command line settings
+# into the this* globals.
+def loadConfig(fname="termux_trover_conf.txt", overrides=()):
+    global conf, thisRpiIP, thisBridgeIP, thisBridgePort, thisTrace, thisMetricsPort, thisGgaOnly, destPort_udp
+    print('Reading Configuration File: %s ...' % fname)
+    conf = config.loadConfig(fname, OPTIONS, overrides)
+    thisRpiIP = conf['RasberryPi_IP_Address']
+    thisBridgeIP = conf['UsbBridge_IP_Address']
+    thisBridgePort = conf['UsbBridge_Port']
+    thisTrace = conf['Trace']
+    thisMetricsPort = conf['MetricsPort']
+    thisGgaOnly = conf['GgaOnly']
+    destPort_udp = conf['RPi_Port']
+    print('Config loaded!')
+
+destPort_udp = conf['RPi_Port'] # must match gpsport of the RPi
+
+s = None
+ss = None
+bridgeMetrics = None # metrics.BridgeMetrics when the metrics port is set
+
+def signal_handler(sig,frame):
+    if s is not None:
+        s.close()
+    print('done')
+    sys.exit(0)
+
+# newNmeaState - state carried between calls of nmeaToDatagrams (the
+# halves of the datagram being built, None until their sentence has come,
+# and the start of a sentence the last recv() cut off). With ggaOnly every
+# GGA makes a datagram of its own and RMC is not parsed.
+def newNmeaState(ggaOnly=False):
+    return {'heading': None, 'latlon': None, 'utc': None, 'quality': '', 'ggaOnly': ggaOnly, 'partial': ''}
+
+# resetPair - drops the half built datagram, so a pair one of whose
+# sentences failed (or never came) cannot leave its other half in the
+# next datagram
+def resetPair(state):
+    state['heading'] = None
+    state['latlon'] = None
+    state['utc'] = None
+    state['quality'] = ''
+
+MAX_PARTIAL = 1024  # longest unterminated text kept for the next recv(); NMEA sentences are under 100
+
+# nmeaToDatagrams - parses the NMEA text of one recv() and returns the
+# "heading,lat,lon,quality,hdop,sats" datagrams completed by it, one per
+# RMC and GGA pair in either order. Sentences with a bad checksum or that
+# do not parse are skipped (and counted when metrics are on), and so is
+# the other sentence of their pair.
+def nmeaToDatagrams(sdata, state):
+    m = bridgeMetrics
+    out = []
+    # a sentence split over two TCP reads is parsed once its line ending
+    # arrives
+    sdata = state['partial'] + sdata
+    cut = sdata.rfind('\n') + 1
+    state['partial'] = sdata[cut:] if len(sdata) - cut <= MAX_PARTIAL else ''
+    buf = io.StringIO(sdata[:cut])
+    nmea_sentence = '-------'
+    while len(nmea_sentence)>0:
+        nmea_sentence = buf.readline()
+        if 'GGA' in nmea_sentence:
+            try:
+                msg_latlon=pynmea2.parse(nmea_sentence)
+            except pynmea2.ParseError as e:
+                countBadSentence(m, e)
+                resetPair(state)
+                continue
+            if m is not None:
+                m.sentences += 1
+            if state['latlon'] is not None:
+                resetPair(state)  # the RMC of the last GGA never came
+            state['latlon']="%s,%s"%(msg_latlon.latitude,msg_latlon.longitude)
+            state['utc']=trace.utcSeconds(msg_latlon.timestamp)
+            state['quality']=ggaQuality(msg_latlon)
+            if state['ggaOnly']:
+                state['heading']='None'  # no course to wait for
+        if 'RMC' in nmea_sentence and not state['ggaOnly']:
+            try:
+                msg = pynmea2.parse(nmea_sentence)
+            except pynmea2.ParseError as e:
+                countBadSentence(m, e)
+                resetPair(state)
+                continue
+            if m is not None:
+                m.sentences += 1
+            if state['heading'] is not None:
+                resetPair(state)  # the GGA of the last RMC never came
+            try:
+                angle = float(msg.true_course)
+                angle = 360+(90-angle)
+                if angle > 360:
+                    angle = angle - 360
+            except:
+                angle='None'
+            state['heading']=str(angle)
+
+        if state['heading'] is not None and state['latlon'] is not None:
+            out.append(state['heading']+','+state['latlon']+state['quality'])
+            state['heading']=None
+            state['latlon']=None
+    return out
+
+# ggaQuality - ",quality,hdop,sats" of a GGA sentence, None for the
+# fields it leaves empty
+def ggaQuality(msg):
+    fields = []
+    for v in (msg.gps_qual, msg.horizontal_dil, msg.num_sats):
+        fields.append('None' if v is None or v == '' else str(v))
+    return ','+','.join(fields)
+
+# countBadSentence - counts a sentence pynmea2 rejected
+def countBadSentence(m, e):
+    if m is None:
+        return
+    if isinstance(e, pynmea2.ChecksumError):
+        m.checksumFailures += 1
+    else:
+        m.parseErrors += 1
+
+# answerSync - answers the RPi's clock SYNC requests (SYNC,t1) waiting on
+# the non-blocking UDP socket with SYNC,t1,t2,t3.
+def answerSync(sock):
+    while True:
+        try:
+            message, addr, t2 = trace.recvfromStamped(sock, 1024)
+        except BlockingIOError:
+            return
+        if message.startswith(b'SYNC'):
+            sock.sendto(message + b',%.6f,%.6f' % (t2, time.time()), addr)
+
+def main():
+    global s, ss, bridgeMetrics
+    destIP_udp = thisRpiIP # Change this to the IP address of the RPi on the smartphone hotspot
+
+    s = socket.socket(socket.AF_INET,socket.SOCK_STREAM)
+    s.connect((thisBridgeIP,thisBridgePort)) # Do not change unless replaying a log (trover/replay.py)
+
+    signal.signal(signal.SIGINT,signal_handler)
+    ss=socket.socket(socket.AF_INET,socket.SOCK_DGRAM)
+
+    if thisMetricsPort:
+        from trover import metrics
+        bridgeMetrics = metrics.BridgeMetrics(period=.1)
+        metrics.startMetricsServer(bridgeMetrics, thisMetricsPort)
+        print('Metrics on http://127.0.0.1:%d/metrics' % thisMetricsPort)
+
+    state = newNmeaState(thisGgaOnly)
+    traceId = 0
+    if thisTrace:
+        ss.setblocking(False)
+        trace.enableRecvTimestamps(ss)
+    while True:
+        data=s.recv(115200)
+        tRecv=time.time()
+        sdata=data.decode('ascii', errors='replace')  # a garbled byte fails its sentence's checksum
+        for o in nmeaToDatagrams(sdata, state):
+            if thisTrace:
+                traceId += 1
+                o += ",%d,%s,%.6f,%.6f"%(traceId, state['utc'], tRecv, time.time())
+            ss.sendto(o.encode(),(destIP_udp,destPort_udp))
+            if bridgeMetrics is not None:
+                bridgeMetrics.datagrams += 1
+                bridgeMetrics.lastFix = tRecv
+        if bridgeMetrics is not None:
+            bridgeMetrics.reads += 1
+            bridgeMetrics.tick()
+        if thisTrace:
+            answerSync(ss)
+        time.sleep(.1)
+
+# run - entry point used by termux_trover.py. argv holds the command
+# line: an optional --conf FILE and key=value settings.
+def run(fname="termux_trover_conf.txt", argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description='T-Rover GPS bridge.',
+                                     formatter_class=argparse.RawDescriptionHelpFormatter,
+                                     epilog='settings (key=value, override the config file):\n' + config.usage(OPTIONS))
+    parser.add_argument('--conf', default=fname, help='config file (default %(default)s)')
+    parser.add_argument('settings', nargs='*', metavar='key=value')
+    args = parser.parse_args(argv)
+    try:
+        loadConfig(args.conf, config.parseOverrides(args.settings))
+    except ValueError as e:
+        parser.error(str(e))
+    main()
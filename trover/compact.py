@@ -0,0 +1,133 @@
+# compact - routes stored as small offsets from an origin.
+#
+# smoothWaypoints() returns the route as lists of Python floats, 32 bytes
+# a point per coordinate (plus the zone and curvature lists), and even a
+# float64 array spends most of its bits on the six and seven digits of the
+# UTM easting and northing that every point shares. A CompactRoute keeps
+# one origin (x0, y0), a whole metre near the route, and per point
+#
+#   float32  dx, dy in metres: 4 bytes each. The rounding error is at most
+#            half a float32 ulp of the offset, |d| * 2^-24: under 0.6 mm
+#            within 10 km of the origin, under 6 mm within 100 km.
+#   int32    dx, dy in centimetres: 4 bytes each, at most 5 mm off in x
+#            and in y (7 mm in distance) anywhere within 21 000 km of the
+#            origin.
+#
+# plus the curvature as float32 (1/m, relative error 2^-24), 12 bytes a
+# point in all, against about 110 for the lists. The arrays can be plain
+# NumPy arrays or maps of a route file (trover/routefile.py). Points are
+# handed out one at a time as RoutePoint objects, created on demand.
+#
+# findGoalPoint() works on the offsets directly, a block of points at a
+# time in float64, so it picks the same point purepursuit.findGoalPoint
+# would pick on the decoded route.
+import math
+
+import numpy as np
+
+STORAGES = ('float32', 'int32')
+SCALE = {'float32': 1.0, 'int32': 0.01}  # metres per stored unit
+GOAL_BLOCKS = (1 << 10, 1 << 16)  # first and largest block findGoalPoint measures
+
+
+# RoutePoint - one point of a CompactRoute
+class RoutePoint:
+    __slots__ = ('index', 'x', 'y', 'k')
+
+    def __init__(self, index, x, y, k):
+        self.index = index
+        self.x = x
+        self.y = y
+        self.k = k
+
+    def __repr__(self):
+        return 'RoutePoint(%d, %.3f, %.3f, %g)' % (self.index, self.x, self.y, self.k)
+
+
+# pickOrigin - the whole metre origin of a route starting at (x, y)
+def pickOrigin(x, y):
+    return float(math.floor(x)), float(math.floor(y))
+
+
+# encode - stored (dx, dy) arrays of UTM x, y arrays
+def encode(x, y, origin, storage='float32'):
+    if storage not in STORAGES:
+        raise ValueError('route storage must be one of %s, not "%s"' % (', '.join(STORAGES), storage))
+    dx = np.asarray(x, dtype=float) - origin[0]
+    dy = np.asarray(y, dtype=float) - origin[1]
+    if storage == 'int32':
+        if max(np.abs(dx).max(initial=0), np.abs(dy).max(initial=0)) * 100 >= 2 ** 31:
+            raise ValueError('route too far from its origin for int32 storage')
+        return np.rint(dx * 100).astype(np.int32), np.rint(dy * 100).astype(np.int32)
+    return dx.astype(np.float32), dy.astype(np.float32)
+
+
+# CompactRoute - a route as origin plus dx, dy (stored as `storage`) and
+# curvature k arrays
+class CompactRoute:
+    def __init__(self, origin, dx, dy, k, zone='', storage='float32'):
+        self.origin = origin
+        self.dx = dx
+        self.dy = dy
+        self.k = k
+        self.zone = zone
+        self.storage = storage
+        self.scale = SCALE[storage]
+
+    def __len__(self):
+        return len(self.dx)
+
+    # xy - UTM (x, y) of point i
+    def xy(self, i):
+        return (self.origin[0] + float(self.dx[i]) * self.scale,
+                self.origin[1] + float(self.dy[i]) * self.scale)
+
+    # point - RoutePoint of point i
+    def point(self, i):
+        if i < 0:
+            i += len(self.dx)
+        x, y = self.xy(i)
+        return RoutePoint(i, x, y, float(self.k[i]))
+
+    # xyArrays - float64 UTM x, y of the points [start, end)
+    def xyArrays(self, start=0, end=None):
+        return (self.origin[0] + self.dx[start:end].astype(np.float64) * self.scale,
+                self.origin[1] + self.dy[start:end].astype(np.float64) * self.scale)
+
+    # nbytes - bytes the point arrays take
+    def nbytes(self):
+        return self.dx.nbytes + self.dy.nbytes + self.k.nbytes
+
+    # findGoalPoint - purepursuit.findGoalPoint on the route: the farthest
+    # point within L of UTM (x, y), searched back from the end of the
+    # route in blocks that double in size, so a goal near the end is found
+    # as fast as with the lists. dx and dy are the route's own arrays, so
+    # it can stand in for findGoalPoint(sxx, syy, x, y, L).
+    def findGoalPoint(self, dx, dy, x, y, L, end=None):
+        qx = (x - self.origin[0]) / self.scale
+        qy = (y - self.origin[1]) / self.scale
+        L2 = (L / self.scale) ** 2
+        i = 0
+        end = len(dx) if end is None else min(end, len(dx))
+        block = GOAL_BLOCKS[0]
+        while end > 0:
+            start = max(0, end - block)
+            ex = np.subtract(dx[start:end], qx, dtype=np.float64)
+            ey = np.subtract(dy[start:end], qy, dtype=np.float64)
+            hit = np.flatnonzero(ex * ex + ey * ey <= L2)
+            if len(hit):
+                i = start + int(hit[-1])
+                break
+            end = start
+            block = min(2 * block, GOAL_BLOCKS[1])
+        goal_x, goal_y = self.xy(i)
+        return goal_x, goal_y, math.hypot(goal_x - x, goal_y - y), i
+
+
+# fromArrays - CompactRoute of UTM x, y (and curvature k) arrays
+def fromArrays(x, y, k=None, zone='', storage='float32'):
+    origin = pickOrigin(x[0], y[0])
+    dx, dy = encode(x, y, origin, storage)
+    if k is None:
+        k = np.zeros(len(dx), dtype=np.float32)
+    return CompactRoute(origin, dx, dy, np.asarray(k, dtype=np.float32), zone, storage)
@@ -0,0 +1,165 @@
+# config - key = value configuration files.
+#
+# raspberrypi_trover_conf.txt and termux_trover_conf.txt hold one setting
+# per line:
+#
+#   L = 3
+#   waypointsfname = ccsvtrack.txt
+#   # comments and blank lines are ignored
+#
+# Keys are matched case insensitively against the OPTIONS table of the
+# program reading the file, a tuple of (key, type, default, help) with an
+# optional fifth range check (POSITIVE, NON_NEGATIVE or upTo()), so the
+# order of the lines does not matter and left out settings keep their
+# defaults. Any setting can also be given on the command line as
+# key=value, which wins over the file:
+#
+#   python3 raspberrypi_trover.py L=4 controlrate=20
+#
+# ConfigWatcher lets a running program pick up edits: it notices a new
+# modification time of the file (checked at most once per `interval`) or a
+# SIGHUP, and the program then re-reads the file and applies the settings
+# it can change on the fly.
+import os
+import signal
+import time
+
+
+# Range checks of an option: (test, what the value must be)
+POSITIVE = (lambda v: v > 0, 'greater than 0')
+NON_NEGATIVE = (lambda v: v >= 0, '0 or more')
+
+
+# upTo - the range check of an option greater than 0 and at most high
+def upTo(high):
+    return (lambda v: 0 < v <= high, 'greater than 0 and at most %g' % high)
+
+
+# optionKeys - {lower case key: option} for an OPTIONS table
+def optionKeys(options):
+    return dict((o[0].lower(), o) for o in options)
+
+
+# defaults - {key: default} for an OPTIONS table
+def defaults(options):
+    return dict((o[0], o[2]) for o in options)
+
+
+# parseValue - converts the text of a setting to the option's type and
+# checks its range
+def parseValue(option, text):
+    kind = option[1]
+    try:
+        value = kind(text)
+    except ValueError:
+        raise ValueError('%s must be %s, not "%s"' % (option[0], kind.__name__, text))
+    if len(option) > 4 and not option[4][0](value):
+        raise ValueError('%s must be %s, not %s' % (option[0], option[4][1], text))
+    return value
+
+
+# parseLines - yields (line number, key, value text) of the key = value
+# lines of a file
+def parseLines(fname):
+    f = open(fname, "r")
+    for n, line in enumerate(f, 1):
+        line = line.strip()
+        if len(line) == 0 or line.startswith('#'):
+            continue
+        if '=' not in line:
+            print('%s line %d: ignoring "%s" (no "=")' % (fname, n, line))
+            continue
+        key, value = line.split('=', 1)
+        yield n, key.strip(), value.strip()
+    f.close()
+
+
+# parseOverrides - the key=value arguments of a command line as (key, text)
+def parseOverrides(argv):
+    out = []
+    for arg in argv:
+        if '=' not in arg:
+            raise ValueError('command line setting "%s" is not key=value' % arg)
+        key, value = arg.split('=', 1)
+        out.append((key.strip(), value.strip()))
+    return out
+
+
+# loadConfig - reads fname (if it exists) and the overrides into a dict of
+# typed values keyed by the OPTIONS table's spelling of every key.
+def loadConfig(fname, options, overrides=()):
+    keys = optionKeys(options)
+    conf = defaults(options)
+    settings = []
+    if fname is not None and os.path.exists(fname):
+        for n, key, text in parseLines(fname):
+            settings.append(('%s line %d' % (fname, n), key, text))
+    elif fname is not None:
+        print('No configuration file %s, using defaults.' % fname)
+    for key, text in overrides:
+        settings.append(('command line', key, text))
+    for where, key, text in settings:
+        option = keys.get(key.lower())
+        if option is None:
+            print('%s: unknown setting "%s" ignored' % (where, key))
+            continue
+        try:
+            conf[option[0]] = parseValue(option, text)
+        except ValueError as e:
+            raise ValueError('%s: %s' % (where, e))
+    return conf
+
+
+# usage - text listing every option with its default
+def usage(options):
+    lines = []
+    for option in options:
+        key, kind, default, text = option[:4]
+        lines.append('  %-22s %s (default %s)' % (key, text, default))
+    return '\n'.join(lines)
+
+
+# ConfigWatcher - tells the loop when the configuration should be re-read.
+class ConfigWatcher:
+    def __init__(self, fname, interval=1.0):
+        self.fname = fname
+        self.interval = interval
+        self.mtime = self._mtime()
+        self.nextCheck = 0.0
+        self.requested = False
+
+    def _mtime(self):
+        try:
+            return os.stat(self.fname).st_mtime
+        except OSError:
+            return None
+
+    # request - ask for a reload (safe to call from a signal handler)
+    def request(self):
+        self.requested = True
+
+    # due - call from the loop; True once per request or change of the
+    # file. interval <= 0 turns the file check off (SIGHUP still works).
+    def due(self, now=None):
+        if self.requested:
+            self.requested = False
+            self.mtime = self._mtime()
+            return True
+        if self.interval <= 0:
+            return False
+        if now is None:
+            now = time.monotonic()
+        if now < self.nextCheck:
+            return False
+        self.nextCheck = now + self.interval
+        mtime = self._mtime()
+        if mtime == self.mtime:
+            return False
+        self.mtime = mtime
+        return True
+
+
+# installReloadSignal - SIGHUP asks the watcher for a reload
+def installReloadSignal(watcher):
+    if hasattr(signal, 'SIGHUP'):
+        signal.signal(signal.SIGHUP, lambda sig, frame: watcher.request())
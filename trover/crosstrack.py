@@ -0,0 +1,124 @@
+# crosstrack - how well the rover follows the route, tick by tick.
+#
+# Runs used to be judged by eye. CrossTrack scores every tick against the
+# route instead:
+#
+#   cross-track  signed distance from the route, positive left of it
+#   progress     arc length along the route to the rover's projection
+#   heading      heading error, the rover's heading minus the route's
+#   complete     progress as a percentage of the route length
+#
+# Each tick the pose is projected only onto the segments of a window of
+# route around the farthest progress so far, from MAX_BACK metres behind
+# it to MAX_AHEAD metres ahead, and the closest is the current segment.
+# The window is the same few hundred points however long the route, so
+# this is O(1), and a rover cutting a corner (or a hairpin) is found
+# again on the route after it rather than on the pass beside it. With map
+# matching on (trover/mapmatch.py) the window is around the matched
+# segment instead. The magnitudes of the
+# cross-track and heading errors go into running statistics (RunningError:
+# RMS, max and percentiles from a log spaced trace.Histogram), so nothing
+# is stored per tick. describe() summarises the run, and on the RPi the
+# metrics carry the latest values and the statistics.
+import math
+
+import numpy as np
+
+from trover import trace
+
+MAX_AHEAD = 10.0  # m of route ahead of the progress so far a tick looks at
+MAX_BACK = 2.0  # and behind it
+
+
+# RunningError - RMS, max and approximate percentiles of a stream of
+# errors (their magnitudes), O(1) per sample
+class RunningError:
+    def __init__(self):
+        self.n = 0
+        self.sum2 = 0.0
+        self.max = 0.0
+        self.histogram = trace.Histogram()
+
+    def record(self, e):
+        a = abs(e)
+        self.n += 1
+        self.sum2 += a * a
+        if a > self.max:
+            self.max = a
+        self.histogram.record(a)
+
+    def rms(self):
+        return math.sqrt(self.sum2 / self.n) if self.n else math.nan
+
+    def percentile(self, p):
+        return self.histogram.percentile(p)
+
+
+# CrossTrack - the scorer for the route x, y (UTM, metres)
+class CrossTrack:
+    def __init__(self, x, y):
+        self.x = np.asarray(x, dtype=float)
+        self.y = np.asarray(y, dtype=float)
+        self.s = np.zeros(len(self.x))
+        np.cumsum(np.hypot(np.diff(self.x), np.diff(self.y)), out=self.s[1:])
+        self.length = float(self.s[-1])
+        self.last = len(self.x) - 2  # last segment
+        self.dx = np.diff(self.x)
+        self.dy = np.diff(self.y)
+        self.len2 = np.maximum(self.dx * self.dx + self.dy * self.dy, 1e-12)
+        self.crossTrack = None  # m, positive left of the route
+        self.progress = 0.0  # m along the route
+        self.farthest = 0.0  # m, the largest progress so far
+        self.headingError = None  # radians
+        self.complete = 0.0  # percent
+        self.crossTrackStats = RunningError()
+        self.headingStats = RunningError()
+
+    # update - scores the pose (x, y, heading in radians or None). segment
+    # is the map matched segment, if any. Returns the signed cross-track
+    # error.
+    def update(self, x, y, heading=None, segment=None):
+        # the closest segment of the window of route around the progress
+        # so far: recorded routes zigzag a little and GPS noise moves the
+        # closest point back and forth, so the distance along the route
+        # has local minima a walk from segment to segment would stop at
+        ref = self.farthest if segment is None else float(self.s[min(max(segment, 0), self.last)])
+        a = max(int(np.searchsorted(self.s, ref - MAX_BACK)) - 1, 0)
+        b = min(int(np.searchsorted(self.s, ref + MAX_AHEAD)), self.last) + 1
+        ex = x - self.x[a:b]
+        ey = y - self.y[a:b]
+        t = np.clip((ex * self.dx[a:b] + ey * self.dy[a:b]) / self.len2[a:b], 0.0, 1.0)
+        d2 = (ex - t * self.dx[a:b]) ** 2 + (ey - t * self.dy[a:b]) ** 2
+        k = int(np.argmin(d2))
+        i = a + k
+        t = float(t[k])
+        e = math.sqrt(float(d2[k]))
+        ax = float(self.x[i])
+        ay = float(self.y[i])
+        dx = float(self.dx[i])
+        dy = float(self.dy[i])
+        length = math.hypot(dx, dy)
+        side = dx * (y - ay) - dy * (x - ax)
+        self.crossTrack = e if side >= 0 else -e
+        self.progress = float(self.s[i]) + t * length
+        self.farthest = max(self.farthest, self.progress)
+        self.complete = 100.0 * self.progress / self.length if self.length > 0 else 100.0
+        self.crossTrackStats.record(self.crossTrack)
+        if heading is not None and length > 0:
+            h = heading - math.atan2(dy, dx)
+            self.headingError = (h + math.pi) % (2 * math.pi) - math.pi
+            self.headingStats.record(self.headingError)
+        return self.crossTrack
+
+    # describe - summary of the run so far
+    def describe(self):
+        c = self.crossTrackStats
+        if c.n == 0:
+            return 'Cross-track: no ticks scored'
+        text = 'Cross-track error rms %.2f m, p95 %.2f m, max %.2f m over %d ticks; %.0f%% of the route (%.1f of %.1f m)' % (
+            c.rms(), c.percentile(95), c.max, c.n, self.complete, self.progress, self.length)
+        h = self.headingStats
+        if h.n:
+            text += '\nHeading error rms %.1f deg, p95 %.1f deg, max %.1f deg' % (
+                math.degrees(h.rms()), math.degrees(h.percentile(95)), math.degrees(h.max))
+        return text
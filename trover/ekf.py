@@ -0,0 +1,151 @@
+# ekf - an extended Kalman filter for the pose of T-Rover between GPS fixes.
+#
+# The phone sends a fix 1 to 10 times a second, but its gyroscope streams
+# at 100 Hz or more (trover/rover.py reads it with imuport). PoseEkf keeps
+#
+#   x, y   UTM position (m)
+#   h      heading (radians counter-clockwise from East, like the compass)
+#   v      speed along the heading (m/s)
+#   b      gyroscope yaw rate bias (rad/s)
+#
+# predict() moves the state forward with the gyroscope yaw rate and the
+# current speed; there is no wheel encoder, so the speed is a random walk
+# that the fixes pull into place. Without a gyroscope the yaw rate is taken
+# as 0 and the heading only gets more uncertain. updatePosition() corrects
+# with a GPS fix and updateHeading() with the RMC course (or any other
+# heading measurement). The rover calls predict() every control tick, so
+# the controller steers on a pose that is at most one tick old.
+#
+# The state and covariance are small NumPy arrays; python3 -m trover.bench
+# measures what a predict plus update costs.
+import math
+
+import numpy as np
+
+# Process noise: how much the model can be wrong per second
+SPEED_NOISE = 1.0  # m/s^2, unmodelled acceleration
+GYRO_NOISE = 0.02  # rad/s, noise of a gyroscope yaw rate
+YAW_NOISE = 0.5  # rad/s, yaw rate nobody measured (no gyroscope)
+BIAS_NOISE = 0.001  # rad/s^2, drift of the gyroscope bias
+POSITION_NOISE = 0.05  # m/s, slip and model error
+
+# Starting uncertainty
+START_SPEED_SIGMA = 1.0  # m/s
+START_BIAS_SIGMA = 0.05  # rad/s
+START_HEADING_SIGMA = math.pi  # radians, without a heading to start from
+
+
+# wrapAngle - a in radians, wrapped into [-pi, pi)
+def wrapAngle(a):
+    return (a + math.pi) % (2 * math.pi) - math.pi
+
+
+# PoseEkf - the pose filter. gpsSigma is the 1 sigma error of a fix (m),
+# headingSigma that of updateHeading() (radians).
+class PoseEkf:
+    def __init__(self, gpsSigma=1.0, headingSigma=math.radians(10)):
+        self.gpsSigma = gpsSigma
+        self.headingSigma = headingSigma
+        self.s = np.zeros(5)
+        self.P = np.eye(5)
+        self.t = None  # time of the state
+        self.initialized = False
+        self.F = np.eye(5)
+        self.I = np.eye(5)
+        self.updates = 0
+
+    # start - initializes the filter at UTM (x, y) at time t; heading in
+    # radians, or None if it is not known yet
+    def start(self, x, y, t, heading=None):
+        self.s[:] = (x, y, 0.0 if heading is None else heading, 0.0, 0.0)
+        headingSigma = START_HEADING_SIGMA if heading is None else self.headingSigma
+        self.P[:] = np.diag((self.gpsSigma ** 2, self.gpsSigma ** 2, headingSigma ** 2,
+                             START_SPEED_SIGMA ** 2, START_BIAS_SIGMA ** 2))
+        self.t = t
+        self.initialized = True
+
+    # predict - moves the state forward to time t, turning at yawRate
+    # (rad/s, counter-clockwise, None without a gyroscope)
+    def predict(self, t, yawRate=None):
+        dt = t - self.t
+        if dt <= 0:
+            return
+        self.t = t
+        s = self.s
+        h = s[2]
+        v = s[3]
+        c = math.cos(h)
+        sn = math.sin(h)
+        F = self.F
+        F[0, 2] = -v * sn * dt
+        F[0, 3] = c * dt
+        F[1, 2] = v * c * dt
+        F[1, 3] = sn * dt
+        s[0] += v * c * dt
+        s[1] += v * sn * dt
+        if yawRate is None:
+            F[2, 4] = 0.0
+            yawNoise = YAW_NOISE
+        else:
+            F[2, 4] = -dt
+            s[2] = wrapAngle(h + (yawRate - s[4]) * dt)
+            yawNoise = GYRO_NOISE
+        q = self.P
+        q = F @ q @ F.T
+        q[0, 0] += POSITION_NOISE ** 2 * dt
+        q[1, 1] += POSITION_NOISE ** 2 * dt
+        q[2, 2] += yawNoise ** 2 * dt
+        q[3, 3] += SPEED_NOISE ** 2 * dt
+        q[4, 4] += BIAS_NOISE ** 2 * dt
+        self.P = q
+
+    # updatePosition - corrects with a fix at UTM (x, y). Returns the
+    # squared Mahalanobis distance of the fix from the prediction; a fix
+    # farther than gate (if given) is not used.
+    def updatePosition(self, x, y, sigma=None, gate=None):
+        if sigma is None:
+            sigma = self.gpsSigma
+        P = self.P
+        # inverse of the 2x2 innovation covariance, written out
+        a = P[0, 0] + sigma ** 2
+        b = P[0, 1]
+        d = P[1, 1] + sigma ** 2
+        det = a * d - b * b
+        Si = np.array(((d / det, -b / det), (-b / det, a / det)))
+        r = np.array((x - self.s[0], y - self.s[1]))
+        d2 = float(r @ Si @ r)
+        if gate is not None and d2 > gate:
+            return d2
+        K = P[:, :2] @ Si
+        self._correct(K @ r, K, P[:2, :])
+        self.updates += 1
+        return d2
+
+    # updateHeading - corrects with a heading measurement (radians)
+    def updateHeading(self, heading, sigma=None):
+        if sigma is None:
+            sigma = self.headingSigma
+        P = self.P
+        S = P[2, 2] + sigma ** 2
+        r = wrapAngle(heading - self.s[2])
+        K = P[:, 2:3] / S
+        self._correct(K[:, 0] * r, K, P[2:3, :])
+        return r * r / S
+
+    def _correct(self, ds, K, HP):
+        s = self.s
+        s += ds
+        s[2] = wrapAngle(s[2])
+        if s[3] < 0:
+            s[3] = 0.0  # the rover only drives forwards
+        P = self.P - K @ HP
+        self.P = (P + P.T) / 2
+
+    # pose - (x, y, heading) of the state
+    def pose(self):
+        s = self.s
+        return float(s[0]), float(s[1]), float(s[2])
+
+    # speed - estimated speed (m/s)
+    def speed(self):
+        return float(self.s[3])
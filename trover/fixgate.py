@@ -0,0 +1,101 @@
+# fixgate - keeps GPS fixes the rover cannot have made away from the
+# controller.
+#
+# A multipath jump of a few metres in one GGA position used to become the
+# pose, and pure pursuit swung the servo to full lock towards a goal point
+# the rover was never near; a GGA without a fix (quality 0) even sends
+# 0, 0. The bridge passes on the GGA fix quality, HDOP and satellite count
+# with every fix and FixGate checks each fix in three steps, each O(1):
+#
+#   quality     no fix (quality 0), HDOP above maxHdop or fewer than
+#               minSats satellites: rejected
+#   speed       farther from the last accepted fix than the rover can
+#               drive at maxSpeed in the time between them, plus
+#               SPEED_MARGIN sigmas of GPS noise: rejected. After
+#               resetTime seconds without an accepted fix the next one
+#               is taken whatever it says, so a bad first fix or a real
+#               jump (the rover carried off) cannot lock the gate.
+#   innovation  with the Kalman filter (trover/ekf.py), a fix more than
+#               INNOVATION_GATE (squared Mahalanobis distance) from the
+#               predicted position is not used; after
+#               MAX_INNOVATION_REJECTS in a row the filter takes the next
+#               one, in case it is the filter that is wrong.
+#
+# Accepted fixes are down-weighted by their HDOP: sigmaOf() is the
+# position error the filter corrects with. Rejections are counted in
+# `rejected` and, on the RPi, in the metrics.
+import math
+
+NOMINAL_HDOP = 1.0  # HDOP the gpssigma setting is for
+SPEED_MARGIN = 3.0  # sigmas of GPS noise allowed on top of maxSpeed
+INNOVATION_GATE = 13.8  # chi-square of 2 degrees of freedom, 99.9 %
+MAX_INNOVATION_REJECTS = 5
+
+
+# FixGate - the gate. maxSpeed is the fastest the rover can drive (m/s),
+# sigma the GPS error at NOMINAL_HDOP (m, 1 sigma).
+class FixGate:
+    def __init__(self, maxSpeed=4.0, sigma=1.0, maxHdop=5.0, minSats=4, resetTime=3.0):
+        self.maxSpeed = maxSpeed
+        self.sigma = sigma
+        self.maxHdop = maxHdop
+        self.minSats = minSats
+        self.resetTime = resetTime
+        self.last = None  # (t, x, y, sigma) of the last accepted fix
+        self.accepted = 0
+        self.rejected = {'quality': 0, 'speed': 0, 'innovation': 0}
+        self.innovationRejects = 0  # in a row
+
+    # sigmaOf - position error (m, 1 sigma) of a fix with this HDOP (None
+    # if unknown)
+    def sigmaOf(self, hdop):
+        if hdop is None:
+            return self.sigma
+        return self.sigma * max(1.0, hdop / NOMINAL_HDOP)
+
+    # check - a fix at UTM (x, y) measured at time t, with quality
+    # (fix quality, HDOP, satellites; any of them None if not sent) or
+    # None. Returns None if the fix is accepted, else why not: 'quality'
+    # or 'speed'.
+    def check(self, t, x, y, quality=None):
+        hdop = None
+        if quality is not None:
+            fixQuality, hdop, sats = quality
+            if (fixQuality == 0 or (hdop is not None and hdop > self.maxHdop)
+                    or (sats is not None and sats < self.minSats)):
+                self.rejected['quality'] += 1
+                return 'quality'
+        sigma = self.sigmaOf(hdop)
+        last = self.last
+        if last is not None and t - last[0] < self.resetTime:
+            reach = self.maxSpeed * max(0.0, t - last[0]) + SPEED_MARGIN * math.hypot(sigma, last[3])
+            if math.hypot(x - last[1], y - last[2]) > reach:
+                self.rejected['speed'] += 1
+                return 'speed'
+        self.last = (t, x, y, sigma)
+        self.accepted += 1
+        return None
+
+    # innovationGate - the squared Mahalanobis distance above which the
+    # filter should not use the next fix, or None to take it anyway
+    def innovationGate(self):
+        if self.innovationRejects >= MAX_INNOVATION_REJECTS:
+            return None
+        return INNOVATION_GATE
+
+    # observeInnovation - the filter's squared Mahalanobis distance d2 of
+    # a fix checked against gate (from innovationGate()). Returns whether
+    # the fix was used.
+    def observeInnovation(self, d2, gate):
+        if gate is not None and d2 > gate:
+            self.innovationRejects += 1
+            self.rejected['innovation'] += 1
+            return False
+        self.innovationRejects = 0
+        return True
+
+    # describe - one line summary of what the gate did
+    def describe(self):
+        r = self.rejected
+        return '%d fixes accepted; rejected %d on quality, %d on speed, %d by the filter' % (
+            self.accepted, r['quality'], r['speed'], r['innovation'])
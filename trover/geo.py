@@ -0,0 +1,144 @@
+# geo - GPS (spherical) to UTM (cartesian) coordinate conversion.
+import math
+
+
+# deg2utm - converts GPS lat, lon (spherical coordinates) to
+# utm (cartesian coordinates)
+# The output is the x and y position for a specific utmzone
+def deg2utm(Lat, Lon):
+    # Memory pre-allocation
+    x = []
+    y = []
+    utmzone = []
+    # Main Loop
+    #
+    la = Lat
+    lo = Lon
+    sa = 6378137.000000
+    sb = 6356752.314245
+
+    # e = ( ( ( sa ** 2 ) - ( sb ** 2 ) ) ** 0.5 ) / sa;
+    e2 = (((sa ** 2) - (sb ** 2)) ** 0.5) / sb
+    e2cuadrada = e2 ** 2
+    c = (sa ** 2) / sb
+    # alpha = ( sa - sb ) / sa;             #f
+    # ablandamiento = 1 / alpha;   # 1/f
+    lat = la * (math.pi / 180)
+    lon = lo * (math.pi / 180)
+    Huso = math.trunc((lo / 6) + 31)
+    S = ((Huso * 6) - 183)
+    deltaS = lon - (S * (math.pi / 180))
+    Letra = ''
+    if (la < -72):
+        Letra = 'C'
+    elif (la < -64):
+        Letra = 'D'
+    elif (la < -56):
+        Letra = 'E'
+    elif (la < -48):
+        Letra = 'F'
+    elif (la < -40):
+        Letra = 'G'
+    elif (la < -32):
+        Letra = 'H'
+    elif (la < -24):
+        Letra = 'J'
+    elif (la < -16):
+        Letra = 'K'
+    elif (la < -8):
+        Letra = 'L'
+    elif (la < 0):
+        Letra = 'M'
+    elif (la < 8):
+        Letra = 'N'
+    elif (la < 16):
+        Letra = 'P'
+    elif (la < 24):
+        Letra = 'Q'
+    elif (la < 32):
+        Letra = 'R'
+    elif (la < 40):
+        Letra = 'S'
+    elif (la < 48):
+        Letra = 'T'
+    elif (la < 56):
+        Letra = 'U'
+    elif (la < 64):
+        Letra = 'V'
+    elif (la < 72):
+        Letra = 'W'
+    else:
+        Letra = 'X'
+
+    a = math.cos(lat) * math.sin(deltaS)
+    epsilon = 0.5 * math.log((1 + a) / (1 - a))
+    nu = math.atan(math.tan(lat) / math.cos(deltaS)) - lat
+    v = (c / ((1 + (e2cuadrada * (math.cos(lat)) ** 2))) ** 0.5) * 0.9996
+    ta = (e2cuadrada / 2) * epsilon ** 2 * (math.cos(lat)) ** 2
+    a1 = math.sin(2 * lat)
+    a2 = a1 * (math.cos(lat)) ** 2
+    j2 = lat + (a1 / 2)
+    j4 = ((3 * j2) + a2) / 4
+    j6 = ((5 * j4) + (a2 * (math.cos(lat)) ** 2)) / 3
+    alfa = (3 / 4) * e2cuadrada
+    beta = (5 / 3) * alfa ** 2
+    gama = (35 / 27) * alfa ** 3
+    bm = 0.9996 * c * (lat - alfa * j2 + beta * j4 - gama * j6)
+    xx = epsilon * v * (1 + (ta / 3)) + 500000
+    yy = nu * v * (1 + ta) + bm
+    if yy < 0:
+        yy = 9999999 + yy
+    x = xx
+    y = yy
+    utmzone = "%02d %c" % (Huso, Letra)
+    return x, y, utmzone
+
+
+UTM_LETTERS = 'CDEFGHJKLMNPQRSTUVWX'  # latitude bands of 8 degrees from -80
+
+
+# utmZone - (zone number, "NN L" zone string) deg2utm gives lat, lon
+def utmZone(Lat, Lon):
+    Huso = math.trunc((Lon / 6) + 31)
+    band = min(max(int(math.floor((Lat + 80) / 8)), 0), len(UTM_LETTERS) - 1)
+    return Huso, "%02d %c" % (Huso, UTM_LETTERS[band])
+
+
+# deg2utmArrays - deg2utm for arrays of lat, lon, all projected in zone
+# Huso (by default the zone of the first point) so a route that crosses a
+# zone boundary stays one continuous plane. Returns x and y arrays.
+def deg2utmArrays(Lat, Lon, Huso=None):
+    import numpy as np
+    la = np.asarray(Lat, dtype=float)
+    lo = np.asarray(Lon, dtype=float)
+    if Huso is None:
+        Huso = utmZone(la[0], lo[0])[0]
+    sa = 6378137.000000
+    sb = 6356752.314245
+    e2 = (((sa ** 2) - (sb ** 2)) ** 0.5) / sb
+    e2cuadrada = e2 ** 2
+    c = (sa ** 2) / sb
+    lat = la * (math.pi / 180)
+    lon = lo * (math.pi / 180)
+    S = ((Huso * 6) - 183)
+    deltaS = lon - (S * (math.pi / 180))
+    coslat = np.cos(lat)
+    cos2 = coslat ** 2
+    a = coslat * np.sin(deltaS)
+    epsilon = 0.5 * np.log((1 + a) / (1 - a))
+    nu = np.arctan(np.tan(lat) / np.cos(deltaS)) - lat
+    v = (c / ((1 + (e2cuadrada * cos2))) ** 0.5) * 0.9996
+    ta = (e2cuadrada / 2) * epsilon ** 2 * cos2
+    a1 = np.sin(2 * lat)
+    a2 = a1 * cos2
+    j2 = lat + (a1 / 2)
+    j4 = ((3 * j2) + a2) / 4
+    j6 = ((5 * j4) + (a2 * cos2)) / 3
+    alfa = (3 / 4) * e2cuadrada
+    beta = (5 / 3) * alfa ** 2
+    gama = (35 / 27) * alfa ** 3
+    bm = 0.9996 * c * (lat - alfa * j2 + beta * j4 - gama * j6)
+    xx = epsilon * v * (1 + (ta / 3)) + 500000
+    yy = nu * v * (1 + ta) + bm
+    yy = np.where(yy < 0, 9999999 + yy, yy)
+    return xx, yy
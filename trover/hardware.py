@@ -0,0 +1,182 @@
+# hardware - servo and network interface backends for the Raspberry Pi.
+#
+# raspberrypi_trover.py talks to the steering servo only through an object
+# with an `angle` attribute (degrees, positive = left), exactly like
+# gpiozero's AngularServo. The backends here provide that interface:
+#
+#   gpio - the real AngularServo on a GPIO pin (needs gpiozero on a Pi)
+#   mock - records every commanded angle with a timestamp, no hardware
+#   sim  - steers a simulated rover (see trover/sim.py)
+#
+# The throttle (ESC) is driven the same way through an object with a
+# `value` attribute, the fraction of full forward throttle from 0 (stop)
+# to 1, with the same three backends.
+#
+# gpiozero and netifaces are imported only when they are actually needed
+# so the controller can start on a laptop or CI box.
+import time
+
+SERVO_BACKENDS = ('gpio', 'mock', 'sim')
+
+
+# GpioServo - the real steering servo on the T-Rover.
+class GpioServo:
+    def __init__(self, pin=26, min_angle=-45, max_angle=45):
+        from gpiozero import AngularServo
+        self._servo = AngularServo(pin, min_angle=min_angle, max_angle=max_angle)
+
+    @property
+    def angle(self):
+        return self._servo.angle
+
+    @angle.setter
+    def angle(self, value):
+        self._servo.angle = value
+
+    def close(self):
+        self._servo.close()
+
+
+# MockServo - remembers every angle written to it. history is a list of
+# (time.monotonic(), angle) pairs; keep=0 keeps all of them, otherwise only
+# the newest `keep` entries are kept.
+class MockServo:
+    def __init__(self, min_angle=-45, max_angle=45, keep=0):
+        self.min_angle = min_angle
+        self.max_angle = max_angle
+        self.keep = keep
+        self.history = []
+        self._angle = 0.0
+
+    @property
+    def angle(self):
+        return self._angle
+
+    @angle.setter
+    def angle(self, value):
+        # gpiozero refuses out of range angles, so the mock does too
+        if value is not None and not (self.min_angle <= value <= self.max_angle):
+            raise ValueError('servo angle %f out of range' % value)
+        self._angle = value
+        self.history.append((time.monotonic(), value))
+        if self.keep and len(self.history) > self.keep:
+            del self.history[0]
+
+    def close(self):
+        pass
+
+
+# SimServo - passes the commanded angle to a simulated rover as its
+# steering angle.
+class SimServo(MockServo):
+    def __init__(self, rover, min_angle=-45, max_angle=45, keep=1):
+        MockServo.__init__(self, min_angle, max_angle, keep)
+        self.rover = rover
+
+    @MockServo.angle.setter
+    def angle(self, value):
+        MockServo.angle.fset(self, value)
+        self.rover.setSteer(0.0 if value is None else value)
+
+
+# makeServo - creates the servo for the named backend. rover is the
+# simulated rover and is only used by the sim backend.
+def makeServo(backend='gpio', pin=26, rover=None):
+    if backend == 'gpio':
+        return GpioServo(pin, min_angle=-45, max_angle=45)
+    if backend == 'mock':
+        return MockServo(min_angle=-45, max_angle=45)
+    if backend == 'sim':
+        if rover is None:
+            raise ValueError('the sim servo backend needs a simulated rover')
+        return SimServo(rover, min_angle=-45, max_angle=45)
+    raise ValueError('unknown servo backend %r (expected one of %s)' % (backend, ', '.join(SERVO_BACKENDS)))
+
+
+# GpioThrottle - the ESC on a GPIO pin. Like the Arduino sketch of the
+# first T-Rover (Archive/main.py throttleControl), 1.5 ms pulses stop the
+# motor and 2 ms pulses are full throttle; gpiozero's Servo value 0..1 is
+# exactly that range.
+class GpioThrottle:
+    def __init__(self, pin=19, stop_pulse=1.5e-3, max_pulse=2.0e-3):
+        from gpiozero import Servo
+        width = max_pulse - stop_pulse
+        self._esc = Servo(pin, initial_value=0, min_pulse_width=stop_pulse - width, max_pulse_width=max_pulse)
+
+    @property
+    def value(self):
+        return self._esc.value
+
+    @value.setter
+    def value(self, value):
+        self._esc.value = min(max(value, 0.0), 1.0)
+
+    def close(self):
+        self._esc.value = 0
+        self._esc.close()
+
+
+# MockThrottle - remembers every throttle value written to it, like
+# MockServo.
+class MockThrottle:
+    def __init__(self, keep=0):
+        self.keep = keep
+        self.history = []
+        self._value = 0.0
+
+    @property
+    def value(self):
+        return self._value
+
+    @value.setter
+    def value(self, value):
+        if not (0.0 <= value <= 1.0):
+            raise ValueError('throttle %f out of range' % value)
+        self._value = value
+        self.history.append((time.monotonic(), value))
+        if self.keep and len(self.history) > self.keep:
+            del self.history[0]
+
+    def close(self):
+        pass
+
+
+# SimThrottle - sets the speed a simulated rover accelerates to; full
+# throttle is topSpeed m/s.
+class SimThrottle(MockThrottle):
+    def __init__(self, rover, topSpeed=4.0, keep=1):
+        MockThrottle.__init__(self, keep)
+        self.rover = rover
+        self.topSpeed = topSpeed
+
+    @MockThrottle.value.setter
+    def value(self, value):
+        MockThrottle.value.fset(self, value)
+        self.rover.targetSpeed = value * self.topSpeed
+
+
+# makeThrottle - creates the throttle for the named backend, see makeServo
+def makeThrottle(backend='gpio', pin=19, rover=None, topSpeed=4.0):
+    if backend == 'gpio':
+        return GpioThrottle(pin)
+    if backend == 'mock':
+        return MockThrottle()
+    if backend == 'sim':
+        if rover is None:
+            raise ValueError('the sim throttle backend needs a simulated rover')
+        return SimThrottle(rover, topSpeed)
+    raise ValueError('unknown throttle backend %r (expected one of %s)' % (backend, ', '.join(SERVO_BACKENDS)))
+
+
+# resolveBindAddress - turns a bind address setting into an IP address.
+# The setting may be an interface name ('wlan0', looked up with netifaces
+# like the original code did), an IP address, or 'any'/'' for all
+# interfaces.
+def resolveBindAddress(spec):
+    spec = (spec or '').strip()
+    if spec in ('', 'any', '*'):
+        return '0.0.0.0'
+    if spec[0].isdigit() or spec == 'localhost':
+        return spec
+    import netifaces as ni
+    return ni.ifaddresses(spec)[ni.AF_INET][0]['addr']
@@ -0,0 +1,139 @@
+# heading - one smooth heading from the GPS course, the magnetometer and
+# the gyroscope.
+#
+# Each source alone is poor: the RMC course is missing until the rover
+# moves and is noise at walking pace; the magnetometer is there from the
+# first tick but the motor, the battery and any tilt of the phone pull it
+# off; the gyroscope is smooth and fast but only knows how much the rover
+# turned, and drifts. HeadingFilter is a complementary filter over the
+# three:
+#
+#   every tick    heading += gyroscope yaw rate * dt, then pulled towards
+#                 the magnetometer heading with time constant magTau
+#                 (a much shorter one without a gyroscope)
+#   every fix     above courseSpeed, pulled towards the course by
+#                 courseGain; the magnetometer's offset from the course is
+#                 learnt at the same time (offsetGain), so motor and
+#                 mounting errors fade out while the rover drives
+#
+# The magnetometer heading is tilt compensated: "up" is the accelerometer,
+# low passed and only while it reads about 1 g (not while the rover
+# accelerates or turns hard), or the phone's up axis without one. Headings
+# are radians counter-clockwise from East like sensorDict["compass"]
+# (degrees); declination is degrees East of true North of magnetic North.
+import math
+
+GRAVITY = 9.81  # m/s^2
+UP_TOLERANCE = 1.0  # m/s^2 off GRAVITY the accelerometer is still taken as "up"
+UP_TAU = 2.0  # s, low pass of "up"
+MAG_TAU = 2.0  # s, pull of the magnetometer with a gyroscope
+MAG_TAU_NO_GYRO = 0.3  # s, and without one
+COURSE_GAIN = 0.3  # pull of a course above courseSpeed, per fix
+OFFSET_GAIN = 0.05  # per fix, learning the magnetometer offset from the course
+
+
+# wrapAngle - a in radians, wrapped into [-pi, pi)
+def wrapAngle(a):
+    return (a + math.pi) % (2 * math.pi) - math.pi
+
+
+def cross(a, b):
+    return (a[1] * b[2] - a[2] * b[1], a[2] * b[0] - a[0] * b[2], a[0] * b[1] - a[1] * b[0])
+
+
+def unit(a):
+    n = math.sqrt(a[0] * a[0] + a[1] * a[1] + a[2] * a[2])
+    return (a[0] / n, a[1] / n, a[2] / n) if n > 0 else None
+
+
+# magneticHeading - heading (radians counter-clockwise from East, true) of
+# the phone axis `forward` (index, sign) from a magnetometer vector mag,
+# with up the vector pointing up in phone coordinates
+def magneticHeading(mag, up, forward, declination=0.0):
+    east = unit(cross(mag, up))
+    if east is None:
+        return None
+    north = cross(up, east)
+    i, sign = forward
+    return wrapAngle(math.atan2(sign * north[i], sign * east[i]) - math.radians(declination))
+
+
+# HeadingFilter - the filter. upAxis and forwardAxis are (index, sign) of
+# the phone axes pointing up and to the front of the rover.
+class HeadingFilter:
+    def __init__(self, upAxis=(0, 1.0), forwardAxis=(2, -1.0), declination=0.0, courseSpeed=0.5,
+                 magTau=MAG_TAU, courseGain=COURSE_GAIN):
+        self.forwardAxis = forwardAxis
+        up = [0.0, 0.0, 0.0]
+        up[upAxis[0]] = upAxis[1]
+        self.up = tuple(up)
+        self.declination = declination
+        self.courseSpeed = courseSpeed
+        self.magTau = magTau
+        self.courseGain = courseGain
+        self.heading = None
+        self.t = None
+        self.magOffset = 0.0  # learnt course - magnetometer heading (radians)
+        self.lastMag = None  # last magnetometer heading, before the offset
+        self.lastFix = None  # the last fix observeFix() saw, set by the caller
+        self.fixT = None
+        self.fixXY = None
+        self.speed = 0.0  # m/s at the last fix
+
+    # observeUp - feeds an accelerometer sample (m/s^2) taken dt seconds
+    # after the last one
+    def observeUp(self, accel, dt):
+        n = math.sqrt(accel[0] ** 2 + accel[1] ** 2 + accel[2] ** 2)
+        if abs(n - GRAVITY) > UP_TOLERANCE:
+            return
+        k = dt / (UP_TAU + dt)
+        up = self.up
+        self.up = unit((up[0] + k * (accel[0] / n - up[0]),
+                        up[1] + k * (accel[1] / n - up[1]),
+                        up[2] + k * (accel[2] / n - up[2])))
+
+    # magHeading - the tilt compensated heading of a magnetometer sample
+    # (microtesla), without the learnt offset
+    def magHeading(self, mag):
+        return magneticHeading(mag, self.up, self.forwardAxis, self.declination)
+
+    # observeFix - a fix at UTM (x, y) measured at time t with the GPS
+    # course (radians, None if there is none). The speed (m/s) is that
+    # between the last two fixes unless given.
+    def observeFix(self, t, x, y, course, speed=None):
+        if speed is not None:
+            self.speed = speed
+        elif self.fixT is not None and t > self.fixT:
+            self.speed = math.hypot(x - self.fixXY[0], y - self.fixXY[1]) / (t - self.fixT)
+        self.fixT = t
+        self.fixXY = (x, y)
+        if course is None or self.speed < self.courseSpeed:
+            return
+        if self.heading is None:
+            self.heading = course
+            return
+        self.heading = wrapAngle(self.heading + self.courseGain * wrapAngle(course - self.heading))
+        if self.lastMag is not None:
+            self.magOffset = wrapAngle(self.magOffset + OFFSET_GAIN * wrapAngle(course - self.lastMag - self.magOffset))
+
+    # update - the heading at time t, after turning at yawRate (rad/s,
+    # None without a gyroscope) and with the magnetometer heading mag
+    # (radians from magHeading(), or None). Returns None until there is a
+    # magnetometer heading or a course to start from.
+    def update(self, t, yawRate=None, mag=None):
+        dt = 0.0 if self.t is None else max(0.0, t - self.t)
+        self.t = t
+        if mag is not None:
+            self.lastMag = mag
+            mag = mag + self.magOffset
+        if self.heading is None:
+            self.heading = mag
+            return mag
+        h = self.heading
+        if yawRate is not None:
+            h += yawRate * dt
+        if mag is not None:
+            tau = self.magTau if yawRate is not None else MAG_TAU_NO_GYRO
+            h += dt / (tau + dt) * wrapAngle(mag - h)
+        self.heading = wrapAngle(h)
+        return self.heading
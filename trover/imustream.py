@@ -0,0 +1,217 @@
+# imustream - takes in the phone's IMU sensor stream at its full rate.
+#
+# The sensor stream app sends a datagram per sensor event, "time, id, a,
+# b, c, id, a, b, c, ...", 100 to 200 times a second per sensor. Archive's
+# udpListener2 read one datagram per 100 ms and so dropped most of them;
+# decoding every datagram on its own with split(',') and float() is the
+# next bottleneck on a Pi. ImuStream instead
+#
+#   drain()    on every wakeup, reads all the datagrams waiting on the
+#              socket (non-blocking after the first one)
+#   ingest()   decodes the whole batch at once: the datagrams are joined
+#              and parsed by one np.fromstring, and the records of each
+#              sensor are cut out of the numbers with a reshape (when
+#              every datagram has the same sensors) or index arithmetic
+#   rings      keeps every sample of every sensor, with the phone's
+#              timestamp, in a preallocated NumPy ring buffer per sensor
+#
+# and sets sensorDict["accel"], ["gyro"], ["mag"] and ["yawrate"] (the
+# yaw rate about the phone's yawAxis) to the newest samples. Between
+# wakeups the listener naps for LISTEN_INTERVAL, so that at 1000
+# datagrams a second each wakeup has a batch to decode; the socket buffer
+# (RECEIVE_BUFFER) holds seconds of the stream should the Pi fall behind. The estimators read windows
+# of the rings: yawRate() is the mean gyroscope yaw rate over the last
+# control period, so the heading turns by what the gyroscope measured
+# between two ticks rather than by the one sample that happened to be
+# newest. Windows are measured in the phone's time, back from the newest
+# sample.
+#
+# The listener thread is the only writer; it writes a batch before it
+# moves the ring's count, and a ring of `size` samples holds seconds of
+# data, so a reader copying a window of a control period never sees it
+# overwritten. python3 -m trover.bench measures 'imu ingest' per datagram.
+import socket
+
+import numpy as np
+
+SENSOR_IDS = {1: "gpsimu", 3: "accel", 4: "gyro", 5: "mag"}  # ids 2 and 6 are skipped
+RECEIVE_BUFFER = 1 << 20  # bytes of socket buffer, for the bursts while the Pi is busy
+MAX_BATCH = 512  # datagrams per wakeup
+LISTEN_INTERVAL = 0.01  # s, nap of the listener between wakeups
+
+
+# SensorRing - the last `size` samples (t, x, y, z) of one sensor
+class SensorRing:
+    def __init__(self, size):
+        self.size = size
+        self.t = np.zeros(size)
+        self.v = np.zeros((size, 3))
+        self.n = 0  # samples written
+
+    # extend - appends samples at times t (n,) with values v (n, 3)
+    def extend(self, t, v):
+        k = len(t)
+        if k == 0:
+            return
+        if k > self.size:
+            t = t[-self.size:]
+            v = v[-self.size:]
+            k = self.size
+        i = self.n % self.size
+        if i + k <= self.size:
+            self.t[i:i + k] = t
+            self.v[i:i + k] = v
+        else:
+            j = self.size - i
+            self.t[i:] = t[:j]
+            self.v[i:] = v[:j]
+            self.t[:k - j] = t[j:]
+            self.v[:k - j] = v[j:]
+        self.n += k
+
+    # latest - (t, [x, y, z]) of the newest sample, or None
+    def latest(self):
+        if self.n == 0:
+            return None
+        i = (self.n - 1) % self.size
+        return float(self.t[i]), self.v[i].tolist()
+
+    # window - (t, v) copies of the samples of the last `seconds`, oldest
+    # first
+    def window(self, seconds):
+        n = self.n
+        m = min(n, self.size)
+        if m == 0:
+            return self.t[:0].copy(), self.v[:0].copy()
+        i = (n - m + np.arange(m)) % self.size
+        t = self.t[i]
+        sel = t >= t[-1] - seconds
+        return t[sel], self.v[i[sel]]
+
+
+# decodeBatch - the records of a list of datagrams as (id, t, v) groups,
+# the times (n,) and values (n, 3) of the records of one sensor id, and
+# how many datagrams could not be decoded
+def decodeBatch(messages):
+    counts = [m.count(b',') + 1 for m in messages]
+    try:
+        values = np.fromstring(b','.join(messages).decode('utf-8'), dtype=float, sep=',')
+        if len(values) != sum(counts):
+            raise ValueError
+    except ValueError:
+        # a bad datagram in the batch: parse them one at a time and drop it
+        parts = []
+        good = []
+        for m, c in zip(messages, counts):
+            try:
+                v = np.fromstring(m.decode('utf-8'), dtype=float, sep=',')
+            except ValueError:
+                continue
+            if len(v) == c:
+                parts.append(v)
+                good.append(c)
+        bad = len(messages) - len(good)
+        if not good:
+            return [], bad
+        values = np.concatenate(parts)
+        counts = good
+    else:
+        bad = 0
+    c = counts[0]
+    if counts.count(c) == len(counts) and (c - 1) % 4 == 0:
+        # the usual case, every datagram has the same sensors in the same
+        # order: each column of records is one sensor
+        rows = values.reshape(len(counts), c)
+        records = rows[:, 1:].reshape(len(counts), -1, 4)
+        ids = records[:, :, 0]
+        if (ids == ids[0]).all():
+            t = rows[:, 0]
+            return [(int(i), t, records[:, j, 1:]) for j, i in enumerate(ids[0])], bad
+    counts = np.array(counts)
+    starts = np.cumsum(counts) - counts
+    records = (counts - 1) // 4
+    msg = np.repeat(np.arange(len(counts)), records)
+    first = np.cumsum(records) - records
+    rec = starts[msg] + 1 + 4 * (np.arange(len(msg)) - first[msg])
+    # grouped by id, in order of arrival within each id
+    order = np.argsort(values[rec], kind='stable')
+    rec = rec[order]
+    ids = values[rec].astype(int)
+    t = values[starts[msg[order]]]
+    xyz = values[rec[:, None] + np.arange(1, 4)]
+    edges = np.flatnonzero(np.diff(ids)) + 1
+    bounds = np.r_[0, edges, len(ids)]
+    return [(int(ids[a]), t[a:b], xyz[a:b]) for a, b in zip(bounds[:-1], bounds[1:])], bad
+
+
+# drain - the datagrams waiting on sock, waiting for the first one. sock
+# must be blocking (no timeout).
+def drain(sock, bufferSize=1024, maxBatch=MAX_BATCH):
+    messages = [sock.recv(bufferSize)]
+    try:
+        while len(messages) < maxBatch:
+            messages.append(sock.recv(bufferSize, socket.MSG_DONTWAIT))
+    except BlockingIOError:
+        pass
+    return messages
+
+
+# ImuStream - the ring buffers. yawAxis is (index, sign) of the phone axis
+# pointing up; magCalibration a magcal.MagCalibration or None.
+class ImuStream:
+    def __init__(self, size=2048, yawAxis=(0, 1.0), magCalibration=None):
+        self.rings = dict((name, SensorRing(size)) for name in SENSOR_IDS.values())
+        self.yawAxis = yawAxis
+        self.magCalibration = magCalibration
+        self.datagrams = 0
+        self.bad = 0
+        self.batches = 0
+
+    # ingest - decodes a batch of datagrams into the rings and the newest
+    # samples into sensorDict (if given). Returns how many were bad.
+    def ingest(self, messages, sensorDict=None):
+        groups, bad = decodeBatch(messages)
+        self.datagrams += len(messages)
+        self.bad += bad
+        self.batches += 1
+        for sensorId, t, v in groups:
+            name = SENSOR_IDS.get(sensorId)
+            if name is None:
+                continue
+            if name == "mag" and self.magCalibration is not None:
+                v = self.magCalibration.correctArray(v)
+            self.rings[name].extend(t, v)
+            if sensorDict is not None:
+                sensorDict[name] = v[-1].tolist()
+                if name == "gyro":
+                    sensorDict["yawrate"] = self.yawAxis[1] * sensorDict[name][self.yawAxis[0]]
+        return bad
+
+    # window - (t, v) of a sensor's samples over the last `seconds`
+    def window(self, name, seconds):
+        return self.rings[name].window(seconds)
+
+    # mean - mean [x, y, z] of a sensor over the last `seconds`, None
+    # without samples
+    def mean(self, name, seconds):
+        t, v = self.rings[name].window(seconds)
+        if len(t) == 0:
+            return None
+        return v.mean(axis=0).tolist()
+
+    # yawRate - mean gyroscope yaw rate (rad/s) over the last `seconds`,
+    # None without a gyroscope
+    def yawRate(self, seconds):
+        t, v = self.rings["gyro"].window(seconds)
+        if len(t) == 0:
+            return None
+        return self.yawAxis[1] * float(v[:, self.yawAxis[0]].mean())
+
+
+# openImuSocket - the UDP socket of the stream, with a receive buffer big
+# enough to ride out the Pi being busy
+def openImuSocket(localIP, port):
+    sock = socket.socket(family=socket.AF_INET, type=socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RECEIVE_BUFFER)
+    sock.bind((localIP, port))
+    return sock
@@ -0,0 +1,366 @@
+#!/usr/bin/env python3
+# ingest - reads routes from the file formats GPS tools produce.
+#
+#   csv   "lat,lon" or "lon,lat" per line, more columns are ignored. The
+#         axis order comes from a header line (lat/latitude, lon/lng/
+#         longitude) if there is one, otherwise from the coordinate
+#         ranges: a column with a value outside -80..84 cannot be a
+#         latitude T-Rover can drive (UTM stops there) and a column outside
+#         -180..180 is no coordinate at all. stemcamptrack.txt (lon,lat)
+#         and ccsvtrack.txt (lat,lon) are told apart this way.
+#   gpx   <trkpt>s of the tracks, or else <rtept>s, or else <wpt>s
+#   kml   the lon,lat[,alt] tuples of every <coordinates> element
+#   nmea  GGA fixes with a valid quality (RMC fixes if the log has no GGA);
+#         sentences with a bad checksum are skipped
+#
+# The format comes from the file name extension, or from the first bytes
+# of the file. Files are read in chunks cut at a line (or tag) boundary and
+# every chunk is parsed with NumPy, so a multi-megabyte log loads in a
+# fraction of a second. readTrack() returns lat and lon arrays,
+# loadRoute() the [[lat, lon], ...] list route.projectWaypoints() takes and
+# iterTrack() the chunks one at a time.
+#
+# Usage (from the repository root), to check what a file turns into:
+#   python3 -m trover.ingest stemcamptrack.txt
+#   python3 -m trover.ingest field_day.gpx -o field_day.txt
+import argparse
+import io
+import re
+import sys
+import time
+
+import numpy as np
+
+FORMATS = ('csv', 'gpx', 'kml', 'nmea')
+EXTENSIONS = {'.csv': 'csv', '.txt': 'csv', '.gpx': 'gpx', '.kml': 'kml', '.nmea': 'nmea', '.nma': 'nmea', '.log': 'nmea'}
+AXIS_ORDERS = ('auto', 'latlon', 'lonlat')
+UTM_LAT_RANGE = (-80.0, 84.0)  # latitudes UTM (and so deg2utm) covers
+CHUNK_SIZE = 4 << 20  # bytes
+
+LAT_NAMES = ('lat', 'latitude')
+LON_NAMES = ('lon', 'lng', 'long', 'longitude')
+
+
+# readChunks - yields the file as text chunks of about `size` bytes, each
+# cut after the last occurrence of one of the `cuts` bytes so no line (or
+# tag) is split between two chunks. Bytes that are not valid in encoding
+# become U+FFFD.
+def readChunks(fname, size=CHUNK_SIZE, cuts=b'\n', encoding='utf-8'):
+    f = open(fname, 'rb')
+    rest = b''
+    while True:
+        data = f.read(size)
+        if not data:
+            break
+        data = rest + data
+        cut = max(data.rfind(c) for c in [cuts[k:k + 1] for k in range(len(cuts))])
+        if cut < 0:
+            rest = data
+            continue
+        rest = data[cut + 1:]
+        yield data[:cut + 1].decode(encoding, errors='replace')
+    f.close()
+    if rest:
+        yield rest.decode(encoding, errors='replace')
+
+
+# sniffFormat - the format of fname from its extension or first bytes
+def sniffFormat(fname):
+    dot = fname.rfind('.')
+    ext = fname[dot:].lower() if dot >= 0 else ''
+    f = open(fname, 'rb')
+    head = f.read(4096).decode('utf-8', errors='replace')
+    f.close()
+    low = head.lower()
+    if '<gpx' in low:
+        return 'gpx'
+    if '<kml' in low:
+        return 'kml'
+    if re.search(r'\$[A-Z]{2}(GGA|RMC|GLL|GSA|GSV|VTG),', head):
+        return 'nmea'
+    return EXTENSIONS.get(ext, 'csv')
+
+
+######################
+# CSV
+######################
+
+# csvHeader - (names, data starts at this line) of a CSV chunk: the first
+# line that is not a comment is a header if it does not start with a number
+def csvHeader(text):
+    for n, line in enumerate(io.StringIO(text)):
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        try:
+            float(line.split(',')[0])
+            return None, 0
+        except ValueError:
+            return [v.strip().lower() for v in line.split(',')], n + 1
+    return None, 0
+
+
+# pickAxisOrder - 'latlon' or 'lonlat' for two coordinate columns a and b
+# (see the top of this file); raises ValueError if neither fits
+def pickAxisOrder(a, b, header=None, fname='route'):
+    def isLat(c):
+        return len(c) == 0 or (c.min() >= UTM_LAT_RANGE[0] and c.max() <= UTM_LAT_RANGE[1])
+
+    def isLon(c):
+        return len(c) == 0 or (c.min() >= -180.0 and c.max() <= 180.0)
+
+    latlon = isLat(a) and isLon(b)
+    lonlat = isLon(a) and isLat(b)
+    if header is not None and len(header) >= 2:
+        if header[0] in LAT_NAMES and header[1] in LON_NAMES and latlon:
+            return 'latlon'
+        if header[0] in LON_NAMES and header[1] in LAT_NAMES and lonlat:
+            return 'lonlat'
+    if latlon and not lonlat:
+        return 'latlon'
+    if lonlat and not latlon:
+        return 'lonlat'
+    if not latlon and not lonlat:
+        raise ValueError('%s: the first two columns are not latitude/longitude degrees '
+                         '(latitude must be within %g..%g)' % (fname, UTM_LAT_RANGE[0], UTM_LAT_RANGE[1]))
+    print('%s: axis order is ambiguous, reading it as lat,lon (set axisorder to be sure)' % fname)
+    return 'latlon'
+
+
+# iterCsv - yields (lat, lon) arrays chunk by chunk. With axisOrder
+# 'auto' the order is picked from the header and the first chunk.
+def iterCsv(fname, axisOrder='auto', size=CHUNK_SIZE):
+    header = None
+    first = True
+    for chunk in readChunks(fname, size):
+        skip = 0
+        if first:
+            header, skip = csvHeader(chunk)
+        try:
+            a = np.loadtxt(io.StringIO(chunk), delimiter=',', usecols=(0, 1), comments='#', skiprows=skip, ndmin=2)
+        except ValueError as e:
+            raise ValueError('%s: %s' % (fname, e))
+        if first and axisOrder == 'auto':
+            axisOrder = pickAxisOrder(a[:, 0], a[:, 1], header, fname)
+        first = False
+        if len(a) == 0:
+            continue
+        if axisOrder == 'lonlat':
+            yield a[:, 1], a[:, 0]
+        else:
+            yield a[:, 0], a[:, 1]
+
+
+######################
+# GPX and KML
+######################
+
+GPX_TAGS = ('trkpt', 'rtept', 'wpt')  # in order of preference
+# applied to the attributes of point tags only, which have no other
+# attribute ending in lat or lon
+GPX_LAT = re.compile(r'lat\s*=\s*["\']([^"\']*)')
+GPX_LON = re.compile(r'lon\s*=\s*["\']([^"\']*)')
+
+
+# iterGpx - yields (lat, lon) arrays of the <tag> points chunk by chunk
+def iterGpx(fname, tag, size=CHUNK_SIZE):
+    point = re.compile(r'<%s\s([^>]*)>' % tag)
+    for chunk in readChunks(fname, size, cuts=b'>'):
+        attrs = point.findall(chunk)
+        if not attrs:
+            continue
+        # every point has exactly one lat and one lon attribute, in any order
+        attrs = '\n'.join(attrs)
+        lat = np.array(GPX_LAT.findall(attrs), dtype=float)
+        lon = np.array(GPX_LON.findall(attrs), dtype=float)
+        if len(lat) != len(lon):
+            raise ValueError('%s: a GPX point without lat and lon' % fname)
+        yield lat, lon
+
+
+# kmlTuples - (lon, lat) arrays of the whitespace separated lon,lat[,alt]
+# tuples in text
+def kmlTuples(text):
+    tokens = text.split()
+    if not tokens:
+        return np.zeros(0), np.zeros(0)
+    dims = tokens[0].count(',') + 1
+    values = np.array(','.join(tokens).split(','), dtype=float)
+    if len(values) != dims * len(tokens):
+        raise ValueError('KML coordinates mix tuples of different sizes')
+    values = values.reshape(-1, dims)
+    return values[:, 0], values[:, 1]
+
+
+# iterKml - yields (lat, lon) arrays of the <coordinates> chunk by chunk
+def iterKml(fname, size=CHUNK_SIZE):
+    inside = False
+    # cut at whitespace or '>' so neither a tuple nor a tag is split
+    for chunk in readChunks(fname, size, cuts=b' \n\t>'):
+        pos = 0
+        while True:
+            if not inside:
+                k = chunk.find('<coordinates', pos)
+                if k < 0:
+                    break
+                pos = chunk.find('>', k) + 1
+                inside = True
+            end = chunk.find('</coordinates>', pos)
+            lon, lat = kmlTuples(chunk[pos:end if end >= 0 else len(chunk)])
+            if len(lat):
+                yield lat, lon
+            if end < 0:
+                break
+            inside = False
+            pos = end
+
+
+######################
+# NMEA
+######################
+
+NMEA_GGA = re.compile(r'\$([A-Z]{2}GGA,[^,]*,([0-9.]*),([NS]?),([0-9.]*),([EW]?),([0-9]*),[^*\r\n$]*)\*([0-9A-Fa-f]{2})')
+NMEA_RMC = re.compile(r'\$([A-Z]{2}RMC,[^,]*,([AV]?),([0-9.]*),([NS]?),([0-9.]*),([EW]?),[^*\r\n$]*)\*([0-9A-Fa-f]{2})')
+
+
+# nmeaChecksumsOk - boolean array: does the XOR of every body match its
+# hex checksum. All bodies are XORed in one reduceat over their bytes.
+def nmeaChecksumsOk(bodies, checksums):
+    data = np.frombuffer(''.join(bodies).encode('latin-1'), dtype=np.uint8)
+    lengths = np.fromiter(map(len, bodies), dtype=np.intp, count=len(bodies))
+    starts = np.r_[0, np.cumsum(lengths)[:-1]]
+    xor = np.bitwise_xor.reduceat(data, starts)
+    want = np.frombuffer(bytes.fromhex(''.join(checksums)), dtype=np.uint8)
+    return xor == want
+
+
+# letters - one character strings as a uint8 array ('' becomes 0)
+def letters(values):
+    return np.frombuffer(''.join(v or '\0' for v in values).encode('latin-1'), dtype=np.uint8)
+
+
+# nmeaDegrees - ddmm.mmmm strings and hemisphere letters to signed
+# degrees; empty values must have been filtered out
+def nmeaDegrees(values, hemispheres, negative):
+    v = np.array(values, dtype=float)
+    deg = np.floor(v / 100.0)
+    d = deg + (v - deg * 100.0) / 60.0
+    return np.where(letters(hemispheres) == ord(negative), -d, d)
+
+
+# nmeaFixes - (lat, lon) of regex matches laid out as (body, lat, N/S,
+# lon, E/W, status, checksum) that pass the checksum, have both
+# coordinates and a status that valid() accepts
+def nmeaFixes(m, valid):
+    body, lat, ns, lon, ew, status, checksum = zip(*m)
+    ok = nmeaChecksumsOk(body, checksum) & valid(status)
+    ok &= (letters(ns) != 0) & (letters(ew) != 0)
+    keep = np.flatnonzero(ok)
+    pick = lambda c: [c[k] for k in keep]
+    return (nmeaDegrees(pick(lat), pick(ns), 'S'),
+            nmeaDegrees(pick(lon), pick(ew), 'W'))
+
+
+# iterNmea - yields (lat, lon) arrays of the valid GGA or RMC fixes
+# (sentence) chunk by chunk. The log is read as latin-1, one character
+# per byte, so a corrupt byte stays the byte it was and only fails the
+# checksum of its own sentence.
+def iterNmea(fname, sentence, size=CHUNK_SIZE):
+    for chunk in readChunks(fname, size, encoding='latin-1'):
+        if sentence == 'GGA':
+            m = NMEA_GGA.findall(chunk)
+            if m:
+                # GGA: lat, N/S, lon, E/W, then the fix quality (0 = no fix)
+                yield nmeaFixes(m, lambda quality: letters([q[:1] for q in quality]) > ord('0'))
+        else:
+            m = NMEA_RMC.findall(chunk)
+            if m:
+                # RMC: status (A = valid), then lat, N/S, lon, E/W
+                yield nmeaFixes([(r[0], r[2], r[3], r[4], r[5], r[1], r[6]) for r in m],
+                                lambda status: letters(status) == ord('A'))
+
+
+######################
+# Entry points
+######################
+
+# firstOf - yields the chunks of the first of the generators that has any
+def firstOf(generators):
+    for gen in generators:
+        found = False
+        for part in gen:
+            found = True
+            yield part
+        if found:
+            return
+
+
+# iterTrack - yields the route in fname as (lat, lon) arrays of one chunk
+# of about `size` bytes of the file each, so a route of any length can be
+# processed in constant memory (see trover/pipeline.py). fmt is one of
+# FORMATS (None = detect); axisOrder ('auto', 'latlon' or 'lonlat')
+# applies to CSV only, the other formats say which value is which. A GPX
+# file without track points or an NMEA log without GGA is read a second
+# (and third) time for the fallback points.
+def iterTrack(fname, fmt=None, axisOrder='auto', size=CHUNK_SIZE):
+    if fmt is None:
+        fmt = sniffFormat(fname)
+    if fmt == 'csv':
+        chunks = iterCsv(fname, axisOrder, size)
+    elif fmt == 'gpx':
+        chunks = firstOf(iterGpx(fname, tag, size) for tag in GPX_TAGS)
+    elif fmt == 'kml':
+        chunks = iterKml(fname, size)
+    elif fmt == 'nmea':
+        chunks = firstOf(iterNmea(fname, sentence, size) for sentence in ('GGA', 'RMC'))
+    else:
+        raise ValueError('unknown route format "%s" (one of %s)' % (fmt, ', '.join(FORMATS)))
+    for lat, lon in chunks:
+        if len(lat) == 0:
+            continue
+        if lat.min() < UTM_LAT_RANGE[0] or lat.max() > UTM_LAT_RANGE[1] or np.abs(lon).max() > 180:
+            raise ValueError('%s: coordinates out of range for a T-Rover route' % fname)
+        yield lat, lon
+
+
+# readTrack - (lat, lon) arrays of the whole route in fname, see iterTrack
+def readTrack(fname, fmt=None, axisOrder='auto'):
+    parts = list(iterTrack(fname, fmt, axisOrder))
+    n = sum(len(p[0]) for p in parts)
+    if n < 2:
+        raise ValueError('%s: found %d route points, need at least 2' % (fname, n))
+    return np.concatenate([p[0] for p in parts]), np.concatenate([p[1] for p in parts])
+
+
+# loadRoute - readTrack as a [[lat, lon], ...] list, the waypoints of
+# trover/route.py
+def loadRoute(fname, fmt=None, axisOrder='auto'):
+    lat, lon = readTrack(fname, fmt, axisOrder)
+    return np.c_[lat, lon].tolist()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Read a route file and report what it contains.')
+    parser.add_argument('route')
+    parser.add_argument('--format', choices=FORMATS, help='default: detect')
+    parser.add_argument('--axis-order', choices=AXIS_ORDERS, default='auto', help='for CSV files')
+    parser.add_argument('-o', '--output', help='write the route as "lat,lon" lines here')
+    args = parser.parse_args(argv)
+
+    fmt = args.format or sniffFormat(args.route)
+    t0 = time.perf_counter()
+    lat, lon = readTrack(args.route, fmt, args.axis_order)
+    dt = time.perf_counter() - t0
+    print('%s: %s, %d points in %.1f ms' % (args.route, fmt, len(lat), dt * 1e3))
+    print('first %.7f,%.7f  last %.7f,%.7f' % (lat[0], lon[0], lat[-1], lon[-1]))
+    if args.output:
+        f = open(args.output, 'w')
+        for k in range(len(lat)):
+            f.write('%.10f,%.10f\n' % (lat[k], lon[k]))
+        f.close()
+        print('Written to %s' % args.output)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,97 @@
+# latency - moves the pose forward to the moment the servo acts on it.
+#
+# The pose the controller steers on is older than the steering command:
+#
+#   upstream  fix measured -> Pi receive (receiver, USB, bridge, Wi-Fi)
+#   fix age   Pi receive -> this tick (the listener and the loop period)
+#   control   tick start -> servo write (goal search, pure pursuit)
+#   servo     servo write -> the wheels turn
+#
+# At 2 m/s a quarter of a second is half a metre, and the rover steers for
+# where it was. LatencyCompensator keeps an estimate of every delay and
+# predicts the pose over their sum with a constant speed and turn rate
+# model before the goal search. The fix age is exact for every fix (its
+# Pi receive time); the upstream delay starts at the gpsdelay setting and
+# follows the measured delay of traced fixes (trace = 1, see
+# trover/trace.py); the control delay follows the measured time from tick
+# start to servo write. Both are exponentially weighted averages. Only the
+# servo delay is a fixed setting, nothing measures it.
+#
+# Speed and turn rate come from the recent fixes (their position and
+# heading history over `window` seconds) or, with the Kalman filter, from
+# its state.
+import math
+from collections import deque
+
+
+# advancePose - (x, y, heading) after `seconds` at speed v (m/s) turning
+# at yawRate (rad/s, counter-clockwise)
+def advancePose(x, y, heading, v, yawRate, seconds):
+    turn = yawRate * seconds
+    if abs(turn) < 1e-6:
+        return (x + v * math.cos(heading) * seconds,
+                y + v * math.sin(heading) * seconds, heading)
+    r = v / yawRate
+    return (x + r * (math.sin(heading + turn) - math.sin(heading)),
+            y - r * (math.cos(heading + turn) - math.cos(heading)), heading + turn)
+
+
+# LatencyCompensator - the delay estimates and fix history. Delays are in
+# seconds; weight is the weight of a new sample in the averages.
+class LatencyCompensator:
+    def __init__(self, upstreamDelay=0.0, servoDelay=0.05, window=0.3, history=32, weight=0.1):
+        self.upstreamDelay = upstreamDelay
+        self.controlDelay = 0.0
+        self.servoDelay = servoDelay
+        self.window = window
+        self.weight = weight
+        self.fixes = deque(maxlen=history)  # (t, x, y, heading) of recent fixes
+        self.upstreamSamples = 0
+        self.horizon = 0.0  # how far the last pose was predicted (s)
+
+    # observeUpstream - a measured fix -> Pi receive delay
+    def observeUpstream(self, seconds):
+        if self.upstreamSamples == 0:
+            self.upstreamDelay = seconds
+        else:
+            self.upstreamDelay += self.weight * (seconds - self.upstreamDelay)
+        self.upstreamSamples += 1
+
+    # observeControl - a measured tick start -> servo write time
+    def observeControl(self, seconds):
+        self.controlDelay += self.weight * (seconds - self.controlDelay)
+
+    # fixTime - when a fix received at tRecv was measured
+    def fixTime(self, tRecv):
+        return tRecv - self.upstreamDelay
+
+    # addFix - records a fix measured at t at UTM (x, y) with heading
+    # (radians)
+    def addFix(self, t, x, y, heading):
+        self.fixes.append((t, x, y, heading))
+
+    # motion - (speed, yaw rate) over the fixes of the last `window`
+    # seconds (at least the last two fixes), (0, 0) until there are two
+    def motion(self):
+        if len(self.fixes) < 2:
+            return 0.0, 0.0
+        t1, x1, y1, h1 = self.fixes[-1]
+        for t0, x0, y0, h0 in self.fixes:
+            if t1 - t0 <= self.window:
+                break
+        if t0 == t1:
+            t0, x0, y0, h0 = self.fixes[-2]
+        dt = t1 - t0
+        if dt <= 0:
+            return 0.0, 0.0
+        dh = (h1 - h0 + math.pi) % (2 * math.pi) - math.pi
+        return math.hypot(x1 - x0, y1 - y0) / dt, dh / dt
+
+    # predict - pose (x, y, heading) measured at tPose moved forward to
+    # when a command sent now takes effect. speed and yawRate default to
+    # motion().
+    def predict(self, pose, tPose, now, speed=None, yawRate=None):
+        if speed is None:
+            speed, yawRate = self.motion()
+        self.horizon = max(0.0, now - tPose) + self.controlDelay + self.servoDelay
+        return advancePose(pose[0], pose[1], pose[2], speed, yawRate, self.horizon)
@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+# magcal - hard and soft iron calibration of the phone's magnetometer.
+#
+# Archive/main.py took the heading straight from the raw magnetometer. On
+# the rover the motor, the battery and the steel in the chassis add their
+# own field: a constant offset (hard iron) and a distortion that stretches
+# the Earth's field by direction (soft iron). Spun around, a perfect
+# magnetometer traces a sphere; the rover's traces an ellipsoid, off
+# centre. fitEllipsoid() fits
+#
+#   a x^2 + b y^2 + c z^2 + 2f yz + 2g xz + 2h xy + 2p x + 2q y + 2r z = 1
+#
+# to the samples with one linear least squares solve and turns it into a
+# MagCalibration: the centre of the ellipsoid (offset) and the matrix
+# that maps it back onto a sphere of the field strength, so that
+#
+#   corrected = matrix @ (raw - offset)
+#
+# one subtraction and one 3x3 multiply per sample. correct() does that in
+# plain Python (no NumPy call overhead) for the 100 Hz stream the rover
+# listens to; correctArray() does a whole recording at once.
+#
+# A rover can only spin about its vertical axis, so its samples lie on a
+# ring rather than all over the ellipsoid. Then the ellipse of the ring is
+# fitted in its plane, the axis across it is left as measured and the ring
+# is turned square to `up` (the phone axis closest to the axis of the ring
+# unless given), which soft iron tilts it away from: the heading only uses
+# the field across "up" (trover/heading.py), so the vertical offset does
+# not matter while the phone stands upright. Turning the phone through all
+# orientations by hand calibrates all three axes.
+#
+# Usage (from the repository root), with the phone streaming its sensors
+# to imuport 5555 and the rover driving slow full lock circles, or the
+# phone turned around by hand, for a minute:
+#   python3 -m trover.magcal --port 5555 --seconds 60 -o magcal.json
+#   python3 -m trover.magcal --samples spin.csv -o magcal.json
+#
+# then set `magcal = magcal.json` in raspberrypi_trover_conf.txt.
+import argparse
+import json
+import socket
+import sys
+import time
+
+import numpy as np
+
+MAG_ID = 5  # magnetometer id of the phone's sensor stream (imustream.SENSOR_IDS)
+MIN_SAMPLES = 50
+PLANAR_RATIO = 0.1  # smallest / largest spread of the samples below which they are a ring
+
+
+# MagCalibration - a fitted calibration. offset is the hard iron offset
+# (microtesla), matrix the 3x3 soft iron correction, field the strength
+# of the field it is scaled to (microtesla).
+class MagCalibration:
+    def __init__(self, offset, matrix, field, samples=0, planar=False):
+        self.offset = tuple(float(v) for v in offset)
+        self.matrix = tuple(tuple(float(v) for v in row) for row in matrix)
+        self.field = float(field)
+        self.samples = samples
+        self.planar = planar
+        self._a = sum(self.matrix, ())  # row major, for correct()
+
+    # correct - a calibrated [x, y, z] from a raw magnetometer sample
+    def correct(self, m):
+        o = self.offset
+        a = self._a
+        x = m[0] - o[0]
+        y = m[1] - o[1]
+        z = m[2] - o[2]
+        return [a[0] * x + a[1] * y + a[2] * z,
+                a[3] * x + a[4] * y + a[5] * z,
+                a[6] * x + a[7] * y + a[8] * z]
+
+    # correctArray - correct() of every row of an (n, 3) array
+    def correctArray(self, m):
+        return (np.asarray(m, dtype=float) - self.offset) @ np.array(self.matrix).T
+
+    def toDict(self):
+        return {'offset': list(self.offset), 'matrix': [list(r) for r in self.matrix],
+                'field': self.field, 'samples': self.samples, 'planar': self.planar}
+
+    # save - writes the calibration to a JSON file
+    def save(self, fname):
+        f = open(fname, 'w')
+        json.dump(self.toDict(), f, indent=2)
+        f.write('\n')
+        f.close()
+
+
+# loadCalibration - a MagCalibration saved with save()
+def loadCalibration(fname):
+    f = open(fname)
+    d = json.load(f)
+    f.close()
+    return MagCalibration(d['offset'], d['matrix'], d['field'], d.get('samples', 0), d.get('planar', False))
+
+
+# _fitQuadric - centre and the positive definite matrix M of the ellipsoid
+# (or ellipse) (p - centre)^T M (p - centre) = 1 fitted to the rows of p
+def _fitQuadric(p):
+    dims = p.shape[1]
+    iu = np.triu_indices(dims, 1)
+    D = np.hstack((p * p, 2 * p[:, iu[0]] * p[:, iu[1]], 2 * p))
+    v = np.linalg.lstsq(D, np.ones(len(p)), rcond=None)[0]
+    Q = np.diag(v[:dims])
+    Q[iu] = v[dims:dims + len(iu[0])]
+    Q[iu[::-1]] = Q[iu]
+    u = v[-dims:]
+    centre = -np.linalg.solve(Q, u)
+    M = Q / (1 + centre @ Q @ centre)
+    w, V = np.linalg.eigh(M)
+    if w.min() <= 0:
+        raise ValueError('the samples do not lie on an ellipsoid, turn the phone further')
+    return centre, w, V
+
+
+# squareTo - the rotation matrix that turns unit vector a onto unit vector b
+def squareTo(a, b):
+    v = np.cross(a, b)
+    c = a @ b
+    K = np.array(((0, -v[2], v[1]), (v[2], 0, -v[0]), (-v[1], v[0], 0)))
+    return np.eye(3) + K + K @ K / (1 + c)
+
+
+# fitEllipsoid - a MagCalibration from an (n, 3) array of raw magnetometer
+# samples (microtesla). up is the phone's up vector for a ring of samples,
+# by default the phone axis closest to the ring's axis.
+def fitEllipsoid(samples, up=None):
+    m = np.asarray(samples, dtype=float)
+    if m.ndim != 2 or m.shape[1] != 3 or len(m) < MIN_SAMPLES:
+        raise ValueError('need at least %d magnetometer samples, got %d' % (MIN_SAMPLES, len(m)))
+    # centred and scaled to about 1 so the squares do not swamp the solve
+    mean = m.mean(axis=0)
+    scale = np.abs(m - mean).max()
+    if scale <= 0:
+        raise ValueError('the magnetometer did not change, spin the rover')
+    p = (m - mean) / scale
+    spread = np.linalg.svd(p, full_matrices=False)[1]
+    planar = spread[2] < PLANAR_RATIO * spread[0]
+    if not planar:
+        centre, w, V = _fitQuadric(p)
+        radius = np.prod(w) ** (-1 / 6)  # of the sphere with the ellipsoid's volume
+        matrix = radius * (V * np.sqrt(w)) @ V.T
+    else:
+        # the ring: fit its ellipse in the plane of the two largest spreads
+        E = np.linalg.svd(p, full_matrices=False)[2].T  # columns: in plane, in plane, across
+        centre2, w, V = _fitQuadric(p @ E[:, :2])
+        radius = np.prod(w) ** (-1 / 4)
+        B = np.eye(3)
+        B[:2, :2] = radius * (V * np.sqrt(w)) @ V.T
+        # across the plane the raw reading is kept, offset 0
+        centre = E[:, :2] @ centre2 - E[:, 2] * (E[:, 2] @ mean) / scale
+        axis = E[:, 2]
+        if up is None:
+            up = np.zeros(3)
+            up[np.argmax(np.abs(axis))] = 1.0
+        up = np.asarray(up, dtype=float) / np.linalg.norm(up)
+        if axis @ up < 0:
+            axis = -axis
+        matrix = squareTo(axis, up) @ E @ B @ E.T
+    return MagCalibration(mean + scale * centre, matrix, scale * radius, len(m), bool(planar))
+
+
+# spreadOfField - (mean, standard deviation) of the field strength of the
+# rows of m; a good calibration brings the deviation close to the noise
+def spreadOfField(m):
+    n = np.linalg.norm(m, axis=1)
+    return float(n.mean()), float(n.std())
+
+
+# recordSpin - magnetometer samples (an (n, 3) array) from the phone's
+# sensor stream on UDP port `port` over `seconds`
+def recordSpin(port, seconds, bindAddress='0.0.0.0'):
+    from trover import imustream
+    sock = imustream.openImuSocket(bindAddress, port)
+    sock.settimeout(0.5)
+    samples = []
+    bad = 0
+    end = time.time() + seconds
+    while time.time() < end:
+        try:
+            message = sock.recv(1024)
+        except socket.timeout:
+            continue
+        groups, n = imustream.decodeBatch([message])
+        bad += n
+        samples.extend(v for sensorId, t, v in groups if sensorId == MAG_ID)
+    sock.close()
+    if bad:
+        print('%d datagrams could not be decoded' % bad)
+    return np.concatenate(samples) if samples else np.zeros((0, 3))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Calibrate the magnetometer from a spin of the rover (or the phone).')
+    parser.add_argument('--port', type=int, default=5555, help='UDP port of the phone sensor stream (imuport)')
+    parser.add_argument('--bind', default='0.0.0.0', help='address to listen on')
+    parser.add_argument('--seconds', type=float, default=60.0, help='how long to record')
+    parser.add_argument('--samples', help='fit these recorded samples (x,y,z per line) instead of recording')
+    parser.add_argument('--save-samples', help='also write the recorded samples here')
+    parser.add_argument('-o', '--output', default='magcal.json', help='write the calibration here')
+    args = parser.parse_args(argv)
+
+    if args.samples:
+        m = np.loadtxt(args.samples, delimiter=',', ndmin=2)
+    else:
+        print('Recording the magnetometer on port %d for %.0f s, spin the rover...' % (args.port, args.seconds))
+        m = recordSpin(args.port, args.seconds, args.bind)
+        if args.save_samples:
+            np.savetxt(args.save_samples, m, delimiter=',', fmt='%.4f')
+    try:
+        cal = fitEllipsoid(m)
+    except ValueError as e:
+        print(e)
+        return 1
+    before = spreadOfField(m)
+    after = spreadOfField(cal.correctArray(m))
+    print('%d samples%s' % (len(m), ', a ring: the axis across it is left as measured' if cal.planar else ''))
+    print('offset  %8.2f %8.2f %8.2f uT' % cal.offset)
+    for row in cal.matrix:
+        print('matrix  %8.4f %8.4f %8.4f' % row)
+    print('field %.1f uT, spread %.2f uT -> %.2f uT' % (cal.field, before[1], after[1]))
+    t0 = time.perf_counter()
+    for s in m.tolist():
+        cal.correct(s)
+    print('correct(): %.2f us per sample' % ((time.perf_counter() - t0) / len(m) * 1e6))
+    cal.save(args.output)
+    print('Written to %s' % args.output)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
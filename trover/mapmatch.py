@@ -0,0 +1,309 @@
+#!/usr/bin/env python3
+# mapmatch - snaps noisy GPS positions onto the route with a hidden Markov
+# model.
+#
+# findGoalPoint() takes the farthest route point within L of the pose.
+# Where the route passes near itself (an out-and-back, a figure eight) that
+# point can be on the wrong pass, and a fix wandering a few metres off the
+# path makes it likelier. MapMatcher tracks which part of the route the
+# rover is on instead:
+#
+#   candidates  for a position, every pass of the route within `radius`:
+#               the segments near it come from a uniform grid over the
+#               route (RouteIndex, cells of `radius` metres, so the 3x3
+#               cells around a position hold all of them), each pass a
+#               run of consecutive segments of which the closest is kept
+#   emission    log likelihood of the distance to a candidate, Gaussian
+#               with the GPS error sigma
+#   transition  log likelihood of moving from one candidate to the next:
+#               the arc length progress along the route should match the
+#               distance the rover moved, -|progress - moved| / beta, so
+#               hopping to another pass of the route (far away in arc
+#               length) costs a lot however close it is
+#
+# step() is the online Viterbi recursion: the hypotheses are the
+# candidates of the last position with their log likelihoods, and each
+# position keeps the best way to reach each of its candidates. Its best
+# candidate is the snapped progress of that tick. goalPoint() then searches
+# for the goal point only on the route ahead of it.
+#
+# matchTrack() is the batch mode for recorded runs: the candidates of all
+# fixes at once, a Viterbi pass over them and a backtrack, so every fix
+# gets the most likely position of the whole run, not just of its past.
+#
+# Usage (from the repository root), to clean up a recorded run:
+#   python3 -m trover.mapmatch ccsvtrack.txt run.csv -o run_matched.csv
+import argparse
+import math
+import sys
+import time
+
+import numpy as np
+
+from trover import simplify
+
+EARTH_M_PER_DEG = 111320.0
+MATCH_TOLERANCE = 0.05  # m, how far the matching polyline may cut corners of the route
+GOAL_ARC = 1.6  # the goal point is searched up to GOAL_ARC * L of route ahead
+
+
+# RouteIndex - the polyline x, y for matching: thinned out by
+# Douglas-Peucker to MATCH_TOLERANCE (at least a point every `cell` metres
+# of route) and its segments in a uniform grid of `cell` metre cells. A
+# route smoothed every few centimetres would otherwise put hundreds of
+# segments near every position.
+class RouteIndex:
+    def __init__(self, x, y, cell):
+        x = np.asarray(x, dtype=float)
+        y = np.asarray(y, dtype=float)
+        self.x = x
+        self.y = y
+        self.s = np.zeros(len(x))
+        np.cumsum(np.hypot(np.diff(x), np.diff(y)), out=self.s[1:])
+        self.cell = cell
+        keep = simplify.douglasPeucker(x, y, MATCH_TOLERANCE)
+        keep[1:] |= np.diff(np.floor(self.s / cell)) != 0
+        self.keep = np.flatnonzero(keep)  # route indices of the matching polyline
+        mx = x[self.keep]
+        my = y[self.keep]
+        self.ks = self.s[self.keep]
+        self.origin = (mx.min(), my.min())
+        ax, ay, bx, by = mx[:-1], my[:-1], mx[1:], my[1:]
+        cx0 = self._cells(np.minimum(ax, bx), 0)
+        cx1 = self._cells(np.maximum(ax, bx), 0)
+        cy0 = self._cells(np.minimum(ay, by), 1)
+        cy1 = self._cells(np.maximum(ay, by), 1)
+        self.rows = int(cy1.max()) + 3
+        # a segment goes into every cell of its bounding box
+        nx = cx1 - cx0 + 1
+        ny = cy1 - cy0 + 1
+        count = nx * ny
+        seg = np.repeat(np.arange(len(ax)), count)
+        k = np.arange(len(seg)) - np.repeat(np.cumsum(count) - count, count)
+        keys = (cx0[seg] + k // ny[seg]) * self.rows + cy0[seg] + k % ny[seg]
+        order = np.argsort(keys, kind='stable')
+        self.keys = keys[order]
+        self.segs = seg[order]
+        self.ax = ax
+        self.ay = ay
+        self.dx = bx - ax
+        self.dy = by - ay
+        self.len2 = np.maximum(self.dx * self.dx + self.dy * self.dy, 1e-12)
+
+    def _cells(self, v, axis):
+        return np.floor((v - self.origin[axis]) / self.cell).astype(np.int64) + 1
+
+    # near - (point, segment) pairs of every matching segment in the 3x3
+    # cells around each of the points px, py
+    def near(self, px, py):
+        cx = self._cells(px, 0)
+        cy = self._cells(py, 1)
+        d = np.arange(-1, 2)
+        keys = ((cx[:, None, None] + d[None, :, None]) * self.rows + cy[:, None, None] + d[None, None, :]).reshape(len(px), 9)
+        lo = np.searchsorted(self.keys, keys, 'left').ravel()
+        hi = np.searchsorted(self.keys, keys, 'right').ravel()
+        count = hi - lo
+        point = np.repeat(np.arange(len(px)).repeat(9), count)
+        j = np.repeat(lo - (np.cumsum(count) - count), count) + np.arange(int(count.sum()))
+        return point, self.segs[j]
+
+    # candidates - for each of the points px, py every pass of the route
+    # within radius: (point, route segment, arc length s, snapped x, y,
+    # distance) arrays, sorted by point
+    def candidates(self, px, py, radius):
+        px = np.asarray(px, dtype=float)
+        py = np.asarray(py, dtype=float)
+        point, seg = self.near(px, py)
+        ex = px[point] - self.ax[seg]
+        ey = py[point] - self.ay[seg]
+        t = np.clip((ex * self.dx[seg] + ey * self.dy[seg]) / self.len2[seg], 0.0, 1.0)
+        sx = self.ax[seg] + t * self.dx[seg]
+        sy = self.ay[seg] + t * self.dy[seg]
+        dist = np.hypot(px[point] - sx, py[point] - sy)
+        keep = dist <= radius
+        point, seg, t, sx, sy, dist = point[keep], seg[keep], t[keep], sx[keep], sy[keep], dist[keep]
+        if len(point) == 0:
+            return point, seg, t, sx, sy, dist
+        order = np.argsort(point * len(self.ax) + seg)
+        point, seg, t, sx, sy, dist = point[order], seg[order], t[order], sx[order], sy[order], dist[order]
+        # one candidate per pass: runs of consecutive segments (a segment
+        # found in two cells shows up twice), the closest of each run
+        starts = np.flatnonzero(np.r_[True, (np.diff(point) != 0) | (np.diff(seg) > 1)])
+        run = np.repeat(np.arange(len(starts)), np.diff(np.r_[starts, len(point)]))
+        atMin = np.flatnonzero(dist == np.minimum.reduceat(dist, starts)[run])
+        first = atMin[np.r_[True, run[atMin][1:] != run[atMin][:-1]]]
+        seg = seg[first]
+        s = self.ks[seg] + t[first] * (self.ks[seg + 1] - self.ks[seg])
+        # the route segment the arc length falls in
+        routeSeg = np.minimum(np.searchsorted(self.s, s, 'right') - 1, len(self.s) - 2)
+        return point[first], routeSeg, s, sx[first], sy[first], dist[first]
+
+
+# transitionLogs - log likelihoods of moving from candidates at arc
+# lengths sa to candidates at sb while the rover moved `moved` metres
+def transitionLogs(sa, sb, moved, beta):
+    return -np.abs((sb[None, :] - sa[:, None]) - moved) / beta
+
+
+# MapMatcher - the online matcher over the route x, y. sigma is the GPS
+# error (m, 1 sigma), beta the scale of the transition (m) and radius how
+# far from the route a candidate can be (m).
+class MapMatcher:
+    def __init__(self, x, y, sigma=1.0, beta=2.0, radius=5.0):
+        self.index = RouteIndex(x, y, radius)
+        self.sigma = sigma
+        self.beta = beta
+        self.radius = radius
+        self.s = None  # arc lengths of the hypotheses
+        self.logp = None  # and their log likelihoods
+        self.last = None  # (x, y) of the last matched position
+        self.match = None  # (s, segment, x, y, distance) of the last step, None if off the route
+        self.breaks = 0  # steps without a candidate
+
+    # step - matches the position (x, y). Returns (arc length s, segment,
+    # snapped x, y, distance from the route), or None if it is farther than
+    # radius from the route; the hypotheses then start over.
+    def step(self, x, y):
+        point, seg, s, sx, sy, dist = self.index.candidates(np.array((x,)), np.array((y,)), self.radius)
+        if len(s) == 0:
+            self.s = None
+            self.match = None
+            self.breaks += 1
+            return None
+        emit = -0.5 * (dist / self.sigma) ** 2
+        if self.s is None:
+            logp = emit
+        else:
+            moved = math.hypot(x - self.last[0], y - self.last[1])
+            logp = (self.logp[:, None] + transitionLogs(self.s, s, moved, self.beta)).max(axis=0) + emit
+        logp -= logp.max()
+        self.s = s
+        self.logp = logp
+        self.last = (x, y)
+        b = int(np.argmax(logp))
+        self.match = (float(s[b]), int(seg[b]), float(sx[b]), float(sy[b]), float(dist[b]))
+        return self.match
+
+    # goalPoint - findGoalPoint() restricted to the route ahead of the
+    # last match: the farthest point within L of (x, y) at most GOAL_ARC * L
+    # of route ahead of it, else the first point ahead of the match.
+    # Returns None without a match.
+    def goalPoint(self, x, y, L):
+        if self.match is None:
+            return None
+        ix = self.index
+        i = self.match[1] + 1
+        end = int(np.searchsorted(ix.s, self.match[0] + GOAL_ARC * L, 'right'))
+        end = max(end, i + 1)
+        d2 = (ix.x[i:end] - x) ** 2 + (ix.y[i:end] - y) ** 2
+        hit = np.flatnonzero(d2 <= L * L)
+        j = i + (int(hit[-1]) if len(hit) else 0)
+        j = min(j, len(ix.x) - 1)
+        gx, gy = float(ix.x[j]), float(ix.y[j])
+        return gx, gy, math.hypot(gx - x, gy - y), j
+
+
+# matchTrack - the batch mode: the most likely route position of every
+# point of a recorded track px, py. Returns arrays (arc length s, segment,
+# snapped x, y, distance), with NaN (segment -1) for points farther than
+# radius from the route; the track is matched in pieces between them.
+def matchTrack(x, y, px, py, sigma=1.0, beta=2.0, radius=5.0, index=None):
+    if index is None:
+        index = RouteIndex(x, y, radius)
+    px = np.asarray(px, dtype=float)
+    py = np.asarray(py, dtype=float)
+    n = len(px)
+    point, seg, s, sx, sy, dist = index.candidates(px, py, radius)
+    bounds = np.searchsorted(point, np.arange(n + 1))
+    emit = -0.5 * (dist / sigma) ** 2
+    moved = np.r_[0.0, np.hypot(np.diff(px), np.diff(py))]
+    score = np.empty(len(s))
+    back = np.full(len(s), -1)
+    prev = None
+    for i in range(n):
+        a, b = bounds[i], bounds[i + 1]
+        if a == b:
+            prev = None
+            continue
+        if prev is None:
+            score[a:b] = emit[a:b]
+        else:
+            pa, pb = prev
+            logs = score[pa:pb, None] + transitionLogs(s[pa:pb], s[a:b], moved[i], beta)
+            best = logs.argmax(axis=0)
+            score[a:b] = logs[best, np.arange(b - a)] + emit[a:b]
+            back[a:b] = pa + best
+        score[a:b] -= score[a:b].max()
+        prev = (a, b)
+    # backtrack from the best candidate of the last point of every piece
+    chosen = np.full(n, -1)
+    i = n - 1
+    while i >= 0:
+        a, b = bounds[i], bounds[i + 1]
+        if a == b:
+            i -= 1
+            continue
+        c = a + int(np.argmax(score[a:b]))
+        while c >= 0:
+            chosen[point[c]] = c
+            i = point[c] - 1
+            c = back[c]
+    ok = chosen >= 0
+    c = chosen[ok]
+    segment = np.full(n, -1)
+    segment[ok] = seg[c]
+    out = []
+    for v in (s, sx, sy, dist):
+        a = np.full(n, np.nan)
+        a[ok] = v[c]
+        out.append(a)
+    return out[0], segment, out[1], out[2], out[3]
+
+
+def main(argv=None):
+    from trover import geo
+    from trover import ingest
+    from trover import pipeline
+    parser = argparse.ArgumentParser(description='Match a recorded run onto a route.')
+    parser.add_argument('route')
+    parser.add_argument('track', help='the recorded run, any format trover.ingest reads')
+    parser.add_argument('-o', '--output', help='write the matched run (lat,lon per fix) here')
+    parser.add_argument('--spacing', type=float, default=0.05, help='route spacing (m)')
+    parser.add_argument('--sigma', type=float, default=1.0, help='GPS error, 1 sigma (m)')
+    parser.add_argument('--beta', type=float, default=2.0, help='transition scale (m)')
+    parser.add_argument('--radius', type=float, default=5.0, help='farthest a fix can be from the route (m)')
+    args = parser.parse_args(argv)
+
+    waypoints = ingest.loadRoute(args.route)
+    r = pipeline.compileRoute(waypoints, spacing=args.spacing)
+    x, y = r.xyArrays()
+    lat, lon = ingest.readTrack(args.track)
+    huso, zone = geo.utmZone(waypoints[0][0], waypoints[0][1])  # the route's zone
+    px, py = geo.deg2utmArrays(lat, lon, huso)
+    t0 = time.perf_counter()
+    index = RouteIndex(x, y, args.radius)
+    t1 = time.perf_counter()
+    s, seg, sx, sy, dist = matchTrack(x, y, px, py, args.sigma, args.beta, args.radius, index)
+    t2 = time.perf_counter()
+    ok = seg >= 0
+    print('%d route points, %.1f m; %d fixes' % (len(x), index.s[-1], len(px)))
+    print('index %.1f ms, match %.1f ms' % ((t1 - t0) * 1e3, (t2 - t1) * 1e3))
+    if ok.any():
+        print('%d fixes matched (%.1f%%), distance to the route rms %.2f m, max %.2f m; progress %.1f to %.1f m'
+              % (ok.sum(), 100.0 * ok.mean(), np.sqrt(np.mean(dist[ok] ** 2)), dist[ok].max(), s[ok].min(), s[ok].max()))
+    else:
+        print('no fix within %.1f m of the route' % args.radius)
+    if args.output:
+        # each fix moved by as many metres as its match is from it on the map
+        mlat = lat[ok] + (sy - py)[ok] / EARTH_M_PER_DEG
+        mlon = lon[ok] + (sx - px)[ok] / (EARTH_M_PER_DEG * np.cos(np.radians(lat[ok])))
+        f = open(args.output, 'w')
+        for a, b in zip(mlat, mlon):
+            f.write('%.10f,%.10f\n' % (a, b))
+        f.close()
+        print('Written to %s' % args.output)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
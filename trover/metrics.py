@@ -0,0 +1,210 @@
+# metrics - live health counters served on a local HTTP port.
+#
+# The control loop and the listener threads update plain attributes of a
+# RoverMetrics (on the Pi) or BridgeMetrics (in Termux) object: every
+# counter has exactly one writer thread (the GPS and IMU listeners count
+# their bad datagrams separately), so a += is never raced and the hot
+# path takes no locks. A MetricsServer thread reads the attributes when
+# scraped:
+#
+#   curl http://127.0.0.1:9100/metrics       # Prometheus text format
+#   curl http://127.0.0.1:9100/metrics.json  # the same as JSON
+#
+# Per thread CPU time comes from /proc/self/task (Linux, including
+# Android/Termux); elsewhere only the process total is reported.
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+
+class Metrics:
+    # (attribute, metric name, prometheus type, help) served for this role
+    FIELDS = ()
+    PREFIX = 'trover'
+
+    def __init__(self, period=0.1):
+        self.period = period  # nominal loop period (s)
+        self.started = time.time()
+        self.ticks = 0
+        self.lastTick = 0.0
+        self.periodAvg = period  # EWMA of the measured loop period
+        self.jitterAvg = 0.0  # EWMA of |measured - nominal period|
+        for attr, name, kind, text in self.FIELDS:
+            if not hasattr(self, attr):
+                setattr(self, attr, 0)
+
+    # tick - call once per loop iteration, from the loop thread only
+    def tick(self, now=None):
+        if now is None:
+            now = time.monotonic()
+        if self.lastTick:
+            dt = now - self.lastTick
+            self.periodAvg += 0.1 * (dt - self.periodAvg)
+            self.jitterAvg += 0.1 * (abs(dt - self.period) - self.jitterAvg)
+        self.lastTick = now
+        self.ticks += 1
+
+    # values - every metric as (name, type, help, value or {labels: value})
+    def values(self):
+        out = [
+            ('loop_ticks_total', 'counter', 'Control loop iterations', self.ticks),
+            ('loop_rate_hz', 'gauge', 'Control loop rate (EWMA)', 1.0 / self.periodAvg if self.periodAvg > 0 else 0.0),
+            ('loop_jitter_seconds', 'gauge', 'Mean |period - nominal period| (EWMA)', self.jitterAvg),
+        ]
+        for attr, name, kind, text in self.FIELDS:
+            out.append((name, kind, text, getattr(self, attr)))
+        out.extend(self.derived())
+        out.append(('thread_cpu_seconds_total', 'counter', 'CPU time used per thread', threadCpuTimes()))
+        out.append(('uptime_seconds', 'gauge', 'Seconds since start', time.time() - self.started))
+        return out
+
+    # derived - metrics computed at scrape time, for subclasses
+    def derived(self):
+        return []
+
+    def prometheus(self):
+        lines = []
+        for name, kind, text, value in self.values():
+            full = '%s_%s' % (self.PREFIX, name)
+            lines.append('# HELP %s %s' % (full, text))
+            lines.append('# TYPE %s %s' % (full, kind))
+            if isinstance(value, dict):
+                for label, v in sorted(value.items()):
+                    lines.append('%s{thread="%s"} %s' % (full, label, _num(v)))
+            else:
+                lines.append('%s %s' % (full, _num(value)))
+        return '\n'.join(lines) + '\n'
+
+    def json(self):
+        return json.dumps(dict((name, value) for name, kind, text, value in self.values()))
+
+
+def _num(v):
+    if v is None:
+        return 'NaN'
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+
+# RoverMetrics - metrics of raspberrypi_trover.py
+class RoverMetrics(Metrics):
+    FIELDS = (
+        ('datagrams', 'datagrams_received_total', 'counter', 'GPS datagrams received from the phone'),
+        ('datagramsBad', 'datagrams_bad_total', 'counter', 'GPS datagrams that could not be decoded'),
+        ('datagramsDropped', 'datagrams_dropped_total', 'counter', 'GPS datagrams lost on the way (trace id gaps)'),
+        ('datagramsCoalesced', 'datagrams_coalesced_total', 'counter', 'Fixes overwritten before a control tick used them'),
+        ('fixesRejectedQuality', 'fixes_rejected_quality_total', 'counter', 'Fixes dropped for their GGA quality, HDOP or satellites (fixgate = 1)'),
+        ('fixesRejectedSpeed', 'fixes_rejected_speed_total', 'counter', 'Fixes dropped as farther than the rover can have driven (fixgate = 1)'),
+        ('fixesRejectedInnovation', 'fixes_rejected_innovation_total', 'counter', 'Fixes the Kalman filter did not use, too far from its prediction (fixgate = 1)'),
+        ('imuDatagrams', 'imu_datagrams_received_total', 'counter', 'IMU sensor stream datagrams received from the phone'),
+        ('imuDatagramsBad', 'imu_datagrams_bad_total', 'counter', 'IMU sensor stream datagrams that could not be decoded'),
+        ('imuBatch', 'imu_batch_datagrams', 'gauge', 'IMU datagrams decoded in the last listener wakeup'),
+        ('distanceToGoal', 'distance_to_goal_meters', 'gauge', 'Distance to the end of the route'),
+        ('routeIndex', 'route_index', 'gauge', 'Index of the current goal point in the smoothed route'),
+        ('routeLength', 'route_points', 'gauge', 'Points in the smoothed route'),
+        ('turnAngle', 'turn_angle_degrees', 'gauge', 'Last commanded turn angle'),
+        ('commandedSpeed', 'commanded_speed_mps', 'gauge', 'Speed the throttle was last set for (speedprofile = 1)'),
+        ('matchedProgress', 'matched_progress_meters', 'gauge', 'Distance along the route of the map matched pose (mapmatch = 1)'),
+        ('matchedDistance', 'matched_distance_meters', 'gauge', 'Distance of the pose from the route (mapmatch = 1)'),
+        ('crossTrackError', 'cross_track_error_meters', 'gauge', 'Signed distance from the route, positive left of it (crosstrack = 1)'),
+        ('crossTrackRms', 'cross_track_rms_meters', 'gauge', 'RMS cross-track error of the run so far (crosstrack = 1)'),
+        ('crossTrackMax', 'cross_track_max_meters', 'gauge', 'Largest cross-track error of the run so far (crosstrack = 1)'),
+        ('crossTrackP95', 'cross_track_p95_meters', 'gauge', '95th percentile cross-track error of the run so far (crosstrack = 1)'),
+        ('headingError', 'heading_error_degrees', 'gauge', 'Heading minus the route heading (crosstrack = 1)'),
+        ('headingErrorRms', 'heading_error_rms_degrees', 'gauge', 'RMS heading error of the run so far (crosstrack = 1)'),
+        ('routeProgress', 'route_progress_meters', 'gauge', 'Distance along the route (crosstrack = 1)'),
+        ('routeComplete', 'route_complete_percent', 'gauge', 'Share of the route driven (crosstrack = 1)'),
+        ('latencyHorizon', 'latency_horizon_seconds', 'gauge', 'How far ahead the pose was predicted (latencycomp = 1)'),
+    )
+
+    def __init__(self, period=0.1):
+        Metrics.__init__(self, period)
+        self.lastFix = 0.0  # time.time() the last fix arrived
+        self.lastTraceId = None
+        self.fixPending = False  # set by the listener, cleared by the tick
+
+    # fixReceived - listener thread: a datagram was decoded
+    def fixReceived(self, tRecv, traceId=None):
+        self.datagrams += 1
+        self.lastFix = tRecv
+        if self.fixPending:
+            self.datagramsCoalesced += 1
+        self.fixPending = True
+        if traceId is not None:
+            if self.lastTraceId is not None and traceId > self.lastTraceId + 1:
+                self.datagramsDropped += traceId - self.lastTraceId - 1
+            self.lastTraceId = traceId
+
+    def derived(self):
+        age = time.time() - self.lastFix if self.lastFix else None
+        return [('fix_age_seconds', 'gauge', 'Age of the last GPS fix', age)]
+
+
+# BridgeMetrics - metrics of termux_trover.py
+class BridgeMetrics(Metrics):
+    FIELDS = (
+        ('reads', 'bridge_reads_total', 'counter', 'TCP reads from the USB bridge'),
+        ('sentences', 'nmea_sentences_total', 'counter', 'NMEA sentences parsed'),
+        ('checksumFailures', 'nmea_checksum_failures_total', 'counter', 'NMEA sentences with a bad checksum'),
+        ('parseErrors', 'nmea_parse_errors_total', 'counter', 'NMEA sentences that could not be parsed'),
+        ('datagrams', 'datagrams_sent_total', 'counter', 'GPS datagrams sent to the RPi'),
+    )
+
+    def __init__(self, period=0.1):
+        Metrics.__init__(self, period)
+        self.lastFix = 0.0
+
+    def derived(self):
+        age = time.time() - self.lastFix if self.lastFix else None
+        return [('fix_age_seconds', 'gauge', 'Time since the last datagram was sent', age)]
+
+
+# threadCpuTimes - {thread name: CPU seconds} for this process
+def threadCpuTimes():
+    names = dict((t.native_id, t.name) for t in threading.enumerate() if getattr(t, 'native_id', None))
+    out = {}
+    try:
+        tick = float(os.sysconf('SC_CLK_TCK'))
+        for tid in os.listdir('/proc/self/task'):
+            f = open('/proc/self/task/%s/stat' % tid)
+            stat = f.read()
+            f.close()
+            # fields after the ")" of the command name; utime and stime are 14 and 15
+            fields = stat[stat.rfind(')') + 2:].split()
+            name = names.get(int(tid), 'tid%s' % tid)
+            out[name] = (int(fields[11]) + int(fields[12])) / tick
+    except (OSError, ValueError, IndexError):
+        out = {'process': time.process_time()}
+    return out
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        m = self.server.metrics
+        if self.path.startswith('/metrics.json'):
+            body, ctype = m.json(), 'application/json'
+        elif self.path.startswith('/metrics') or self.path == '/':
+            body, ctype = m.prometheus(), 'text/plain; version=0.0.4'
+        else:
+            self.send_error(404)
+            return
+        data = body.encode()
+        self.send_response(200)
+        self.send_header('Content-Type', ctype)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass  # no per-request printing
+
+
+# startMetricsServer - serves metrics on host:port from a daemon thread and
+# returns the server (server.shutdown() stops it).
+def startMetricsServer(metrics, port, host='127.0.0.1'):
+    server = HTTPServer((host, port), _Handler)
+    server.metrics = metrics
+    th = threading.Thread(name='metricsServer', target=server.serve_forever, daemon=True)
+    th.start()
+    return server
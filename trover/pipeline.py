@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+# pipeline - builds the smoothed route of a track of any length in
+# constant memory.
+#
+# The route the rover follows is normally compiled with Python lists
+# (route.py), which is fine for the tracks of a field day but needs
+# hundreds of bytes per point: a track of millions of points does not fit
+# on a Raspberry Pi. buildRoute() runs the same steps as generators over
+# chunks of the track instead,
+#
+#   parse     ingest.iterTrack, one chunk of the file (4 MB) at a time
+#   project   geo.deg2utmArrays, in the UTM zone of the first point
+#   simplify  simplify.simplifyChunks (if tolerance > 0)
+#   densify   densifyChunks: uniform like smoothWaypoints, or adaptive
+#             like densifyWaypoints; at most DENSIFY_BATCH points at once
+#   write     routefile.RouteWriter, straight into the mapped route file
+#             as float32 (or int32) offsets (see trover/compact.py)
+#
+# so peak memory is set by the chunk size, not by the length of the route.
+# compileRoute() runs the same steps on a waypoint list into an in-memory
+# CompactRoute, for routestorage = float32 or int32 without a route file.
+# The rover maps the result (routefile = ... in raspberrypi_trover_conf.txt)
+# and rebuilds it only when the track or the route settings change.
+#
+# Usage (from the repository root):
+#   python3 -m trover.pipeline ccsvtrack.txt -o ccsvtrack.trr --simplify 0.05
+#   python3 -m trover.pipeline huge.csv -o huge.trr --densify adaptive --L 3
+#   python3 -m trover.pipeline huge.csv --lists   # the list based path, to compare
+import argparse
+import hashlib
+import itertools
+import os
+import resource
+import sys
+import time
+
+import numpy as np
+
+from trover import compact
+from trover import geo
+from trover import ingest
+from trover import route
+from trover import routefile
+from trover import simplify
+
+DENSIFY_BATCH = 1 << 18  # route points densifyChunks produces at a time
+DENSIFY_MODES = ('uniform', 'adaptive')
+
+
+# curvature - routeCurvature for arrays: the curvature of the interior
+# points of the polyline x, y (two fewer than there are points)
+def curvature(x, y):
+    ax = np.diff(x)[:-1]
+    ay = np.diff(y)[:-1]
+    bx = np.diff(x)[1:]
+    by = np.diff(y)[1:]
+    la = np.hypot(ax, ay)
+    lb = np.hypot(bx, by)
+    phi = np.arctan2(ax * by - ay * bx, ax * bx + ay * by)
+    total = la + lb
+    return np.where((la > 0) & (lb > 0), 2 * phi / np.where(total > 0, total, 1.0), 0.0)
+
+
+# fillSegments - yields (x, y, k) of the points of the segments between
+# the vertices x, y (curvature kappa), DENSIFY_BATCH points at a time. The
+# last vertex is left for the next segment. With adaptive False every
+# segment is filled every `spacing` metres like smoothWaypoints, otherwise
+# evenly like densifyWaypoints.
+def fillSegments(x, y, kappa, spacing, adaptive, chordError, maxSpacing):
+    dx = np.diff(x)
+    dy = np.diff(y)
+    d = np.hypot(dx, dy)
+    if adaptive:
+        k = np.maximum(np.abs(kappa[:-1]), np.abs(kappa[1:]))
+        step = np.sqrt(8 * chordError / np.where(k > 0, k, 1.0))
+        step = np.where(k > 0, np.clip(step, spacing, maxSpacing), maxSpacing)
+    else:
+        step = np.full(len(d), spacing)
+    n = np.ceil(d / step).astype(np.intp)
+    ends = np.cumsum(n)
+    total = int(ends[-1]) if len(ends) else 0
+    for first in range(0, total, DENSIFY_BATCH):
+        p = np.arange(first, min(first + DENSIFY_BATCH, total))
+        seg = np.searchsorted(ends, p, 'right')
+        j = p - (ends[seg] - n[seg])
+        if adaptive:
+            f = j / n[seg]
+        else:
+            f = j * spacing / d[seg]
+        yield (x[seg] + dx[seg] * f, y[seg] + dy[seg] * f,
+               kappa[seg] + (kappa[seg + 1] - kappa[seg]) * f)
+
+
+# densifyChunks - takes chunks of (x, y) route vertices and yields
+# chunks of (x, y, k) smoothed route points. Two vertices are carried to
+# the next chunk: the curvature of a vertex needs the one after it.
+def densifyChunks(chunks, spacing=route.spacingBetweenCoarseWaypoints, densify='uniform', L=3.0, chordError=0.01):
+    adaptive = densify == 'adaptive'
+    maxSpacing = max(spacing, L * 0.1)
+    cx = np.zeros(0)
+    cy = np.zeros(0)
+    ck = np.zeros(0)  # curvature of the first carried vertex
+    done = False
+    chunks = iter(chunks)
+    while not done:
+        part = next(chunks, None)
+        if part is None:
+            done = True
+            x, y = cx, cy
+        else:
+            x = np.r_[cx, part[0]]
+            y = np.r_[cy, part[1]]
+            keep = np.r_[True, (np.diff(x) != 0) | (np.diff(y) != 0)]  # repeated waypoints
+            x, y = x[keep], y[keep]
+        if len(x) < 3 and not done:
+            cx, cy = x, y
+            continue
+        kappa = np.r_[ck if len(ck) else 0.0, curvature(x, y), 0.0]
+        if not done:
+            # the last vertex has no curvature yet: stop a segment short
+            for out in fillSegments(x[:-1], y[:-1], kappa[:-1], spacing, adaptive, chordError, maxSpacing):
+                yield out
+            cx, cy, ck = x[-2:], y[-2:], kappa[-2:-1]
+        elif len(x):
+            for out in fillSegments(x, y, kappa, spacing, adaptive, chordError, maxSpacing):
+                yield out
+            yield x[-1:], y[-1:], kappa[-1:]
+
+
+# routeKey - 20 byte key of a track file and the settings its route is
+# built with; a route file with the same key is up to date
+def routeKey(source, settings):
+    st = os.stat(source)
+    text = '%s|%d|%d|%s' % (os.path.abspath(source), st.st_size, st.st_mtime_ns, sorted(settings.items()))
+    return hashlib.sha1(text.encode('utf-8')).digest()
+
+
+# buildRoute - runs the pipeline from the track in source to the route
+# file fname. Returns a dict of counts: points read, vertices after
+# simplification, route points, and the zone.
+def buildRoute(source, fname, fmt=None, axisOrder='auto', tolerance=0.0, densify='uniform',
+               spacing=route.spacingBetweenCoarseWaypoints, L=3.0, chordError=0.01,
+               size=ingest.CHUNK_SIZE, key=b'', storage='float32'):
+    if densify not in DENSIFY_MODES:
+        raise ValueError('densify must be one of %s, not "%s"' % (', '.join(DENSIFY_MODES), densify))
+    stats = {'points': 0, 'vertices': 0}
+    chunks = ingest.iterTrack(source, fmt, axisOrder, size)
+    first = next(chunks, None)
+    if first is None:
+        raise ValueError('%s: found 0 route points, need at least 2' % source)
+    huso, zone = geo.utmZone(first[0][0], first[1][0])
+    x0, y0 = geo.deg2utmArrays(first[0][:1], first[1][:1], huso)
+    origin = compact.pickOrigin(x0[0], y0[0])
+
+    def project(chunks):
+        for lat, lon in chunks:
+            stats['points'] += len(lat)
+            yield geo.deg2utmArrays(lat, lon, huso)
+
+    def count(chunks):
+        for x, y in chunks:
+            stats['vertices'] += len(x)
+            yield x, y
+
+    xy = project(itertools.chain([first], chunks))
+    if tolerance > 0:
+        stats['simplify'] = {}
+        xy = simplify.simplifyChunks(xy, tolerance, stats=stats['simplify'])
+    points = densifyChunks(count(xy), spacing, densify, L, chordError)
+    writer = routefile.RouteWriter(fname, zone, origin, storage, key)
+    try:
+        for x, y, k in points:
+            writer.append(x, y, k)
+        if writer.count < 2:
+            raise ValueError('%s: found %d route points, need at least 2' % (source, writer.count))
+    except BaseException:
+        writer.discard()
+        raise
+    writer.close()
+    stats['route'] = writer.count
+    stats['zone'] = zone
+    return stats
+
+
+# openRoute - the MappedRoute of source built with these settings, from
+# fname if it is up to date and built (then returns stats) if it is not.
+# Returns (route, stats or None).
+def openRoute(source, fname, fmt=None, axisOrder='auto', tolerance=0.0, densify='uniform',
+              spacing=route.spacingBetweenCoarseWaypoints, L=3.0, chordError=0.01, storage='float32'):
+    settings = {'format': fmt, 'axisorder': axisOrder, 'simplify': tolerance, 'densify': densify,
+                'spacing': spacing, 'chorderror': chordError, 'storage': storage}
+    if densify == 'adaptive':
+        settings['L'] = L  # sets the largest spacing
+    key = routeKey(source, settings)
+    try:
+        if routefile.readHeader(fname)['key'] == key:
+            return routefile.MappedRoute(fname), None
+    except (OSError, ValueError):
+        pass
+    stats = buildRoute(source, fname, fmt, axisOrder, tolerance, densify, spacing, L, chordError,
+                       key=key, storage=storage)
+    return routefile.MappedRoute(fname), stats
+
+
+# compileRoute - CompactRoute of a [[lat, lon], ...] waypoint list, made
+# like buildRoute makes a route file (without simplifying)
+def compileRoute(waypoints, densify='uniform', spacing=route.spacingBetweenCoarseWaypoints, L=3.0,
+                 chordError=0.01, storage='float32'):
+    a = np.asarray(waypoints, dtype=float)
+    huso, zone = geo.utmZone(a[0, 0], a[0, 1])
+    x, y = geo.deg2utmArrays(a[:, 0], a[:, 1], huso)
+    origin = compact.pickOrigin(x[0], y[0])
+    dxs = []
+    dys = []
+    ks = []
+    for px, py, pk in densifyChunks([(x, y)], spacing, densify, L, chordError):
+        dx, dy = compact.encode(px, py, origin, storage)
+        dxs.append(dx)
+        dys.append(dy)
+        ks.append(pk.astype(np.float32))
+    return compact.CompactRoute(origin, np.concatenate(dxs), np.concatenate(dys), np.concatenate(ks),
+                                zone, storage)
+
+
+# buildLists - the list based path of the rover (ingest.loadRoute, then
+# simplify, project and smooth), for comparison. Returns the number of
+# route points.
+def buildLists(source, fmt=None, axisOrder='auto', tolerance=0.0, densify='uniform',
+               spacing=route.spacingBetweenCoarseWaypoints, L=3.0, chordError=0.01):
+    waypoints = ingest.loadRoute(source, fmt, axisOrder)
+    if tolerance > 0:
+        waypoints, stats = simplify.simplifyWaypoints(waypoints, tolerance)
+    wp_utm = route.projectWaypoints(waypoints)
+    if densify == 'adaptive':
+        sxx, syy, suu, curv = route.densifyWaypoints(wp_utm, L, chordError, spacing)
+    else:
+        sxx, syy, suu = route.smoothWaypoints(wp_utm, spacing)
+    return len(sxx)
+
+
+# peakMemory - peak resident memory of this process so far (MB)
+def peakMemory():
+    kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return kb / 1024.0 if sys.platform != 'darwin' else kb / 1048576.0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Build the memory mapped route of a track (any format trover.ingest reads).')
+    parser.add_argument('track')
+    parser.add_argument('-o', '--output', help='route file to write (default: track name + .trr)')
+    parser.add_argument('--format', choices=ingest.FORMATS, help='default: detect')
+    parser.add_argument('--axis-order', choices=ingest.AXIS_ORDERS, default='auto', help='for CSV files')
+    parser.add_argument('--simplify', type=float, default=0.0, help='Douglas-Peucker tolerance (m), 0 = off')
+    parser.add_argument('--densify', choices=DENSIFY_MODES, default='uniform')
+    parser.add_argument('--spacing', type=float, default=route.spacingBetweenCoarseWaypoints, help='(m)')
+    parser.add_argument('--L', type=float, default=3.0, help='look ahead distance for --densify adaptive (m)')
+    parser.add_argument('--chord-error', type=float, default=0.01, help='(m)')
+    parser.add_argument('--storage', choices=compact.STORAGES, default='float32',
+                        help='offsets in float32 metres or int32 centimetres (see trover/compact.py)')
+    parser.add_argument('--chunk', type=int, default=ingest.CHUNK_SIZE, help='bytes of the track read at a time')
+    parser.add_argument('--lists', action='store_true', help='run the list based path instead and report its memory')
+    args = parser.parse_args(argv)
+
+    before = peakMemory()
+    t0 = time.perf_counter()
+    if args.lists:
+        n = buildLists(args.track, args.format, args.axis_order, args.simplify, args.densify,
+                       args.spacing, args.L, args.chord_error)
+        print('Lists: %d route points' % n)
+    else:
+        output = args.output or os.path.splitext(args.track)[0] + '.trr'
+        stats = buildRoute(args.track, output, args.format, args.axis_order, args.simplify, args.densify,
+                           args.spacing, args.L, args.chord_error, args.chunk, storage=args.storage)
+        if 'simplify' in stats:
+            print('Simplified: %s' % simplify.describe(stats['simplify']))
+        print('%d points -> %d route points (zone %s) written to %s'
+              % (stats['points'], stats['route'], stats['zone'], output))
+    dt = time.perf_counter() - t0
+    print('%.2f s, peak memory %.0f MB (%.0f MB before building)' % (dt, peakMemory(), before))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
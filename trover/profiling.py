@@ -0,0 +1,128 @@
+# profiling - per-stage timers for the control loop.
+#
+# StageProfiler splits every control tick into stages (pose transform,
+# goal search, controller, actuation, logging) and keeps, per stage, the
+# count/total/min/max plus the last `keep` samples for percentiles. A mark
+# is one perf_counter() call and a few list stores, so it can stay on for
+# whole runs. Nothing is printed from the loop; report() is called on
+# SIGUSR1 and at exit (see installSignalHandlers).
+#
+# SIGUSR2 asks for a cProfile of the next `profileTicks` ticks. The
+# profile is switched on at the start of a tick, off after the last one,
+# and saved to trover_profile_<time>.prof (open it with pstats or
+# snakeviz) with the top functions printed.
+import atexit
+import math
+import signal
+import time
+from array import array
+
+POSE = 0
+GOAL = 1
+CONTROLLER = 2
+ACTUATION = 3
+LOGGING = 4
+TICK = 5
+STAGE_NAMES = ('pose transform', 'goal search', 'controller', 'actuation', 'logging', 'whole tick')
+
+
+class StageProfiler:
+    def __init__(self, keep=4096, profileTicks=100):
+        n = len(STAGE_NAMES)
+        self.keep = keep
+        self.count = [0] * n
+        self.total = [0.0] * n
+        self.min = [math.inf] * n
+        self.max = [0.0] * n
+        self.samples = [array('d', bytes(8 * keep)) for k in range(n)]
+        self.profileTicks = profileTicks
+        self._t0 = 0.0
+        self._last = 0.0
+        self._profile = None
+        self._profileLeft = 0
+        self._profileRequested = 0
+
+    def _record(self, stage, dt):
+        c = self.count[stage]
+        self.samples[stage][c % self.keep] = dt
+        self.count[stage] = c + 1
+        self.total[stage] += dt
+        if dt < self.min[stage]:
+            self.min[stage] = dt
+        if dt > self.max[stage]:
+            self.max[stage] = dt
+
+    # startTick - call first thing in a control tick
+    def startTick(self):
+        if self._profileRequested and self._profile is None:
+            import cProfile
+            self._profileLeft = self._profileRequested
+            self._profileRequested = 0
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+        self._t0 = self._last = time.perf_counter()
+
+    # mark - ends `stage`, which started at the previous mark
+    def mark(self, stage):
+        t = time.perf_counter()
+        self._record(stage, t - self._last)
+        self._last = t
+
+    # endTick - ends the logging stage and the tick
+    def endTick(self):
+        t = time.perf_counter()
+        self._record(LOGGING, t - self._last)
+        self._record(TICK, t - self._t0)
+        if self._profile is not None:
+            self._profileLeft -= 1
+            if self._profileLeft <= 0:
+                self._profile.disable()
+                self._saveProfile()
+
+    # requestProfile - cProfile the next n ticks (safe to call from a
+    # signal handler)
+    def requestProfile(self, n=None):
+        self._profileRequested = n or self.profileTicks
+
+    def _saveProfile(self):
+        import pstats
+        fname = 'trover_profile_%s.prof' % time.strftime('%Y%m%d_%H%M%S')
+        self._profile.dump_stats(fname)
+        print('Saved cProfile of %d ticks to %s' % (self.profileTicks, fname))
+        pstats.Stats(self._profile).sort_stats('cumulative').print_stats(15)
+        self._profile = None
+
+    # percentile - p (0-100) of the last `keep` samples of a stage
+    def percentile(self, stage, p):
+        n = min(self.count[stage], self.keep)
+        if n == 0:
+            return math.nan
+        s = sorted(self.samples[stage][:n])
+        return s[min(n - 1, int(math.ceil(p / 100.0 * n)) - 1)]
+
+    def report(self):
+        lines = ['%-15s %8s %9s %9s %9s %9s' % ('stage', 'n', 'min ms', 'mean ms', 'p99 ms', 'max ms')]
+        for k, name in enumerate(STAGE_NAMES):
+            n = self.count[k]
+            if n == 0:
+                continue
+            lines.append('%-15s %8d %9.3f %9.3f %9.3f %9.3f'
+                         % (name, n, self.min[k] * 1e3, self.total[k] / n * 1e3,
+                            self.percentile(k, 99) * 1e3, self.max[k] * 1e3))
+        return '\n'.join(lines)
+
+
+# installSignalHandlers - SIGUSR1 prints the report, SIGUSR2 starts a
+# cProfile of the next ticks, and the report is printed at exit.
+def installSignalHandlers(profiler):
+    def dump(sig, frame):
+        print(profiler.report())
+
+    def sample(sig, frame):
+        print('Profiling the next %d ticks...' % profiler.profileTicks)
+        profiler.requestProfile()
+
+    if hasattr(signal, 'SIGUSR1'):
+        signal.signal(signal.SIGUSR1, dump)
+        signal.signal(signal.SIGUSR2, sample)
+    atexit.register(lambda: print(profiler.report()))
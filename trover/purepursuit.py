@@ -0,0 +1,67 @@
+# purepursuit - the pure pursuit path following controller.
+import math
+
+pp_MaxTurnAngle = math.radians(14.5)  # degrees to avoid too large a PWM value
+
+
+# mysign - returns the sign of the variable x
+# (x should be a number!)
+def mysign(x):
+    if x < 0:
+        return -1
+    if x == 0:
+        return 0
+    if x > 0:
+        return 1
+
+# myrem - returns the remainder of the variable x % y
+# (x and y should be a number!)
+def myrem(x, y):
+    w = 0
+    if x / y < 0:
+        w = math.floor(x / y) + 1
+    else:
+        w = math.floor(x / y)
+    return x - y * w
+
+# purePursuit - This is the core controller of T-Rover
+# Don't change anything here unless you know what you are doing!
+# pose is (x, y, heading in radians), (lx, ly) the goal point and d its
+# distance. The turn angle saturates at maxTurnAngle (radians).
+def purePursuit(pose, lx, ly, d, maxTurnAngle=pp_MaxTurnAngle):
+    speedval = 1
+    # local variables
+    theta = pose[2]  # car heading relative to world x-axis (i.e., Magnetic East)
+    beta = math.atan2((ly - pose[1]), (lx - pose[0]))  # direction in radians to goal point
+
+    if abs(theta - beta) < .000001:
+        gamma = 0
+    else:
+        gamma = theta - beta  # direction in radians to goal point in car's local coordinate where positive is right
+
+    x_offset = d * math.sin(gamma) * -1
+    y_offset = d * math.cos(gamma)
+    turnangle = (2 * x_offset) / (d ** 2)
+
+    thesign = mysign((math.sin(pose[2]) * (lx - pose[0])) - (math.cos(pose[2]) * (ly - pose[1])))
+    turnangle = thesign * turnangle
+
+    # Ensure the turn control saturates at MaxTurnAngle defined by servo
+    if abs(turnangle) > maxTurnAngle:
+        turnangle = thesign * maxTurnAngle
+
+    turnangle = myrem(turnangle, 2 * math.pi)
+    return turnangle, speedval
+
+# findGoalPoint - finds the farthest smoothed waypoint that is within L of
+# (x, y), scanning back from the end of the route (from end, if given, so
+# only the points before it). Returns the goal point, its distance and its
+# index in the route.
+def findGoalPoint(sxx, syy, x, y, L, end=None):
+    for i in range((len(sxx) if end is None else min(end, len(sxx))) - 1, -1, -1):
+        goal_x = sxx[i]  # W[0]
+        goal_y = syy[i]  # W[1]
+        d = math.sqrt((goal_x - x) ** 2 + (goal_y - y) ** 2)
+        if d <= L:
+            break
+    return goal_x, goal_y, d, i
@@ -0,0 +1,322 @@
+#!/usr/bin/env python3
+# replay - serves a recorded NMEA log on a local TCP port.
+#
+# This is a stand-in for the "USB Serial Port to TCP/IP Socket" app that
+# termux_trover.py connects to on the phone (192.0.0.2:1236). Point the
+# UsbBridge_IP_Address/UsbBridge_Port lines of termux_trover_conf.txt at
+# this server and the bridge, the Wi-Fi UDP link and the Raspberry Pi
+# controller can all be run end to end on one Linux box.
+#
+# Usage:
+#   python3 -m trover.replay field_day.nmea                 # real time
+#   python3 -m trover.replay field_day.nmea --speed 20      # 20x
+#   python3 -m trover.replay field_day.nmea --speed max     # no waiting
+#   python3 -m trover.replay --from-track ccsvtrack.txt --rate 10
+#
+# Sentences are grouped into epochs by their UTC time field and each epoch
+# is sent at its original offset from the first one (divided by --speed).
+# The optional faults mimic what the real bridge does to the stream:
+#   --split-prob   an epoch is cut at a random byte and sent in two TCP
+#                  writes, so a sentence straddles two recv() calls
+#   --corrupt-prob a character of a sentence is changed, so its checksum fails
+#   --gap-prob     the receiver drops out for --gap-seconds of log time
+# --restamp rewrites the UTC time of every sentence to the time it is sent,
+# which is what the latency tracer (trover/trace.py) needs to measure the
+# receiver->phone stage of a replayed log.
+import argparse
+import math
+import random
+import socket
+import sys
+import time
+
+# Talkers/sentences that carry a UTC time in field 1
+TIMED_SENTENCES = ('GGA', 'RMC', 'GLL', 'ZDA', 'GNS', 'GST')
+
+
+# nmeaChecksum - returns the two hex digit checksum of the text between
+# '$' and '*' of an NMEA sentence.
+def nmeaChecksum(body):
+    cs = 0
+    for ch in body:
+        cs ^= ord(ch)
+    return '%02X' % cs
+
+
+# sentenceTime - returns the UTC time of day (seconds) of an NMEA sentence,
+# or None if the sentence has no time field.
+def sentenceTime(sentence):
+    fields = sentence.split(',')
+    if len(fields) < 2 or len(fields[0]) < 6:
+        return None
+    if fields[0][3:6] not in TIMED_SENTENCES:
+        return None
+    hhmmss = fields[1]
+    if len(hhmmss) < 6:
+        return None
+    try:
+        return int(hhmmss[0:2]) * 3600 + int(hhmmss[2:4]) * 60 + float(hhmmss[4:])
+    except ValueError:
+        return None
+
+
+# loadEpochs - reads an NMEA log and groups its sentences into epochs.
+# Returns a list of (t, text) where t is the log time in seconds from the
+# first epoch and text is every sentence of the epoch, CRLF terminated.
+# Lines that are not NMEA (e.g. a timestamp prefix from a logger) are
+# trimmed up to the '$'.
+def loadEpochs(fname):
+    epochs = []
+    t0 = None
+    day = 0.0
+    lastT = None
+    current = []
+    currentT = 0.0
+    f = open(fname, "r", errors="replace")
+    for line in f:
+        start = line.find('$')
+        if start < 0:
+            continue
+        sentence = line[start:].strip()
+        t = sentenceTime(sentence)
+        if t is not None:
+            if lastT is not None and t < lastT - 43200:
+                day += 86400  # midnight rollover
+            lastT = t
+            t = t + day
+            if t0 is None:
+                t0 = t
+            if current and t - t0 != currentT:
+                epochs.append((currentT, ''.join(current)))
+                current = []
+            currentT = t - t0
+        current.append(sentence + '\r\n')
+    f.close()
+    if current:
+        epochs.append((currentT, ''.join(current)))
+    return epochs
+
+
+# synthesizeEpochs - builds RMC+GGA epochs that drive along a route file
+# (any format trover/ingest.py reads; axisOrder for a CSV track) at a
+# constant speed. Handy when no recorded NMEA log exists for a route.
+def synthesizeEpochs(fname, rate=10.0, speed=1.5, axisOrder='auto'):
+    from trover import ingest
+    pts = ingest.loadRoute(fname, None, axisOrder)
+
+    epochs = []
+    dt = 1.0 / rate
+    t = 0.0
+    i = 0
+    lat, lon = pts[0]
+    course = 0.0
+    while i < len(pts) - 1:
+        # local flat-earth step towards the next track point
+        tlat, tlon = pts[i + 1]
+        dn = (tlat - lat) * 111320.0
+        de = (tlon - lon) * 111320.0 * math.cos(math.radians(lat))
+        dist = math.hypot(dn, de)
+        step = speed * dt
+        if dist <= step:
+            lat, lon = tlat, tlon
+            i += 1
+            if dist == 0:
+                continue
+        else:
+            lat += dn / dist * step / 111320.0
+            lon += de / dist * step / (111320.0 * math.cos(math.radians(lat)))
+        if dist > 0:
+            course = math.degrees(math.atan2(de, dn)) % 360
+        epochs.append((t, epochText(t, lat, lon, course, speed)))
+        t += dt
+    return epochs
+
+
+# epochText - formats one RMC+GGA epoch. RMC comes first because the
+# bridge builds its datagram as "heading,lat,lon" in arrival order.
+def epochText(t, lat, lon, course, speed):
+    hh = int(t // 3600) % 24
+    mm = int(t // 60) % 60
+    ss = t % 60
+    utc = '%02d%02d%05.2f' % (hh, mm, ss)
+    latDeg = int(abs(lat))
+    lonDeg = int(abs(lon))
+    latStr = '%02d%010.7f' % (latDeg, (abs(lat) - latDeg) * 60)
+    lonStr = '%03d%010.7f' % (lonDeg, (abs(lon) - lonDeg) * 60)
+    ns = 'N' if lat >= 0 else 'S'
+    ew = 'E' if lon >= 0 else 'W'
+    knots = speed / 0.514444
+    rmc = 'GPRMC,%s,A,%s,%s,%s,%s,%.3f,%.2f,010120,,,A' % (utc, latStr, ns, lonStr, ew, knots, course)
+    gga = 'GPGGA,%s,%s,%s,%s,%s,4,12,0.60,300.0,M,-31.0,M,1.0,0000' % (utc, latStr, ns, lonStr, ew)
+    return '$%s*%s\r\n$%s*%s\r\n' % (rmc, nmeaChecksum(rmc), gga, nmeaChecksum(gga))
+
+
+# corruptText - changes one character inside one sentence of an epoch
+# (never the '$', '*' or line ending) so its checksum no longer matches.
+def corruptText(text, rng):
+    sentences = text.split('\r\n')
+    k = rng.randrange(max(1, len(sentences) - 1))
+    s = sentences[k]
+    star = s.find('*')
+    if star > 2:
+        pos = rng.randrange(1, star)
+        ch = s[pos]
+        new = 'X' if ch != 'X' else 'Y'
+        sentences[k] = s[:pos] + new + s[pos + 1:]
+    return '\r\n'.join(sentences)
+
+
+# restampText - replaces the UTC time field of every timed sentence of an
+# epoch with the UTC time `now` (Unix time) and fixes up the checksums.
+def restampText(text, now):
+    # round once, so a fraction that rounds up carries into the seconds
+    cs = int(round(now * 100))
+    utc = time.strftime('%H%M%S', time.gmtime(cs // 100)) + '.%02d' % (cs % 100)
+    out = []
+    for sentence in text.split('\r\n'):
+        if sentenceTime(sentence) is not None:
+            star = sentence.find('*')
+            fields = sentence[1:star if star > 0 else len(sentence)].split(',')
+            fields[1] = utc
+            body = ','.join(fields)
+            sentence = '$%s*%s' % (body, nmeaChecksum(body))
+        out.append(sentence)
+    return '\r\n'.join(out)
+
+
+# ReplayStats - counts of what was sent to the client.
+class ReplayStats:
+    def __init__(self):
+        self.epochs = 0
+        self.bytes = 0
+        self.splits = 0
+        self.corrupted = 0
+        self.dropped = 0
+
+
+# replay - sends epochs to a connected socket. speed is the replay factor
+# (0 = as fast as possible). Returns a ReplayStats.
+def replay(conn, epochs, speed=1.0, splitProb=0.0, corruptProb=0.0,
+           gapProb=0.0, gapSeconds=2.0, seed=None, restamp=False):
+    rng = random.Random(seed)
+    stats = ReplayStats()
+    gapUntil = -1.0
+    tStart = time.monotonic()
+    for t, text in epochs:
+        if t < gapUntil:
+            stats.dropped += 1
+            continue
+        if gapProb > 0 and rng.random() < gapProb:
+            gapUntil = t + gapSeconds
+            stats.dropped += 1
+            continue
+        if speed > 0:
+            wait = tStart + t / speed - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+        if restamp:
+            text = restampText(text, time.time())
+        if corruptProb > 0 and rng.random() < corruptProb:
+            text = corruptText(text, rng)
+            stats.corrupted += 1
+        data = text.encode('ascii')
+        if splitProb > 0 and len(data) > 1 and rng.random() < splitProb:
+            cut = rng.randrange(1, len(data))
+            conn.sendall(data[:cut])
+            # give the reader a chance to see the first half on its own
+            time.sleep(0.002)
+            conn.sendall(data[cut:])
+            stats.splits += 1
+        else:
+            conn.sendall(data)
+        stats.epochs += 1
+        stats.bytes += len(data)
+    return stats
+
+
+# replaySpeed - the --speed argument: a replay factor, or "max" (0) for
+# no waiting
+def replaySpeed(text):
+    if text == 'max':
+        return 0.0
+    try:
+        speed = float(text)
+    except ValueError:
+        speed = -1.0
+    if not speed > 0:
+        raise argparse.ArgumentTypeError('must be a positive number or "max", not "%s"' % text)
+    return speed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Serve a recorded NMEA log on a TCP port.')
+    parser.add_argument('nmeafile', nargs='?', help='recorded NMEA log')
+    parser.add_argument('--from-track', help='synthesize NMEA along a route file (CSV, GPX, KML or NMEA) instead')
+    parser.add_argument('--axis-order', choices=('auto', 'latlon', 'lonlat'), default='auto', help='column order of a CSV --from-track')
+    parser.add_argument('--rate', type=float, default=10.0, help='fix rate (Hz) for --from-track')
+    parser.add_argument('--track-speed', type=float, default=1.5, help='rover speed (m/s) for --from-track')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=1236)
+    parser.add_argument('--speed', type=replaySpeed, default=1.0, help='replay factor, e.g. 1, 10 or "max"')
+    parser.add_argument('--loop', action='store_true', help='start over at the end of the log')
+    parser.add_argument('--split-prob', type=float, default=0.0)
+    parser.add_argument('--corrupt-prob', type=float, default=0.0)
+    parser.add_argument('--gap-prob', type=float, default=0.0)
+    parser.add_argument('--gap-seconds', type=float, default=2.0)
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--restamp', action='store_true', help='rewrite sentence times to the current UTC time')
+    args = parser.parse_args(argv)
+
+    if args.from_track:
+        try:
+            epochs = synthesizeEpochs(args.from_track, args.rate, args.track_speed, args.axis_order)
+        except (OSError, ValueError) as e:
+            print('Could not load the route: %s' % e)
+            return 1
+    elif args.nmeafile:
+        try:
+            epochs = loadEpochs(args.nmeafile)
+        except OSError as e:
+            print('Could not read the log: %s' % e)
+            return 1
+    else:
+        parser.error('give an NMEA log or --from-track')
+    if not epochs:
+        print('No NMEA sentences found.')
+        return 1
+    speed = args.speed
+    print('Loaded %d epochs (%.1f s of log time).' % (len(epochs), epochs[-1][0]))
+
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    server.bind((args.host, args.port))
+    server.listen(1)
+    print('Serving NMEA on %s:%d ...' % (args.host, args.port))
+    try:
+        while True:
+            conn, addr = server.accept()
+            conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            print('Client connected from %s:%d' % addr)
+            try:
+                while True:
+                    t0 = time.monotonic()
+                    stats = replay(conn, epochs, speed, args.split_prob, args.corrupt_prob,
+                                   args.gap_prob, args.gap_seconds, args.seed, args.restamp)
+                    elapsed = time.monotonic() - t0
+                    print('Sent %d epochs, %d bytes in %.2f s (%d split, %d corrupted, %d dropped)'
+                          % (stats.epochs, stats.bytes, elapsed, stats.splits, stats.corrupted, stats.dropped))
+                    if not args.loop:
+                        break
+            except (BrokenPipeError, ConnectionResetError):
+                print('Client disconnected.')
+            conn.close()
+            if not args.loop:
+                break
+    except KeyboardInterrupt:
+        print('done')
+    server.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
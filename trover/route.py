@@ -0,0 +1,131 @@
+# route - loading and preparing the GPS waypoints T-Rover follows.
+#
+# A route goes through three steps: the coarse [lat, lon] waypoints are
+# read from a file (trover/ingest.py, loadRoute), projected to UTM
+# (projectWaypoints) and linearly interpolated every `spacing` metres
+# (smoothWaypoints), or more sparsely on straights than in turns
+# (densifyWaypoints). The last two are plain Python lists, which the
+# control loop searches without NumPy.
+import math
+
+from trover.geo import deg2utm
+
+spacingBetweenCoarseWaypoints = 0.05  # 6 inches
+
+
+# projectWaypoints - converts coarse [lat, lon] waypoints to a list of
+# [x, y, utmzone] UTM waypoints.
+def projectWaypoints(waypoints):
+    waypoints_utm = []
+    for i in range(len(waypoints)):
+        [txx, tyy, tuu] = deg2utm(waypoints[i][0], waypoints[i][1])
+        waypoints_utm.append([txx, tyy, tuu])
+    return waypoints_utm
+
+# smoothWaypoints - smooth utm waypoints for T-Rover to follow.
+# This function takes in the coarse utm waypoints and outputs
+# linearly interpolated waypoints which improves T-Rover performance.
+# wp_utm is the projectWaypoints list (or the old string array of it).
+def smoothWaypoints(wp_utm, spacing):
+    la = [float(p[0]) for p in wp_utm]
+    lo = [float(p[1]) for p in wp_utm]
+    utmz = wp_utm[1][2]
+    wla = []
+    wlo = []
+    u = []
+    for i in range(len(la) - 1):
+        x2 = la[i + 1]
+        y2 = lo[i + 1]
+        x1 = la[i]
+        y1 = lo[i]
+
+        d = math.sqrt((x2 - x1) ** 2 + (y2 - y1) ** 2)
+        if d == 0:
+            continue  # repeated waypoint, nothing to fill in
+        num_points_that_fit = math.ceil(d / spacing)
+        vdx = (x2 - x1) / d * spacing
+        vdy = (y2 - y1) / d * spacing
+        for k in range(int(num_points_that_fit)):
+            wla.append(x1 + vdx * k)
+            wlo.append(y1 + vdy * k)
+            u.append(utmz)
+
+    wla.append(la[len(la) - 1])
+    wlo.append(lo[len(lo) - 1])
+    u.append(utmz)
+    return wla, wlo, u
+
+# routeCurvature - signed curvature (1/m, positive turning left) at every
+# point of a polyline: the turning angle at the point over the mean length
+# of the two segments meeting there, i.e. the curvature of the arc the
+# polyline approximates. The two ends get 0.
+def routeCurvature(xs, ys):
+    n = len(xs)
+    kappa = [0.0] * n
+    for i in range(1, n - 1):
+        ax = xs[i] - xs[i - 1]
+        ay = ys[i] - ys[i - 1]
+        bx = xs[i + 1] - xs[i]
+        by = ys[i + 1] - ys[i]
+        la = math.hypot(ax, ay)
+        lb = math.hypot(bx, by)
+        if la == 0 or lb == 0:
+            continue
+        phi = math.atan2(ax * by - ay * bx, ax * bx + ay * by)
+        kappa[i] = 2 * phi / (la + lb)
+    return kappa
+
+# densifyWaypoints - curvature adaptive alternative to smoothWaypoints.
+# Every coarse waypoint is kept, so the route is the same polyline, and
+# each segment is filled in evenly at a spacing of
+#
+#   sqrt(8 * chordError / curvature)
+#
+# (the chord length whose sagitta on an arc of that curvature is
+# chordError), taking the larger curvature of the segment's two ends and
+# clamping to [minSpacing, L * maxFraction]. Turns get points every few
+# centimetres, straights every L/10 by default, which keeps the goal point
+# findGoalPoint picks within L/10 of the lookahead circle. Returns
+# (x, y, utmzone, curvature) lists; x and y are what findGoalPoint takes
+# and curvature is interpolated from routeCurvature for every point.
+def densifyWaypoints(wp_utm, L, chordError=0.01, minSpacing=spacingBetweenCoarseWaypoints, maxFraction=0.1):
+    la = []
+    lo = []
+    for p in wp_utm:
+        x, y = float(p[0]), float(p[1])
+        if la and x == la[-1] and y == lo[-1]:
+            continue  # repeated waypoint
+        la.append(x)
+        lo.append(y)
+    utmz = wp_utm[1][2]
+    kappa = routeCurvature(la, lo)
+    maxSpacing = max(minSpacing, L * maxFraction)
+    wla = []
+    wlo = []
+    u = []
+    curv = []
+    for i in range(len(la) - 1):
+        x1 = la[i]
+        y1 = lo[i]
+        dx = la[i + 1] - x1
+        dy = lo[i + 1] - y1
+        k = max(abs(kappa[i]), abs(kappa[i + 1]))
+        if k > 0:
+            spacing = min(maxSpacing, max(minSpacing, math.sqrt(8 * chordError / k)))
+        else:
+            spacing = maxSpacing
+        n = int(math.ceil(math.hypot(dx, dy) / spacing))
+        k1 = kappa[i]
+        dk = kappa[i + 1] - k1
+        for j in range(n):
+            f = j / n
+            wla.append(x1 + dx * f)
+            wlo.append(y1 + dy * f)
+            u.append(utmz)
+            curv.append(k1 + dk * f)
+
+    wla.append(la[len(la) - 1])
+    wlo.append(lo[len(lo) - 1])
+    u.append(utmz)
+    curv.append(kappa[len(la) - 1])
+    return wla, wlo, u, curv
@@ -0,0 +1,111 @@
+# routefile - the memory mapped route files trover/pipeline.py writes.
+#
+# A route file is a 64 byte header followed by one 12 byte record per
+# point of the smoothed route, all little endian:
+#
+#   header  b'TROVRTE2', uint64 number of points, the 8 byte UTM zone
+#           string, a 20 byte key of the source file and settings the
+#           route was built from, the origin x, y (float64) and the
+#           storage: b'f' float32 metres or b'i' int32 centimetres
+#   record  dx, dy from the origin (float32 or int32, see trover/compact.py
+#           for the precision of each), k (float32, curvature in 1/m)
+#
+# RouteWriter appends a chunk at a time by growing the file and writing
+# the chunk through a memory map of just the new part; MappedRoute maps a
+# finished file read only as a CompactRoute. Neither holds more than a
+# chunk of the route in memory, the rest stays in the page cache, so the
+# rover can follow a route of millions of points.
+import os
+import struct
+
+import numpy as np
+
+from trover import compact
+
+MAGIC = b'TROVRTE2'
+HEADER = struct.Struct('<8sQ8s20sddc3x')
+STORAGE_CODES = {'float32': b'f', 'int32': b'i'}
+RECORDS = {'float32': np.dtype([('dx', '<f4'), ('dy', '<f4'), ('k', '<f4')]),
+           'int32': np.dtype([('dx', '<i4'), ('dy', '<i4'), ('k', '<f4')])}
+
+
+# RouteWriter - builds a route file chunk by chunk. The points go to
+# fname + '.part', which close() renames to fname once the header is
+# complete, so an interrupted build never leaves a route file behind.
+class RouteWriter:
+    def __init__(self, fname, zone, origin, storage='float32', key=b''):
+        self.fname = fname
+        self.zone = zone
+        self.origin = origin
+        self.storage = storage
+        self.record = RECORDS[storage]
+        self.key = key
+        self.count = 0
+        self.f = open(fname + '.part', 'w+b')
+        self.f.write(self.header())
+
+    def header(self):
+        return HEADER.pack(MAGIC, self.count, self.zone.encode('ascii'), self.key,
+                           self.origin[0], self.origin[1], STORAGE_CODES[self.storage])
+
+    # append - adds the points (UTM x, y and curvature k) of one chunk
+    def append(self, x, y, k):
+        n = len(x)
+        if n == 0:
+            return
+        dx, dy = compact.encode(x, y, self.origin, self.storage)
+        offset = HEADER.size + self.count * self.record.itemsize
+        self.f.truncate(offset + n * self.record.itemsize)
+        m = np.memmap(self.f, dtype=self.record, mode='r+', offset=offset, shape=(n,))
+        m['dx'] = dx
+        m['dy'] = dy
+        m['k'] = k
+        m.flush()
+        del m
+        self.count += n
+
+    # close - writes the header and puts the file in place
+    def close(self):
+        self.f.seek(0)
+        self.f.write(self.header())
+        self.f.close()
+        os.replace(self.fname + '.part', self.fname)
+
+    # discard - drops a build that failed
+    def discard(self):
+        self.f.close()
+        os.remove(self.fname + '.part')
+
+
+# readHeader - dict of the header fields of a route file (count, zone,
+# key, origin, storage); raises ValueError if fname is not a complete
+# route file
+def readHeader(fname):
+    f = open(fname, 'rb')
+    head = f.read(HEADER.size)
+    f.close()
+    if len(head) < HEADER.size or head[:len(MAGIC)] != MAGIC:
+        raise ValueError('%s: not a route file (or one of an older version)' % fname)
+    magic, count, zone, key, x0, y0, code = HEADER.unpack(head)
+    storage = [s for s in STORAGE_CODES if STORAGE_CODES[s] == code]
+    if not storage:
+        raise ValueError('%s: unknown route storage %r' % (fname, code))
+    if os.path.getsize(fname) != HEADER.size + count * RECORDS[storage[0]].itemsize:
+        raise ValueError('%s: route file is truncated' % fname)
+    return {'count': count, 'zone': zone.rstrip(b'\0').decode('ascii'), 'key': key,
+            'origin': (x0, y0), 'storage': storage[0]}
+
+
+# MappedRoute - a route file mapped read only, a CompactRoute whose dx, dy
+# and k arrays are backed by the file
+class MappedRoute(compact.CompactRoute):
+    def __init__(self, fname):
+        h = readHeader(fname)
+        if h['count'] < 2:
+            raise ValueError('%s: route file has %d points, need at least 2' % (fname, h['count']))
+        self.fname = fname
+        self.key = h['key']
+        self.records = np.memmap(fname, dtype=RECORDS[h['storage']], mode='r', offset=HEADER.size,
+                                 shape=(h['count'],))
+        compact.CompactRoute.__init__(self, h['origin'], self.records['dx'], self.records['dy'],
+                                      self.records['k'], h['zone'], h['storage'])
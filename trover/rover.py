@@ -0,0 +1,924 @@
+# rover - the T-Rover controller that runs on the Raspberry Pi.
+#
+# Importing this module does nothing but define things: the config is read,
+# the servo created, the socket bound and the route compiled by run(),
+# which raspberrypi_trover.py calls. NumPy is required: every route file
+# is read with trover/ingest.py. The control loop itself needs only the
+# standard library, so NumPy is imported after the GPS socket is open,
+# while the phone acquires its first fix, and gpiozero, netifaces, the
+# simulator, the metrics server, the Kalman filter (trover/ekf.py) and the
+# IMU stream (trover/imustream.py) only when the config asks for them.
+import threading
+import functools
+import math
+import time
+import socket
+import signal
+import sys
+from trover import config
+from trover import hardware
+from trover import trace
+from trover import profiling
+from trover import latency
+from trover.geo import deg2utm
+from trover.purepursuit import purePursuit, findGoalPoint
+from trover.route import projectWaypoints, smoothWaypoints, densifyWaypoints
+
+# Settings of raspberrypi_trover_conf.txt: (key, type, default, help).
+# Any of them can also be given on the command line as key=value (see
+# trover/config.py).
+OPTIONS = (
+    ('L', float, 3.0, 'look ahead distance (m)', config.POSITIVE),
+    ('waypointsfname', str, 'waypoints.txt', 'route file: CSV, GPX, KML or NMEA log (see trover/ingest.py)'),
+    ('routeformat', str, 'auto', 'auto, csv, gpx, kml or nmea'),
+    ('axisorder', str, 'auto', 'column order of a CSV route: auto, latlon or lonlat'),
+    ('bindaddress', str, 'wlan0', 'interface name, IP address or "any" to receive GPS on'),
+    ('servobackend', str, 'gpio', 'gpio, mock or sim (see trover/hardware.py)'),
+    ('trace', int, 0, '1 = fix-to-servo latency tracing (see trover/trace.py)'),
+    ('profile', int, 0, '1 = per-stage control loop timers (see trover/profiling.py)'),
+    ('metricsport', int, 0, 'local HTTP port for live metrics, 0 = off (see trover/metrics.py)'),
+    ('goalradius', float, 1.0, 'stop this close to the end of the route (m)', config.NON_NEGATIVE),
+    ('spacing', float, 0.05, 'spacing of the smoothed route (m), the smallest spacing when densify = adaptive'),
+    ('densify', str, 'uniform', 'uniform (every spacing m) or adaptive (by curvature, see trover/route.py)'),
+    ('chorderror', float, 0.01, 'largest sagitta between adaptive route points (m)'),
+    ('simplify', float, 0.0, 'simplify the route to this tolerance (m) before smoothing, 0 = off (see trover/simplify.py)'),
+    ('routestorage', str, 'lists', 'lists, or float32 / int32 offsets from an origin to save memory (see trover/compact.py)'),
+    ('routefile', str, '', 'compile the route into this memory mapped file and follow it from there, for very long routes (see trover/pipeline.py)'),
+    ('maxturnangle', float, 14.5, 'steering limit (degrees)', config.upTo(45.0)),
+    ('speedprofile', int, 0, '1 = drive the throttle from a planned speed profile (see trover/speedprofile.py)'),
+    ('maxspeed', float, 2.0, 'speed limit of the profile (m/s)'),
+    ('lataccel', float, 1.0, 'largest sideways acceleration in turns (m/s^2)'),
+    ('longaccel', float, 0.5, 'largest acceleration and braking (m/s^2)'),
+    ('minspeed', float, 0.5, 'slowest planned speed (m/s)'),
+    ('topspeed', float, 4.0, 'speed at full throttle (m/s)', config.POSITIVE),
+    ('throttlepin', int, 19, 'GPIO pin of the ESC'),
+    ('controlrate', float, 10.0, 'control loop rate (Hz)', config.POSITIVE),
+    ('estimator', str, 'fix', 'fix (steer on the last GPS fix) or ekf (GPS and gyroscope Kalman filter, see trover/ekf.py)'),
+    ('gpssigma', float, 1.0, 'GPS position error for the ekf estimator, 1 sigma (m)'),
+    ('fixgate', int, 0, '1 = drop fixes with a bad GGA quality, HDOP or satellite count, or farther than the rover can have driven (see trover/fixgate.py)'),
+    ('maxhdop', float, 5.0, 'largest HDOP of a fix the gate accepts'),
+    ('minsats', int, 4, 'fewest satellites of a fix the gate accepts'),
+    ('imuport', int, 0, 'UDP port the phone streams its IMU sensors to, 0 = no IMU'),
+    ('imuyawaxis', str, 'x', 'phone gyroscope axis pointing up: x, y or z, with a - if it points down'),
+    ('heading', str, 'course', 'course (the GPS course, 90 until the rover moves) or fused (course, magnetometer and gyroscope, see trover/heading.py)'),
+    ('imuforwardaxis', str, '-z', 'phone axis pointing to the front of the rover, like imuyawaxis'),
+    ('declination', float, 0.0, 'magnetic declination (degrees, East positive)'),
+    ('coursespeed', float, 0.5, 'slowest speed the GPS course is trusted at with heading = fused (m/s)'),
+    ('magcal', str, '', 'magnetometer calibration file written by python3 -m trover.magcal, empty = raw magnetometer'),
+    ('trackcourse', int, 0, '1 = work out course and speed from the last fixes when a datagram has no course, e.g. from a GGA only bridge (see trover/track.py)'),
+    ('trackwindow', float, 1.0, 'seconds of fixes the course is fitted to with trackcourse = 1'),
+    ('trackmindistance', float, 0.5, 'distance the rover must cover in trackwindow before it has a course (m)'),
+    ('mapmatch', int, 0, '1 = match the pose onto the route and search for the goal point only ahead of the match, for routes that pass near themselves (see trover/mapmatch.py)'),
+    ('matchradius', float, 5.0, 'farthest the pose can be from the route and still be matched (m)'),
+    ('matchbeta', float, 2.0, 'how far (m) the route progress may differ from the distance driven before a match is unlikely'),
+    ('crosstrack', int, 0, '1 = score every tick against the route: cross-track error, progress and heading error, with running statistics in the metrics and at the end of the run (see trover/crosstrack.py)'),
+    ('latencycomp', int, 0, '1 = steer for where the rover will be when the servo moves (see trover/latency.py)'),
+    ('gpsdelay', float, 0.0, 'time from a fix being measured to it reaching the RPi (s), measured instead with trace = 1'),
+    ('servodelay', float, 0.05, 'time from a servo command to the wheels turning (s)'),
+    ('gpsport', int, 20001, 'UDP port the phone sends GPS to'),
+    ('reloadinterval', float, 1.0, 'seconds between checks of the config file for edits, 0 = SIGHUP only'),
+)
+# Settings a running rover picks up when the config file changes or on
+# SIGHUP; the rest need a restart.
+RELOADABLE = ('L', 'controlrate', 'goalradius', 'maxturnangle', 'topspeed')
+
+conf = config.defaults(OPTIONS)
+confFile = "raspberrypi_trover_conf.txt"
+confOverrides = []  # (key, text) from the command line, kept for reloads
+# Settings used at startup, overridden by loadConfig()
+thiswaypointsfname = conf['waypointsfname']
+thisrouteformat = conf['routeformat']
+thisaxisorder = conf['axisorder']
+thisbindaddress = conf['bindaddress']
+thisservobackend = conf['servobackend']
+thistrace = conf['trace']
+thisprofile = conf['profile']
+thismetricsport = conf['metricsport']
+thisspacing = conf['spacing']
+thissimplify = conf['simplify']
+thisdensify = conf['densify']
+thischorderror = conf['chorderror']
+thisroutefile = conf['routefile']
+thisroutestorage = conf['routestorage']
+thisspeedprofile = conf['speedprofile']
+thisthrottlepin = conf['throttlepin']
+thisestimator = conf['estimator']
+thisimuport = conf['imuport']
+thisimuyawaxis = conf['imuyawaxis']
+thislatencycomp = conf['latencycomp']
+thisheading = conf['heading']
+thisimuforwardaxis = conf['imuforwardaxis']
+thistrackcourse = conf['trackcourse']
+thisreloadinterval = conf['reloadinterval']
+
+# loadConfig - reads raspberrypi_trover_conf.txt and the command line
+# settings into conf and the this* globals.
+def loadConfig(fname="raspberrypi_trover_conf.txt", overrides=()):
+    global conf, confFile, confOverrides, thiswaypointsfname, thisrouteformat, thisaxisorder, thisbindaddress, thisservobackend, thistrace, thisprofile, thismetricsport, thisspacing, thissimplify, thisdensify, thischorderror, thisroutefile, thisroutestorage, thisspeedprofile, thisthrottlepin, thisestimator, thisimuport, thisimuyawaxis, thislatencycomp, thisheading, thisimuforwardaxis, thistrackcourse, thisreloadinterval, localPort_gps, waypoints_file
+    print('Reading Configuration File: %s ...' % fname)
+    confFile = fname
+    confOverrides = list(overrides)
+    conf = config.loadConfig(fname, OPTIONS, confOverrides)
+    thiswaypointsfname = conf['waypointsfname']
+    thisrouteformat = conf['routeformat']
+    thisaxisorder = conf['axisorder']
+    thisbindaddress = conf['bindaddress']
+    thisservobackend = conf['servobackend']
+    thistrace = conf['trace']
+    thisprofile = conf['profile']
+    thismetricsport = conf['metricsport']
+    thisspacing = conf['spacing']
+    thissimplify = conf['simplify']
+    thisdensify = conf['densify']
+    thischorderror = conf['chorderror']
+    thisroutefile = conf['routefile']
+    thisroutestorage = conf['routestorage']
+    thisspeedprofile = conf['speedprofile']
+    thisthrottlepin = conf['throttlepin']
+    thisestimator = conf['estimator']
+    thisimuport = conf['imuport']
+    thisimuyawaxis = conf['imuyawaxis']
+    thislatencycomp = conf['latencycomp']
+    thisheading = conf['heading']
+    thisimuforwardaxis = conf['imuforwardaxis']
+    thistrackcourse = conf['trackcourse']
+    thisreloadinterval = conf['reloadinterval']
+    localPort_gps = conf['gpsport']
+    waypoints_file = thiswaypointsfname
+    applyTuning(conf)
+    print('Config loaded!')
+
+# applyTuning - sets the RELOADABLE settings
+def applyTuning(settings):
+    global L, goalRadius, maxTurnAngle, loopPeriod, topSpeed
+    L = settings['L']
+    goalRadius = settings['goalradius']
+    maxTurnAngle = math.radians(settings['maxturnangle'])
+    loopPeriod = 1.0 / settings['controlrate']
+    topSpeed = settings['topspeed']
+    if roverMetrics is not None:
+        roverMetrics.period = loopPeriod
+    # the fix gate and the simulated throttle were made with topspeed
+    if fixGate is not None:
+        fixGate.maxSpeed = topSpeed
+    if hasattr(throttle, 'topSpeed'):
+        throttle.topSpeed = topSpeed
+
+# reloadConfig - re-reads the config file mid-run. Only the RELOADABLE
+# settings take effect; the route is not touched.
+def reloadConfig():
+    try:
+        new = config.loadConfig(confFile, OPTIONS, confOverrides)
+    except (OSError, ValueError) as e:
+        print('Config not reloaded, keeping the previous settings: %s' % e)
+        return
+    changed = [k for k in RELOADABLE if new[k] != conf[k]]
+    ignored = [k for k in new if k not in RELOADABLE and new[k] != conf[k]]
+    for k in RELOADABLE:
+        conf[k] = new[k]
+    applyTuning(conf)
+    if 'L' in changed and speedPlanner is not None:
+        # the speed table looks back L; re-planned without stalling the loop
+        threading.Thread(name='replanSpeeds', target=replanSpeeds, args=(L,), daemon=True).start()
+    if changed:
+        print('Config reloaded: %s' % ', '.join('%s = %s' % (k, conf[k]) for k in changed))
+    if ignored:
+        print('Restart T-Rover to apply: %s' % ', '.join(ignored))
+    if not changed and not ignored:
+        print('Config reloaded, nothing changed.')
+
+servo = None  # created in main() from thisservobackend
+throttle = None  # created in main() with speedprofile = 1
+speedTable = None  # planned speed (m/s) of every route point
+speedPlanner = None  # speedTable for a given L, with speedprofile = 1
+
+# replanSpeeds - plans the speed table for the look ahead lookAhead and
+# swaps it in; the control loop reads the old one until then
+def replanSpeeds(lookAhead):
+    global speedTable
+    table = speedPlanner(lookAhead)
+    if lookAhead == L:
+        speedTable = table
+        print('Speed profile re-planned for L = %s' % lookAhead)
+waypoints_file = thiswaypointsfname  # Text File with GPS waypoints Lat, Long
+
+###############################
+# Pure Pursuit Config#
+###############################
+# Mapping and localization
+waypoints = []
+waypoints_utm = []
+goalSearch = findGoalPoint  # CompactRoute.findGoalPoint for a compact route, matchedGoalPoint with mapmatch = 1
+routeGoalSearch = findGoalPoint  # the goal search matchedGoalPoint falls back to
+mapMatcher = None  # mapmatch.MapMatcher with mapmatch = 1
+GOAL_WINDOW = 2.0  # L of route the goal point may move on per tick
+goalEnd = None  # the goal search only looks at the route before this index, None for all of it
+crossTrack = None  # crosstrack.CrossTrack with crosstrack = 1
+
+# Pure Pursuit Variables (set from conf by applyTuning)
+L = conf['L']  # meters
+goalRadius = conf['goalradius']  # meters
+maxTurnAngle = math.radians(conf['maxturnangle'])
+loopPeriod = 1.0 / conf['controlrate']  # seconds
+topSpeed = conf['topspeed']  # m/s at full throttle
+
+###############################
+# Wi-Fi Hotspot Connection from Phone to Raspberry Pi (RPi)#
+###############################
+# UDP from phone
+localPort_gps = conf['gpsport']  # The RPi will open this port for receiving GPS from phone.
+bufferSize = 1024
+
+sensorDict = {}
+sensorDict["compass"] = 90 # default
+
+######################
+# Getting GPS and Sensor from Phone
+######################
+UDPServerSocket_gps = None  # bound in main()
+UDPServerSocket_imu = None  # bound in main() when imuport is set
+imuStream = None  # imustream.ImuStream when imuport is set
+estimator = None  # ekf.PoseEkf with estimator = ekf
+compensator = None  # latency.LatencyCompensator with latencycomp = 1
+headingFilter = None  # heading.HeadingFilter with heading = fused
+trackHistory = None  # track.TrackHistory with trackcourse = 1
+magCalibration = None  # magcal.MagCalibration with a magcal file
+fixGate = None  # fixgate.FixGate with fixgate = 1
+clock = time.time  # the estimator's clock; the simulated rover's clock in sim
+yawAxis = (0, 1.0)  # index and sign of the gyroscope axis pointing up
+tracer = None  # trace.LatencyTracer when tracing is on
+profiler = None  # profiling.StageProfiler when profiling is on
+roverMetrics = None  # metrics.RoverMetrics when the metrics port is set
+firstFix = threading.Event()  # set by the listener when the first fix is decoded
+syncInterval = 1.0  # seconds between clock SYNC requests to the phone
+
+# openGpsSocket - binds the UDP socket the phone sends GPS to. bindAddress
+# is an interface name (the RPi's own address on it is used), an IP
+# address, or 'any'.
+def openGpsSocket(bindAddress, port=None):
+    if port is None:
+        port = localPort_gps
+    localIP = hardware.resolveBindAddress(bindAddress)
+    sock = socket.socket(family=socket.AF_INET, type=socket.SOCK_DGRAM)
+    sock.bind((localIP, port))
+    return sock
+
+# This function is called in a separate thread for listening
+# for incoming datagrams from the phone.
+def udpListener_gps(sensorDict, sock=None):
+    if sock is None:
+        sock = UDPServerSocket_gps
+    lastSync = 0
+    if tracer is not None:
+        trace.enableRecvTimestamps(sock)
+    while True:
+        if tracer is not None:
+            message, addr, tRecv = trace.recvfromStamped(sock, bufferSize)
+        else:
+            message, addr = sock.recvfrom(bufferSize)
+            tRecv = time.time()
+        if message.startswith(b'SYNC'):
+            # reply to our clock SYNC request: SYNC,t1,t2,t3
+            t = message.decode('utf-8').split(',')
+            if tracer is not None and len(t) == 4:
+                tracer.clock.addSample(float(t[1]), float(t[2]), float(t[3]), tRecv)
+            continue
+        try:
+            taken = decodeGpsDatagram(message, sensorDict, tRecv)
+        except (ValueError, IndexError):
+            # a garbled datagram must not kill the listener thread
+            if roverMetrics is not None:
+                roverMetrics.datagramsBad += 1
+            continue
+        if taken and not firstFix.is_set():
+            firstFix.set()
+        if compensator is not None and tracer is not None:
+            observeUpstream(sensorDict.get("trace"), tRecv)
+        if roverMetrics is not None:
+            fix = sensorDict.get("trace")
+            roverMetrics.fixReceived(tRecv, fix[0] if fix is not None and fix[4] == tRecv else None)
+        if tracer is not None and tRecv - lastSync > syncInterval:
+            sock.sendto(b'SYNC,%.6f' % time.time(), addr)
+            lastSync = tRecv
+        time.sleep(.05)
+
+# observeUpstream - feeds the fix -> Pi receive delay of a traced fix
+# received at tRecv to the latency compensator
+def observeUpstream(fix, tRecv):
+    if fix is None or fix[4] != tRecv or fix[1] is None or not tracer.clock.valid:
+        return
+    measured = tracer.clock.toLocal(trace.utcToEpoch(fix[1], fix[2]))
+    compensator.observeUpstream(tRecv - measured)
+
+GPS_DATAGRAM_FIELDS = (3, 6, 7, 10)  # heading,lat,lon; + quality,hdop,sats; + the four trace fields
+
+# decodeGpsDatagram - decodes a "heading,lat,lon" datagram from
+# the phone (trover/bridge.py) into sensorDict. The bridge adds the GGA fix
+# quality, HDOP and satellite count ("heading,lat,lon,quality,hdop,sats"),
+# kept in sensorDict["fixquality"]. Traced datagrams carry four more
+# fields at the end (trace id, NMEA UTC, phone receive and send time) which
+# are kept with the Pi receive time tRecv in sensorDict["trace"]; tRecv
+# itself is kept in sensorDict["fixtime"]. With fixGate a fix it rejects
+# leaves the fix, its course and time as they were; returns whether the
+# fix was taken. Any other number of fields, or a lat/lon out of range,
+# raises ValueError.
+def decodeGpsDatagram(message, sensorDict, tRecv=None):
+    sdata = message.decode('utf-8').split(',')
+    n = len(sdata)
+    if n not in GPS_DATAGRAM_FIELDS:
+        raise ValueError('GPS datagram with %d fields' % n)
+    gps = [float(sdata[1]), float(sdata[2])]
+    if not (-90.0 <= gps[0] <= 90.0 and -180.0 <= gps[1] <= 180.0):
+        raise ValueError('GPS fix out of range: %s, %s' % (sdata[1], sdata[2]))
+    if n in (7, 10):
+        nmeaUtc = None if sdata[n - 3] == 'None' else float(sdata[n - 3])
+        sensorDict["trace"] = (int(sdata[n - 4]), nmeaUtc, float(sdata[n - 2]), float(sdata[n - 1]), tRecv)
+    quality = None
+    if n in (6, 10):
+        quality = (optionalValue(int, sdata[3]), optionalValue(float, sdata[4]), optionalValue(int, sdata[5]))
+    if fixGate is not None and not acceptFix(gps, quality, time.time() if tRecv is None else tRecv):
+        return False
+    if tRecv is not None:
+        sensorDict["fixtime"] = tRecv
+    sensorDict["fixquality"] = quality
+    if sdata[0] == 'None':
+        sensorDict["course"] = None  # compass field not available until T-Rover moves
+    else:
+        sensorDict["compass"] = float(sdata[0])
+        sensorDict["course"] = sensorDict["compass"]
+    # last, so a reader that sees the new fix also sees its course
+    sensorDict["gps"] = gps
+    return True
+
+# optionalValue - text converted with cast, None for 'None' or nothing
+def optionalValue(cast, text):
+    if text in ('None', ''):
+        return None
+    return cast(text)
+
+# metric of each reason fixGate rejects a fix for
+REJECTION_METRICS = {'quality': 'fixesRejectedQuality', 'speed': 'fixesRejectedSpeed', 'innovation': 'fixesRejectedInnovation'}
+
+# acceptFix - runs a fix [lat, lon] measured at t with its quality through
+# fixGate. Returns False (and counts why in the metrics) if it is rejected.
+def acceptFix(gps, quality, t):
+    x, y, zone = deg2utm(gps[0], gps[1])
+    reason = fixGate.check(t, x, y, quality)
+    if reason is None:
+        return True
+    countRejectedFix(reason)
+    return False
+
+def countRejectedFix(reason):
+    if roverMetrics is not None:
+        name = REJECTION_METRICS[reason]
+        setattr(roverMetrics, name, getattr(roverMetrics, name) + 1)
+
+# parseYawAxis - (index, sign) of an imuyawaxis (or imuforwardaxis) setting
+# such as "x" or "-z"
+def parseYawAxis(text):
+    sign = -1.0 if text.startswith('-') else 1.0
+    axis = text.lstrip('+-')
+    if axis not in ('x', 'y', 'z'):
+        raise ValueError('phone axes must be x, y or z with an optional sign, not "%s"' % text)
+    return 'xyz'.index(axis), sign
+
+# This function is called in a separate thread for listening to the
+# phone's IMU sensor stream (trover/imustream.py). It drains every datagram
+# waiting, decodes them in one go into imuStream and sensorDict, and naps
+# for imustream.LISTEN_INTERVAL so the next wakeup has a batch to decode.
+def udpListener_imu(sensorDict, sock=None):
+    from trover import imustream
+    if sock is None:
+        sock = UDPServerSocket_imu
+    while True:
+        messages = imustream.drain(sock, bufferSize)
+        bad = imuStream.ingest(messages, sensorDict)
+        if roverMetrics is not None:
+            roverMetrics.imuDatagrams += len(messages)
+            roverMetrics.imuBatch = len(messages)
+            roverMetrics.imuDatagramsBad += bad
+        time.sleep(imustream.LISTEN_INTERVAL)
+
+# imuSample - a sensor's mean [x, y, z] over the last control period from
+# the IMU stream or, without one (the simulator), its newest sample;
+# "yawrate" is the gyroscope yaw rate (rad/s). None without samples.
+def imuSample(name):
+    if imuStream is None:
+        return sensorDict.get(name)
+    if name == "yawrate":
+        return imuStream.yawRate(loopPeriod)
+    return imuStream.mean(name, loopPeriod)
+
+lastFix = None  # sensorDict["gps"] the control loop saw last
+lastTrackFix = None  # sensorDict["gps"] trackCourse() saw last
+
+# trackCourse - adds a new fix to trackHistory and, if the fix came
+# without a course, fills in the course fitted to the last fixes.
+# sensorDict["trackspeed"] is the fitted speed.
+def trackCourse(now):
+    global lastTrackFix
+    gps = sensorDict["gps"]
+    if gps is lastTrackFix:
+        return
+    lastTrackFix = gps
+    x, y, zone = deg2utm(gps[0], gps[1])
+    trackHistory.add(sensorDict.get("fixtime", now), x, y)
+    course, speed = trackHistory.estimate()
+    sensorDict["trackspeed"] = speed
+    if course is not None and sensorDict.get("course") is None:
+        sensorDict["compass"] = math.degrees(course) % 360
+        sensorDict["course"] = sensorDict["compass"]
+
+# estimatePose - the estimator's pose (x, y, heading in radians) at time
+# now: moves the filter forward with the gyroscope and, if a fix arrived
+# since the last tick, corrects it with the fix and its course. With
+# latency compensation the fix is first moved forward from when it was
+# measured to now.
+def estimatePose(now):
+    global lastFix
+    ekf = estimator
+    gps = sensorDict["gps"]
+    fused = None if headingFilter is None else fuseHeading(now)
+    if not ekf.initialized:
+        x, y, zone = deg2utm(gps[0], gps[1])
+        course = sensorDict.get("course")
+        ekf.start(x, y, now, fused if course is None else math.radians(course))
+        lastFix = gps
+        return ekf.pose()
+    ekf.predict(now, imuSample("yawrate"))
+    if fused is not None:
+        # the fused heading has the course, the magnetometer and the gyroscope
+        ekf.updateHeading(fused)
+    if gps is not lastFix:
+        lastFix = gps
+        x, y, zone = deg2utm(gps[0], gps[1])
+        course = sensorDict.get("course")
+        if headingFilter is not None:
+            course = None  # in the fused heading already
+        elif course is not None:
+            course = math.radians(course)
+        if compensator is not None:
+            # drive the fix (and its course) from when it was measured to now
+            age = now - compensator.fixTime(sensorDict.get("fixtime", now))
+            yawRate = estimatedYawRate()
+            x, y, h = latency.advancePose(x, y, ekf.s[2] - yawRate * age, ekf.speed(), yawRate, age)
+            if course is not None:
+                course += yawRate * age
+        sigma = gate = None
+        if fixGate is not None:
+            quality = sensorDict.get("fixquality")
+            sigma = fixGate.sigmaOf(None if quality is None else quality[1])
+            gate = fixGate.innovationGate()
+        d2 = ekf.updatePosition(x, y, sigma, gate)
+        if fixGate is not None and not fixGate.observeInnovation(d2, gate):
+            countRejectedFix('innovation')
+        elif course is not None:
+            ekf.updateHeading(course)
+    return ekf.pose()
+
+# fuseHeading - the fused heading (radians) at time now from the latest
+# gyroscope, accelerometer and magnetometer samples and, on a new fix,
+# its course. None until there is a magnetometer sample or a course.
+def fuseHeading(now):
+    hf = headingFilter
+    yawRate = imuSample("yawrate")
+    accel = imuSample("accel")
+    if accel is not None and hf.t is not None:
+        hf.observeUp(accel, now - hf.t)
+    mag = sensorDict.get("mag")
+    hf.update(now, yawRate, None if mag is None else hf.magHeading(mag))
+    gps = sensorDict["gps"]
+    if gps is not hf.lastFix:
+        hf.lastFix = gps
+        x, y, zone = deg2utm(gps[0], gps[1])
+        tFix = sensorDict.get("fixtime", now)
+        course = sensorDict.get("course")
+        if course is not None:
+            course = math.radians(course)
+            if compensator is not None and yawRate is not None:
+                # turned on since it was measured
+                tFix = compensator.fixTime(tFix)
+                course += yawRate * (now - tFix)
+        hf.observeFix(tFix, x, y, course, sensorDict.get("trackspeed"))
+    return hf.heading
+
+# estimatedYawRate - the gyroscope yaw rate less the estimator's bias
+def estimatedYawRate():
+    yawRate = imuSample("yawrate")
+    if yawRate is None:
+        return 0.0
+    return yawRate - float(estimator.s[4])
+
+# compensateLatency - pose moved forward to when the servo will act on
+# this tick's command. pose is the estimator's pose at time now, or the
+# last fix.
+def compensateLatency(pose, now):
+    global lastFix
+    comp = compensator
+    if estimator is not None:
+        return comp.predict(pose, now, now, estimator.speed(), estimatedYawRate())
+    gps = sensorDict["gps"]
+    tFix = comp.fixTime(sensorDict.get("fixtime", now))
+    if gps is not lastFix:
+        lastFix = gps
+        comp.addFix(tFix, pose[0], pose[1], pose[2])
+    return comp.predict(pose, tFix, now)
+
+# matchedGoalPoint - the goal search with map matching: the pose is
+# matched onto the route and the goal point is searched for only on the
+# route ahead of the match. Off the route, or with the match beyond end,
+# it is routeGoalSearch.
+def matchedGoalPoint(sxx, syy, x, y, L, end=None):
+    if mapMatcher.step(x, y) is None:
+        return routeGoalSearch(sxx, syy, x, y, L, end)
+    goal = mapMatcher.goalPoint(x, y, L)
+    if end is not None and goal[3] >= end:
+        return routeGoalSearch(sxx, syy, x, y, L, end)
+    return goal
+
+# goalWindow - how many route points the goal point may move on per tick
+def goalWindow():
+    return int(GOAL_WINDOW * L / thisspacing) + 1
+
+######################
+# Pure Pursuit Controller
+######################
+
+# controlTick - one pass of the control loop: reads the latest pose from
+# sensorDict, picks the goal point, runs pure pursuit and writes the servo.
+# Returns the turn angle (degrees), the goal point distance and the
+# distance to the end of the route. With profiling on, the caller ends the
+# tick (and its logging stage) with profiler.endTick().
+def controlTick(sxx, syy, troverGoal):
+    global goalEnd
+    prof = profiler
+    if prof is not None:
+        prof.startTick()
+    tickStart = time.time()
+    now = clock()
+    fix = sensorDict.get("trace")
+    if trackHistory is not None:
+        trackCourse(now)
+    if estimator is not None:
+        # filtered pose, moved forward to this tick
+        pose = estimatePose(now)
+        rover_x, rover_y = pose[0], pose[1]
+    else:
+        # Obtain robot location and orientation, load into pose
+        rover_lat = sensorDict["gps"][0]  # gps lat
+        rover_lon = sensorDict["gps"][1]  # gps long
+        rover_heading_deg = sensorDict["compass"]  # heading angle from phone
+        rover_heading_rad = math.radians(rover_heading_deg)
+        [rover_x, rover_y, utmzone] = deg2utm(rover_lat, rover_lon)  # convert robot position from gps to utm
+        if headingFilter is not None:
+            fused = fuseHeading(now)
+            if fused is not None:
+                rover_heading_rad = fused
+        pose = (rover_x, rover_y, rover_heading_rad)
+    measured = pose
+    if compensator is not None:
+        # steer for where the rover will be, not where it was
+        pose = compensateLatency(pose, now)
+        rover_x, rover_y = pose[0], pose[1]
+
+    # Calculate distance to goal
+    distanceToGoal = math.hypot(rover_x - troverGoal[0], rover_y - troverGoal[1])
+    if prof is not None:
+        prof.mark(profiling.POSE)
+
+    # Find the next goal point within L (in utm coordinates)
+    goal_x, goal_y, d, goal_i = goalSearch(sxx, syy, rover_x, rover_y, L, goalEnd)
+    if goalEnd is not None:
+        goalEnd = max(goalEnd, goal_i + goalWindow())
+    if crossTrack is not None:
+        crossTrack.update(measured[0], measured[1], measured[2],
+                          mapMatcher.match[1] if mapMatcher is not None and mapMatcher.match is not None else None)
+    if prof is not None:
+        prof.mark(profiling.GOAL)
+
+    # Call pure pursuit and obtain turn angle
+    [turnAngle_rad, speedValue] = purePursuit(pose, goal_x, goal_y, d, maxTurnAngle)
+    turnAngle_deg = math.degrees(turnAngle_rad)
+    if prof is not None:
+        prof.mark(profiling.CONTROLLER)
+    servo.angle = -turnAngle_deg
+    if speedTable is not None:
+        # the plan already includes the turns between the rover and the goal point
+        speed = speedValue * float(speedTable[goal_i])
+        throttle.value = min(speed / topSpeed, 1.0)
+    if prof is not None:
+        prof.mark(profiling.ACTUATION)
+    if compensator is not None:
+        compensator.observeControl(clock() - now)
+    if tracer is not None and fix is not None:
+        tracer.recordTick(fix, tickStart, time.time())
+    m = roverMetrics
+    if m is not None:
+        m.fixPending = False
+        m.distanceToGoal = distanceToGoal
+        m.routeIndex = goal_i
+        m.turnAngle = turnAngle_deg
+        if speedTable is not None:
+            m.commandedSpeed = speed
+        if compensator is not None:
+            m.latencyHorizon = compensator.horizon
+        if mapMatcher is not None and mapMatcher.match is not None:
+            m.matchedProgress = mapMatcher.match[0]
+            m.matchedDistance = mapMatcher.match[4]
+        if crossTrack is not None:
+            c = crossTrack.crossTrackStats
+            m.crossTrackError = crossTrack.crossTrack
+            m.crossTrackRms = c.rms()
+            m.crossTrackMax = c.max
+            m.crossTrackP95 = c.percentile(95)
+            m.routeProgress = crossTrack.progress
+            m.routeComplete = crossTrack.complete
+            if crossTrack.headingError is not None:
+                m.headingError = math.degrees(crossTrack.headingError)
+                m.headingErrorRms = math.degrees(crossTrack.headingStats.rms())
+    return turnAngle_deg, d, distanceToGoal
+
+
+# signal_handler - catches Ctrl+C gracefully.
+def signal_handler(sig, frame):
+    if UDPServerSocket_gps is not None:
+        UDPServerSocket_gps.close()
+    if UDPServerSocket_imu is not None:
+        UDPServerSocket_imu.close()
+    if throttle is not None:
+        throttle.value = 0
+    if crossTrack is not None:
+        print(crossTrack.describe())
+    if tracer is not None:
+        print(tracer.report())
+    print('User ended T-Rover.\n')
+    sys.exit(0)
+    ######
+
+# startSim - creates a simulated rover on the first waypoint, pointed at
+# the second one, that feeds sensorDict instead of the phone.
+def startSim(waypoints):
+    from trover.sim import SimRover
+    p = waypoints[0:2]
+    heading = math.degrees(math.atan2(p[1][0] - p[0][0], (p[1][1] - p[0][1]) * math.cos(math.radians(p[0][0]))))
+    rover = SimRover(p[0][0], p[0][1], heading_deg=heading)
+    rover.magCalibration = magCalibration
+    if fixGate is not None:
+        rover.fixFilter = acceptFix
+    rover.attach(sensorDict)
+    return rover
+
+# loadMappedRoute - compiles the route into thisroutefile with
+# trover/pipeline.py (unless it is up to date) and maps it. Returns the
+# route and its first two [lat, lon] points, for the simulator.
+def loadMappedRoute(fmt):
+    from trover import ingest
+    from trover import pipeline
+    storage = 'float32' if thisroutestorage == 'lists' else thisroutestorage
+    mapped, stats = pipeline.openRoute(waypoints_file, thisroutefile, fmt, thisaxisorder, thissimplify,
+                                       thisdensify, thisspacing, L, thischorderror, storage)
+    if stats is None:
+        print('Using %s (up to date)' % thisroutefile)
+    else:
+        print('Compiled %s: %d points -> %d route points' % (thisroutefile, stats['points'], stats['route']))
+    # the first chunk of the track can hold a single point
+    start = []
+    for lat, lon in ingest.iterTrack(waypoints_file, fmt, thisaxisorder):
+        start.extend([float(lat[k]), float(lon[k])] for k in range(min(len(lat), 2 - len(start))))
+        if len(start) == 2:
+            return mapped, start
+    raise ValueError('%s: found %d route points, need at least 2' % (waypoints_file, len(start)))
+
+# main - This is the main embedded system of T-Rover. startTime is the
+# time.time() the process started, for reporting the cold-start time.
+def main(startTime=None):
+    global servo, throttle, speedTable, speedPlanner, UDPServerSocket_gps, UDPServerSocket_imu, tracer, profiler, roverMetrics, goalSearch, routeGoalSearch, mapMatcher, crossTrack, goalEnd, estimator, compensator, headingFilter, trackHistory, magCalibration, imuStream, fixGate, clock, yawAxis
+    print('T-Rover Initializing...')
+    print(' ')
+    if thistrace:
+        tracer = trace.LatencyTracer()
+    if thisprofile:
+        profiler = profiling.StageProfiler()
+        profiling.installSignalHandlers(profiler)
+    if thismetricsport:
+        from trover import metrics
+        roverMetrics = metrics.RoverMetrics(period=loopPeriod)
+        metrics.startMetricsServer(roverMetrics, thismetricsport)
+        print('Metrics on http://127.0.0.1:%d/metrics' % thismetricsport)
+    sleep = time.sleep
+    if thisestimator not in ('fix', 'ekf'):
+        print('estimator must be fix or ekf, not "%s"' % thisestimator)
+        sys.exit(1)
+    if thisestimator == 'ekf':
+        from trover import ekf
+        estimator = ekf.PoseEkf(gpsSigma=conf['gpssigma'])
+    if conf['fixgate']:
+        from trover import fixgate
+        fixGate = fixgate.FixGate(topSpeed, conf['gpssigma'], conf['maxhdop'], conf['minsats'])
+    if thislatencycomp:
+        compensator = latency.LatencyCompensator(conf['gpsdelay'], conf['servodelay'])
+    try:
+        yawAxis = parseYawAxis(thisimuyawaxis)
+        forwardAxis = parseYawAxis(thisimuforwardaxis)
+    except ValueError as e:
+        print(e)
+        sys.exit(1)
+    if thisheading not in ('course', 'fused'):
+        print('heading must be course or fused, not "%s"' % thisheading)
+        sys.exit(1)
+    if thisheading == 'fused':
+        from trover import heading
+        headingFilter = heading.HeadingFilter(yawAxis, forwardAxis, conf['declination'], conf['coursespeed'])
+    if conf['magcal']:
+        from trover import magcal
+        try:
+            magCalibration = magcal.loadCalibration(conf['magcal'])
+        except (OSError, ValueError, KeyError) as e:
+            print('Cannot read magnetometer calibration %s: %s' % (conf['magcal'], e))
+            sys.exit(1)
+        print('Magnetometer calibration from %s (%d samples)' % (conf['magcal'], magCalibration.samples))
+    if thistrackcourse:
+        from trover import track
+        trackHistory = track.TrackHistory(window=conf['trackwindow'], minDistance=conf['trackmindistance'])
+    if thisservobackend != 'sim':  # the simulated rover starts once the route is loaded
+        servo = hardware.makeServo(thisservobackend, pin=26)
+        if thisspeedprofile:
+            throttle = hardware.makeThrottle(thisservobackend, pin=thisthrottlepin)
+        ############START UDP###################
+        print('Setting Up UDP Servers...')
+        UDPServerSocket_gps = openGpsSocket(thisbindaddress)
+        # Set up thread for UDP Server (phone is pushing as client to RPI)
+        th_gps_udp = threading.Thread(name='udpListener_gps', target=udpListener_gps, args=(sensorDict, UDPServerSocket_gps), daemon=True)
+        th_gps_udp.start()
+        if thisimuport:
+            from trover import imustream
+            imuStream = imustream.ImuStream(yawAxis=yawAxis, magCalibration=magCalibration)
+            UDPServerSocket_imu = imustream.openImuSocket(hardware.resolveBindAddress(thisbindaddress), thisimuport)
+            th_imu_udp = threading.Thread(name='udpListener_imu', target=udpListener_imu, args=(sensorDict, UDPServerSocket_imu), daemon=True)
+            th_imu_udp.start()
+
+    ##############START LOAD WAYPOINTS#################
+    # The listener thread is already receiving, so the route is compiled
+    # while the phone acquires a fix instead of after it.
+    print('Loading Coarse GPS Waypoints...')
+    # read from local waypoints_file and read into 2-D float array called: waypoints
+    print(waypoints_file)
+    fmt = None if thisrouteformat == 'auto' else thisrouteformat
+    if thisroutefile:
+        # streamed from the track into a mapped file, the lists below are
+        # never built
+        try:
+            mapped, startPoints = loadMappedRoute(fmt)
+        except (OSError, ValueError) as e:
+            print('Could not load the route: %s' % e)
+            sys.exit(1)
+        compactRoute = mapped
+    else:
+        from trover import ingest
+        try:
+            waypoints.extend(ingest.loadRoute(waypoints_file, fmt, thisaxisorder))
+        except (OSError, ValueError) as e:
+            print('Could not load the route: %s' % e)
+            sys.exit(1)
+        if thissimplify > 0:
+            # drop repeated fixes, stops and points on straight stretches
+            from trover import simplify
+            waypoints[:], stats = simplify.simplifyWaypoints(waypoints, thissimplify)
+            print('Simplified: %s' % simplify.describe(stats))
+        startPoints = waypoints
+        compactRoute = None
+        if thisroutestorage != 'lists':
+            from trover import pipeline
+            print('Compiling the route into %s offsets...' % thisroutestorage)
+            try:
+                compactRoute = pipeline.compileRoute(waypoints, thisdensify, thisspacing, L, thischorderror, thisroutestorage)
+            except ValueError as e:
+                print('Could not load the route: %s' % e)
+                sys.exit(1)
+    if thisservobackend == 'sim':
+        print('Starting Simulated T-Rover...')
+        simRover = startSim(startPoints)
+        firstFix.set()
+        servo = hardware.makeServo('sim', rover=simRover)
+        if thisspeedprofile:
+            throttle = hardware.makeThrottle('sim', rover=simRover, topSpeed=topSpeed)
+        # every loop sleep advances the simulation instead of waiting
+        sleep = simRover.advance
+        clock = lambda: simRover.t
+
+    if compactRoute is not None:
+        # the controller searches the offsets directly
+        sxx, syy = compactRoute.dx, compactRoute.dy
+        goalSearch = compactRoute.findGoalPoint
+        troverGoal = compactRoute.xy(len(compactRoute) - 1)
+    else:
+        print('Converting Coarse GPS Waypoints to UTM Coordinates')
+        # convert all coarse gps waypoints (spherical) to utm coordinates (cartesian)
+        waypoints_utm.extend(projectWaypoints(waypoints))
+
+        print('Smoothing UTM Waypoints...')
+        # smooth coarse utm waypoints_utm
+        if thisdensify == 'adaptive':
+            # sparse on straights, dense in turns
+            sxx, syy, suu, _ = densifyWaypoints(waypoints_utm, L, thischorderror, thisspacing)
+        else:
+            [sxx, syy, suu] = smoothWaypoints(waypoints_utm, thisspacing)
+        troverGoal = (sxx[-1], syy[-1])
+    if roverMetrics is not None:
+        roverMetrics.routeLength = len(sxx)
+    # map matching, the scorer and the speed profile want the route as
+    # coordinates; a compact or mapped route is only expanded for them
+    rx, ry = sxx, syy
+    if compactRoute is not None and (conf['mapmatch'] or conf['crosstrack'] or thisspeedprofile):
+        rx, ry = compactRoute.xyArrays()
+    if conf['mapmatch']:
+        from trover import mapmatch
+        mapMatcher = mapmatch.MapMatcher(rx, ry, conf['gpssigma'], conf['matchbeta'], conf['matchradius'])
+        routeGoalSearch = goalSearch
+        goalSearch = matchedGoalPoint
+    if conf['crosstrack']:
+        from trover import crosstrack
+        crossTrack = crosstrack.CrossTrack(rx, ry)
+    if thisspeedprofile:
+        print('Planning Speed Profile...')
+        from trover import speedprofile
+        speedPlanner = functools.partial(speedprofile.speedTable, rx, ry, maxSpeed=conf['maxspeed'], latAccel=conf['lataccel'],
+                                         longAccel=conf['longaccel'], minSpeed=conf['minspeed'])
+        speedTable = speedPlanner(L)
+        print('Speeds %.2f to %.2f m/s, %.1f s planned' % (speedTable.min(), speedTable.max(), speedprofile.planTime(rx, ry, speedTable)))
+    del rx, ry
+    print('Waypoints Loaded!')
+    ##############END LOAD WAYPOINTS#################
+    print(' ')
+    if not firstFix.is_set():
+        print('Awaiting Valid GPS Signal...')
+    # wakes as soon as the listener decodes the first fix
+    firstFix.wait()
+    print('Valid GPS signal received from phone.')
+    ##############END UDP#################
+    print(' ')
+    print('T-Rover System Ready!')
+    print('T-Rover Pure Pursuit Begin!')
+    c = 1 # used for limiting rate of output to terminal
+    distanceToGoal = 9999  # initial value
+    # a closed loop starts about where it ends: the goal point starts at
+    # the beginning of the route and moves on at most goalWindow() points
+    # a tick, and the end only counts once it is within reach of the goal
+    # point
+    goalEnd = goalWindow()
+    routeLast = len(sxx) - 1
+    # L, the control rate, goalradius and maxturnangle can be retuned by
+    # editing the config file or sending SIGHUP
+    watcher = config.ConfigWatcher(confFile, thisreloadinterval)
+    config.installReloadSignal(watcher)
+
+    while distanceToGoal > goalRadius or goalEnd <= routeLast:
+        turnAngle_deg, d, distanceToGoal = controlTick(sxx, syy, troverGoal)
+        if c == 1 and startTime is not None:
+            print('First servo command %.3f s after start.' % (time.time() - startTime))
+            startTime = None
+
+        # Print out the turn angle every 10 turn degrees
+        if (c % 10) == 0:
+            print('Turn Angle (Deg): %f, D_Goal: %d' % (turnAngle_deg, d))
+            c = 0
+        c += 1
+        if profiler is not None:
+            profiler.endTick()
+        if roverMetrics is not None:
+            roverMetrics.tick()
+        if watcher.due():
+            reloadConfig()
+        sleep(loopPeriod)
+
+    print('Goal Reached!')
+    servo.angle = 0
+    if throttle is not None:
+        throttle.value = 0
+    if thisservobackend == 'sim':
+        print('Simulated drive: %.1f s' % simRover.t)
+    if fixGate is not None:
+        print(fixGate.describe())
+    if crossTrack is not None:
+        print(crossTrack.describe())
+    if tracer is not None:
+        print(tracer.report())
+
+# run - entry point used by raspberrypi_trover.py. argv holds the command
+# line: an optional --conf FILE and key=value settings.
+def run(startTime=None, fname="raspberrypi_trover_conf.txt", argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description='T-Rover pure pursuit controller.',
+                                     formatter_class=argparse.RawDescriptionHelpFormatter,
+                                     epilog='settings (key=value, override the config file):\n' + config.usage(OPTIONS))
+    parser.add_argument('--conf', default=fname, help='config file (default %(default)s)')
+    parser.add_argument('settings', nargs='*', metavar='key=value')
+    args = parser.parse_args(argv)
+    # Set-up Ctrl+C handler
+    signal.signal(signal.SIGINT, signal_handler)
+    try:
+        loadConfig(args.conf, config.parseOverrides(args.settings))
+    except ValueError as e:
+        parser.error(str(e))
+    main(startTime)
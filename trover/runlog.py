@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+# runlog - scores the app.log of a run against the route it was driving.
+#
+# Development/termuxTrover.py logs one line per control tick:
+#
+#   lat, lon, heading (deg), goal x, goal y (UTM), turn angle (deg), L, d
+#
+# analyseRun() turns a whole log into numbers in a few array passes:
+#
+#   project      geo.deg2utmArrays, in the UTM zone of the route
+#   cross-track  the closest pass of the route within `radius` of every
+#                tick, from the spatial index of trover/mapmatch.py
+#                (RouteIndex), signed positive left of the route; with it
+#                the progress along the route and the heading error
+#   oscillation  sign changes of the turn angle, and its dominant
+#                frequency and amplitude from an FFT (the turn angle with
+#                its mean removed), which is the weave of an overtuned L
+#   goal         the first tick within goalRadius of the end of the route
+#
+# The log has no timestamps, so times and frequencies are in ticks unless
+# the loop period is given (--period). Parsing the numbers is most of the
+# work (one np.fromstring over the whole file): an hour of ticks at 10 Hz
+# is scored in about a third of a second. A line cut short when the run
+# was stopped is skipped.
+#
+# Usage (from the repository root):
+#   python3 -m trover.runlog rtkwaypoints.txt app.log
+#   python3 -m trover.runlog rtkwaypoints.txt logs/*.log --period 0.1 --csv runs.csv
+import argparse
+import math
+import sys
+import time
+
+import numpy as np
+
+from trover import mapmatch
+
+LOG_FIELDS = ('lat', 'lon', 'heading', 'goal_x', 'goal_y', 'turn', 'L', 'd')
+SUMMARY_FIELDS = ('ticks', 'bad_lines', 'unmatched', 'xte_rms', 'xte_mean', 'xte_p95', 'xte_max',
+                  'heading_rms', 'complete', 'sign_changes', 'steer_freq', 'steer_amplitude', 'goal_tick')
+
+
+# readLog - (n, 8) array of the ticks of an app.log and how many lines
+# could not be read
+def readLog(fname):
+    f = open(fname, 'rb')
+    text = f.read()
+    f.close()
+    lines = text.count(b'\n') + (0 if text.endswith(b'\n') or not text else 1)
+    fields = len(LOG_FIELDS)
+    values = None
+    if text.count(b',') == lines * (fields - 1):
+        try:
+            values = np.fromstring(text.replace(b'\n', b',').decode('utf-8'), dtype=float, sep=',')
+        except ValueError:
+            values = None
+        if values is not None and len(values) != lines * fields:
+            values = None
+    if values is None:
+        # a bad line (one cut short when the run was stopped): parse the
+        # lines that have all the fields, one at a time only if one of
+        # those is bad too
+        good = [line for line in text.splitlines() if line.count(b',') == fields - 1]
+        try:
+            values = np.fromstring(b','.join(good).decode('utf-8'), dtype=float, sep=',')
+            if len(values) != len(good) * fields:
+                raise ValueError
+        except ValueError:
+            parts = []
+            for line in good:
+                try:
+                    parts.append(np.fromstring(line.decode('utf-8'), dtype=float, sep=','))
+                except ValueError:
+                    continue
+            values = np.concatenate(parts) if parts else np.zeros(0)
+    ticks = len(values) // fields
+    return values[:ticks * fields].reshape(ticks, fields), lines - ticks
+
+
+# signedCrossTrack - for each point px, py the closest pass of the route
+# in index within radius: (signed distance, positive left of the route;
+# route segment; arc length), NaN (segment -1) beyond radius
+def signedCrossTrack(index, px, py, radius):
+    n = len(px)
+    point, seg, s, sx, sy, dist = index.candidates(px, py, radius)
+    xte = np.full(n, np.nan)
+    segment = np.full(n, -1)
+    progress = np.full(n, np.nan)
+    if len(point) == 0:
+        return xte, segment, progress
+    # candidates are sorted by point: the closest of each point's
+    starts = np.flatnonzero(np.r_[True, np.diff(point) != 0])
+    group = np.repeat(np.arange(len(starts)), np.diff(np.r_[starts, len(point)]))
+    atMin = np.flatnonzero(dist == np.minimum.reduceat(dist, starts)[group])
+    first = atMin[np.r_[True, group[atMin][1:] != group[atMin][:-1]]]
+    p = point[first]
+    g = seg[first]
+    dx = index.x[g + 1] - index.x[g]
+    dy = index.y[g + 1] - index.y[g]
+    side = dx * (py[p] - index.y[g]) - dy * (px[p] - index.x[g])
+    xte[p] = np.where(side >= 0, dist[first], -dist[first])
+    segment[p] = g
+    progress[p] = s[first]
+    return xte, segment, progress
+
+
+# signChanges - how many times v changes sign, zeros skipped
+def signChanges(v):
+    s = np.sign(v)
+    s = s[s != 0]
+    return int(np.count_nonzero(np.diff(s)))
+
+
+# dominantFrequency - (frequency in cycles per sample, amplitude) of the
+# strongest component of v after removing its mean; (nan, 0) for fewer
+# than 4 samples
+def dominantFrequency(v):
+    if len(v) < 4:
+        return math.nan, 0.0
+    spectrum = np.abs(np.fft.rfft(v - v.mean()))
+    k = int(np.argmax(spectrum[1:])) + 1
+    return k / len(v), float(2.0 * spectrum[k] / len(v))
+
+
+# analyseRun - the score of the ticks of a log (readLog) against the route
+# in index (a mapmatch.RouteIndex of the route in UTM zone huso). Returns
+# a dict of SUMMARY_FIELDS (ticks where it is in ticks).
+def analyseRun(index, huso, log, radius=5.0, goalRadius=3.0):
+    from trover import geo
+    n = len(log)
+    px, py = geo.deg2utmArrays(log[:, 0], log[:, 1], huso)
+    xte, seg, progress = signedCrossTrack(index, px, py, radius)
+    ok = seg >= 0
+    e = xte[ok]
+    g = seg[ok]
+    routeHeading = np.arctan2(index.y[g + 1] - index.y[g], index.x[g + 1] - index.x[g])
+    headingError = (np.radians(log[ok, 2]) - routeHeading + math.pi) % (2 * math.pi) - math.pi
+    turn = log[:, 5]
+    freq, amplitude = dominantFrequency(turn)
+    atGoal = np.flatnonzero(np.hypot(px - index.x[-1], py - index.y[-1]) <= goalRadius)
+    return {
+        'ticks': n,
+        'unmatched': int(n - ok.sum()),
+        'xte_rms': float(np.sqrt(np.mean(e * e))) if len(e) else math.nan,
+        'xte_mean': float(e.mean()) if len(e) else math.nan,
+        'xte_p95': float(np.percentile(np.abs(e), 95)) if len(e) else math.nan,
+        'xte_max': float(np.abs(e).max()) if len(e) else math.nan,
+        'heading_rms': float(np.degrees(np.sqrt(np.mean(headingError ** 2)))) if len(e) else math.nan,
+        'complete': float(100.0 * np.max(progress[ok]) / index.s[-1]) if len(e) else 0.0,
+        'sign_changes': signChanges(turn),
+        'steer_freq': freq,
+        'steer_amplitude': amplitude,
+        'goal_tick': int(atGoal[0]) if len(atGoal) else -1,
+    }
+
+
+# describe - the summary of analyseRun() as text; period is the loop
+# period (s) or None
+def describe(fname, r, period=None):
+    lines = ['%s: %d ticks%s' % (fname, r['ticks'], ', %d bad lines skipped' % r['bad_lines'] if r['bad_lines'] else '')]
+    lines.append('  cross-track rms %.2f m, mean %+.2f m, p95 %.2f m, max %.2f m; heading error rms %.1f deg; %.0f%% of the route%s'
+                 % (r['xte_rms'], r['xte_mean'], r['xte_p95'], r['xte_max'], r['heading_rms'], r['complete'],
+                    '; %d ticks off the route' % r['unmatched'] if r['unmatched'] else ''))
+    changes = r['sign_changes'] / max(r['ticks'], 1)
+    if period:
+        lines.append('  steering: %d sign changes (%.2f/s), strongest weave %.3f Hz (%.1f s period), %.1f deg'
+                     % (r['sign_changes'], changes / period, r['steer_freq'] / period,
+                        period / r['steer_freq'] if r['steer_freq'] else math.inf, r['steer_amplitude']))
+    else:
+        lines.append('  steering: %d sign changes (%.3f per tick), strongest weave every %.1f ticks, %.1f deg'
+                     % (r['sign_changes'], changes, 1.0 / r['steer_freq'] if r['steer_freq'] else math.inf,
+                        r['steer_amplitude']))
+    if r['goal_tick'] < 0:
+        lines.append('  goal not reached')
+    elif period:
+        lines.append('  goal reached after %.1f s' % (r['goal_tick'] * period))
+    else:
+        lines.append('  goal reached after %d ticks' % r['goal_tick'])
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    from trover import geo
+    from trover import ingest
+    from trover import pipeline
+    parser = argparse.ArgumentParser(description='Score app.log files of termuxTrover.py runs against their route.')
+    parser.add_argument('route')
+    parser.add_argument('logs', nargs='+', metavar='log')
+    parser.add_argument('--period', type=float, help='loop period (s), to report times and frequencies in seconds')
+    parser.add_argument('--spacing', type=float, default=0.05, help='route spacing (m), as termuxTrover.py smooths it')
+    parser.add_argument('--radius', type=float, default=5.0, help='farthest a tick can be from the route (m)')
+    parser.add_argument('--goalradius', type=float, default=3.0, help='distance from the end of the route that counts as the goal (m)')
+    parser.add_argument('--csv', help='also write one line of SUMMARY_FIELDS per log here')
+    args = parser.parse_args(argv)
+
+    waypoints = ingest.loadRoute(args.route)
+    x, y = pipeline.compileRoute(waypoints, spacing=args.spacing).xyArrays()
+    huso, zone = geo.utmZone(waypoints[0][0], waypoints[0][1])
+    index = mapmatch.RouteIndex(x, y, args.radius)
+    out = None
+    if args.csv:
+        out = open(args.csv, 'w')
+        out.write('log,' + ','.join(SUMMARY_FIELDS) + '\n')
+    for fname in args.logs:
+        t0 = time.perf_counter()
+        log, bad = readLog(fname)
+        if len(log) == 0:
+            print('%s: no ticks' % fname)
+            continue
+        r = analyseRun(index, huso, log, args.radius, args.goalradius)
+        r['bad_lines'] = bad
+        dt = time.perf_counter() - t0
+        print(describe(fname, r, args.period))
+        print('  analysed in %.0f ms' % (dt * 1e3))
+        if out is not None:
+            out.write(fname + ',' + ','.join('%.6g' % r[k] for k in SUMMARY_FIELDS) + '\n')
+    if out is not None:
+        out.close()
+        print('Written to %s' % args.csv)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,184 @@
+# sim - a simulated T-Rover for off-device runs.
+#
+# SimRover is a kinematic bicycle model driven by the steering angle that
+# SimServo writes to it (and, with a SimThrottle, the speed it sets, reached
+# at `accel` m/s^2). It keeps its own simulated clock, so the control
+# loop can run as fast as the CPU allows: pass SimRover.advance to the
+# control loop in place of time.sleep and every "sleep" moves the rover
+# forward by that much simulated time and refreshes sensorDict the way the
+# UDP listeners would (sensorDict["gps"] = [lat, lon], sensorDict["compass"]
+# and sensorDict["course"] = heading in degrees counter-clockwise from East,
+# and every 10 ms sensorDict["yawrate"] = the gyroscope yaw rate in rad/s,
+# with gyro_bias and gyro_noise added). A fix shows where the rover was
+# gps_latency seconds earlier, and a steering command takes effect
+# steer_delay seconds after SimServo writes it (setSteer). The course has
+# course_noise degrees of noise at 1 m/s (more when slower) and is None
+# below 0.1 m/s, like RMC, or always with rmc=False (a GGA only bridge).
+# A fix comes with sensorDict["fixquality"] = (1, hdop, satellites) like
+# the bridge sends, and with probability gps_outliers is off by
+# outlier_size metres (a multipath jump). A fixFilter (rover.acceptFix)
+# sees every fix first, as the GPS listener's gate does, and can drop it.
+#
+# sensorDict["accel"] and sensorDict["mag"] are what a phone standing on
+# its long edge, volume buttons up and screen to the back, would read
+# (imuyawaxis = x, imuforwardaxis = -z): gravity plus the rover's own
+# acceleration, and the Earth's field (MAG_FIELD, `declination` degrees
+# East of true North) distorted by mag_matrix (soft iron, phone axes) plus
+# mag_offset and mag_noise. With a magCalibration the magnetometer is
+# corrected with it, as the IMU listener does with the phone's.
+import math
+import random
+from collections import deque
+
+EARTH_M_PER_DEG = 111320.0  # metres per degree of latitude
+GRAVITY = 9.81  # m/s^2
+MAG_FIELD = (23.0, 42.0)  # microtesla, horizontal and down (north Georgia)
+
+
+class SimRover:
+    def __init__(self, lat, lon, heading_deg=90.0, speed=1.5, wheelbase=0.33,
+                 gps_rate=10.0, gps_noise=0.0, seed=None, accel=2.0, gyro_noise=0.0, gyro_bias=0.0,
+                 gps_latency=0.0, steer_delay=0.0, course_noise=0.0, declination=0.0,
+                 mag_noise=0.0, mag_offset=(0.0, 0.0, 0.0), mag_matrix=None, rmc=True,
+                 gps_outliers=0.0, outlier_size=10.0, hdop=1.0, satellites=9):
+        self.lat0 = lat
+        self.lon0 = lon
+        self.x = 0.0  # metres East of (lat0, lon0)
+        self.y = 0.0  # metres North of (lat0, lon0)
+        self.heading = math.radians(heading_deg)
+        self.speed = speed  # m/s
+        self.targetSpeed = None  # m/s set by SimThrottle; None = keep speed
+        self.accel = accel  # m/s^2 towards targetSpeed
+        self.wheelbase = wheelbase  # metres
+        self.steer = 0.0  # degrees, positive = left (servo convention)
+        self.t = 0.0  # simulated seconds
+        self.gps_period = 1.0 / gps_rate
+        self.gps_noise = gps_noise  # metres, 1 sigma
+        self.gyro_noise = gyro_noise  # rad/s, 1 sigma
+        self.gyro_bias = gyro_bias  # rad/s
+        self.gps_latency = gps_latency  # seconds
+        self.steer_delay = steer_delay  # seconds
+        self.course_noise = course_noise  # degrees at 1 m/s, 1 sigma
+        self.declination = math.radians(declination)
+        self.mag_noise = mag_noise  # microtesla, 1 sigma
+        self.mag_offset = mag_offset  # microtesla, phone x, y, z
+        self.mag_matrix = mag_matrix  # 3x3 rows, None = no soft iron
+        self.magCalibration = None  # magcal.MagCalibration
+        self.rmc = rmc  # False = fixes without a course
+        self.gps_outliers = gps_outliers  # probability of a fix being a jump
+        self.outlier_size = outlier_size  # metres
+        self.quality = (1, hdop, satellites)
+        self.fixFilter = None  # called with ([lat, lon], quality, t), False drops the fix
+        self.outliers = 0
+        self.past = deque()  # (t, x, y, heading) of the last gps_latency seconds
+        self.commands = deque()  # (t, angle) of steering commands not yet applied
+        self.rng = random.Random(seed)
+        self._nextFix = 0.0
+        self.sensorDict = None
+        self.fixes = 0
+
+    # latlon - current position as (lat, lon), or that of (x, y)
+    def latlon(self, x=None, y=None):
+        if x is None:
+            x, y = self.x, self.y
+        lat = self.lat0 + y / EARTH_M_PER_DEG
+        lon = self.lon0 + x / (EARTH_M_PER_DEG * math.cos(math.radians(self.lat0)))
+        return lat, lon
+
+    # setSteer - steering command (degrees, positive = left), applied
+    # steer_delay seconds from now
+    def setSteer(self, angle):
+        if self.steer_delay > 0:
+            self.commands.append((self.t + self.steer_delay, angle))
+        else:
+            self.steer = angle
+
+    # attach - makes advance() publish fixes and IMU samples into
+    # sensorDict; publishes the first of them straight away.
+    def attach(self, sensorDict):
+        self.sensorDict = sensorDict
+        self.sensorDict["yawrate"] = self.gyro_bias
+        self._publishImu(0.0, 0.0)
+        self._publish()
+
+    def _publish(self):
+        x, y, heading = self.x, self.y, self.heading
+        if self.gps_latency > 0:
+            # the state of gps_latency seconds ago
+            past = self.past
+            while len(past) > 1 and past[1][0] <= self.t - self.gps_latency:
+                past.popleft()
+            if past:
+                t, x, y, heading = past[0]
+        if self.gps_outliers > 0 and self.rng.random() < self.gps_outliers:
+            a = self.rng.uniform(0, 2 * math.pi)
+            x += self.outlier_size * math.cos(a)
+            y += self.outlier_size * math.sin(a)
+            self.outliers += 1
+        lat, lon = self.latlon(x, y)
+        if self.gps_noise > 0:
+            lat += self.rng.gauss(0, self.gps_noise) / EARTH_M_PER_DEG
+            lon += self.rng.gauss(0, self.gps_noise) / (EARTH_M_PER_DEG * math.cos(math.radians(self.lat0)))
+        self._nextFix = self.t + self.gps_period
+        if self.fixFilter is not None and not self.fixFilter([lat, lon], self.quality, self.t):
+            return
+        self.sensorDict["fixtime"] = self.t
+        self.sensorDict["fixquality"] = self.quality
+        if self.speed < 0.1 or not self.rmc:
+            self.sensorDict["course"] = None
+        else:
+            course = math.degrees(heading)
+            if self.course_noise > 0:
+                course += self.rng.gauss(0, self.course_noise / self.speed)
+            self.sensorDict["compass"] = course % 360
+            self.sensorDict["course"] = self.sensorDict["compass"]
+        self.sensorDict["gps"] = [lat, lon]
+        self.fixes += 1
+
+    # _publishImu - accelerometer and magnetometer samples of a rover
+    # speeding up at `forward` and turning with `lateral` (m/s^2, left)
+    def _publishImu(self, forward, lateral):
+        # phone x is up, y left and z back
+        self.sensorDict["accel"] = [GRAVITY, lateral, -forward]
+        h = self.heading + self.declination
+        north = MAG_FIELD[0] * math.sin(h)  # field along the front of the rover
+        left = MAG_FIELD[0] * math.cos(h)
+        mag = [-MAG_FIELD[1], left, -north]
+        if self.mag_matrix is not None:
+            mag = [sum(a * b for a, b in zip(row, mag)) for row in self.mag_matrix]
+        for i in range(3):
+            mag[i] += self.mag_offset[i]
+            if self.mag_noise > 0:
+                mag[i] += self.rng.gauss(0, self.mag_noise)
+        if self.magCalibration is not None:
+            mag = self.magCalibration.correct(mag)
+        self.sensorDict["mag"] = mag
+
+    # advance - moves the simulation forward by dt seconds. Integrates in
+    # steps of at most 10 ms and publishes a fix every gps_period.
+    def advance(self, dt):
+        end = self.t + dt
+        while self.t < end:
+            h = min(0.01, end - self.t)
+            while self.commands and self.commands[0][0] <= self.t:
+                self.steer = self.commands.popleft()[1]
+            if self.gps_latency > 0:
+                self.past.append((self.t, self.x, self.y, self.heading))
+            speed = self.speed
+            if self.targetSpeed is not None and self.speed != self.targetSpeed:
+                dv = self.targetSpeed - self.speed
+                self.speed += max(-self.accel * h, min(self.accel * h, dv))
+            yawRate = self.speed / self.wheelbase * math.tan(math.radians(self.steer))
+            self.x += self.speed * math.cos(self.heading) * h
+            self.y += self.speed * math.sin(self.heading) * h
+            self.heading += yawRate * h
+            self.t += h
+            if self.sensorDict is None:
+                continue
+            gyro = yawRate + self.gyro_bias
+            if self.gyro_noise > 0:
+                gyro += self.rng.gauss(0, self.gyro_noise)
+            self.sensorDict["yawrate"] = gyro
+            self._publishImu((self.speed - speed) / h, self.speed * yawRate)
+            if self.t >= self._nextFix:
+                self._publish()
@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+# simplify - thins out recorded GPS tracks before they are smoothed.
+#
+# A track logged while driving the route (ccsvtrack.txt) is mostly points
+# the rover does not need: repeated fixes, GPS jitter while it sat still,
+# and many points along straight stretches. simplifyTrack() removes them
+# in three vectorized passes over local metric coordinates:
+#
+#   1. stationary      runs of at least `window` fixes that stay within
+#                      stationaryRadius of their mean are replaced by it
+#   2. duplicates      consecutive points closer than 1 mm
+#   3. Douglas-Peucker points within `tolerance` metres of the line through
+#                      their neighbours are dropped
+#
+# The simplified track never strays more than `tolerance` from the kept
+# part of the original, so smoothWaypoints() fills in the same path from
+# far fewer coarse points.
+#
+# Usage (from the repository root):
+#   python3 -m trover.simplify ccsvtrack.txt -o ccsvtrack_simple.txt
+#   python3 -m trover.simplify ccsvtrack.txt --tolerance 0.1
+#
+# or set `simplify = 0.05` in raspberrypi_trover_conf.txt to simplify the
+# route when the rover loads it.
+import argparse
+import sys
+import time
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+EARTH_M_PER_DEG = 111320.0
+DUPLICATE_DISTANCE = 0.001  # m
+
+
+# localXY - lat/lon arrays to metres east/north of the first point
+def localXY(lat, lon):
+    lat = np.asarray(lat, dtype=float)
+    lon = np.asarray(lon, dtype=float)
+    x = (lon - lon[0]) * EARTH_M_PER_DEG * np.cos(np.radians(lat[0]))
+    y = (lat - lat[0]) * EARTH_M_PER_DEG
+    return x, y
+
+
+# dropDuplicates - boolean mask of the points that are not repeats of the
+# point before them
+def dropDuplicates(x, y, eps=DUPLICATE_DISTANCE):
+    step = np.hypot(np.diff(x), np.diff(y))
+    return np.r_[True, step > eps]
+
+
+# stationaryRuns - (starts, ends) of the runs of at least `window` fixes
+# that stay within `radius` metres of their mean (ends exclusive). A fix
+# is a candidate if the track in a window centred on it fits in a box of
+# diagonal 2 * radius; a run of candidates counts only if the whole run
+# does, so slow driving is left to Douglas-Peucker.
+def stationaryRuns(x, y, radius=0.25, window=5):
+    n = len(x)
+    empty = np.zeros(0, dtype=np.intp)
+    if n < window or window < 2:
+        return empty, empty
+    half = window // 2
+    wx = sliding_window_view(np.pad(x, half, mode='edge'), 2 * half + 1)
+    wy = sliding_window_view(np.pad(y, half, mode='edge'), 2 * half + 1)
+    still = np.hypot(wx.max(1) - wx.min(1), wy.max(1) - wy.min(1)) <= 2 * radius
+    edges = np.diff(np.r_[0, still.astype(np.int8), 0])
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+    long = ends - starts >= window
+    starts, ends = starts[long], ends[long]
+    if len(starts) == 0:
+        return empty, empty
+    # extent of every whole run, via reduceat over [start, end) pairs
+    idx = np.c_[starts, ends].ravel()
+    if idx[-1] == n:
+        idx = idx[:-1]
+    ex = np.maximum.reduceat(x, idx)[::2] - np.minimum.reduceat(x, idx)[::2]
+    ey = np.maximum.reduceat(y, idx)[::2] - np.minimum.reduceat(y, idx)[::2]
+    fits = np.hypot(ex, ey) <= 2 * radius
+    return starts[fits], ends[fits]
+
+
+# segmentDistance - distance of the points (px, py) from the segments
+# (ax, ay)-(bx, by); all arguments are arrays of the same length
+def segmentDistance(px, py, ax, ay, bx, by):
+    dx = bx - ax
+    dy = by - ay
+    dd = dx * dx + dy * dy
+    degenerate = dd == 0
+    t = ((px - ax) * dx + (py - ay) * dy) / np.where(degenerate, 1.0, dd)
+    t = np.where(degenerate, 0.0, np.clip(t, 0.0, 1.0))
+    return np.hypot(px - (ax + t * dx), py - (ay + t * dy))
+
+
+# douglasPeucker - boolean mask of the points Douglas-Peucker keeps at
+# `tolerance` metres. Rather than recursing segment by segment, every
+# pass handles all open segments at once: each undecided point is measured
+# against the kept points either side of it, the farthest point of every
+# segment beyond the tolerance is kept, and the points of segments that
+# are within it are settled. The number of passes is the depth of the
+# recursion, each an O(n) array operation.
+def douglasPeucker(x, y, tolerance):
+    n = len(x)
+    keep = np.zeros(n, dtype=bool)
+    if n < 3:
+        keep[:] = True
+        return keep
+    keep[0] = keep[-1] = True
+    pts = np.arange(1, n - 1)
+    while len(pts):
+        kept = np.flatnonzero(keep)
+        right = np.searchsorted(kept, pts)
+        a = kept[right - 1]
+        b = kept[right]
+        d = segmentDistance(x[pts], y[pts], x[a], y[a], x[b], y[b])
+        # pts is sorted, so the points of one segment are contiguous
+        first = np.flatnonzero(np.r_[True, right[1:] != right[:-1]])
+        group = np.repeat(np.arange(len(first)), np.diff(np.r_[first, len(pts)]))
+        dmax = np.maximum.reduceat(d, first)
+        atMax = np.flatnonzero(d == dmax[group])
+        farthest = atMax[np.r_[True, group[atMax][1:] != group[atMax][:-1]]]
+        split = dmax > tolerance
+        keep[pts[farthest[split]]] = True
+        open_ = split[group]
+        open_[farthest[split]] = False
+        pts = pts[open_]
+    return keep
+
+
+# collapseRuns - the columns (arrays of equal length) with every run
+# [start, end) replaced by its mean
+def collapseRuns(columns, starts, ends):
+    if len(starts) == 0:
+        return columns
+    n = len(columns[0])
+    counts = ends - starts
+    # every run becomes its mean, stored in the run's first slot
+    idx = np.c_[starts, ends].ravel()
+    if idx[-1] == n:
+        idx = idx[:-1]
+    columns = [np.array(a, dtype=float) for a in columns]
+    for a in columns:
+        a[starts] = np.add.reduceat(a, idx)[::2] / counts
+    covered = np.zeros(n + 1, dtype=np.int32)
+    np.add.at(covered, starts + 1, 1)
+    np.add.at(covered, ends, -1)
+    keep = np.cumsum(covered[:-1]) == 0
+    return [a[keep] for a in columns]
+
+
+# simplifyTrack - the three passes. Returns (lat, lon, stats) where stats
+# counts the points removed by each pass.
+def simplifyTrack(lat, lon, tolerance=0.05, stationaryRadius=0.25, window=5):
+    lat = np.array(lat, dtype=float)
+    lon = np.array(lon, dtype=float)
+    stats = {'points': len(lat)}
+    if len(lat) < 3:
+        stats.update(duplicates=0, stationary=0, douglasPeucker=0, kept=len(lat))
+        return lat, lon, stats
+    x, y = localXY(lat, lon)
+
+    starts, ends = stationaryRuns(x, y, stationaryRadius, window)
+    lat, lon, x, y = collapseRuns((lat, lon, x, y), starts, ends)
+    stats['stationary'] = stats['points'] - len(x)
+
+    keep = dropDuplicates(x, y)
+    stats['duplicates'] = int(len(keep) - keep.sum())
+    lat, lon, x, y = lat[keep], lon[keep], x[keep], y[keep]
+
+    keep = douglasPeucker(x, y, tolerance)
+    stats['douglasPeucker'] = int(len(keep) - keep.sum())
+    lat, lon = lat[keep], lon[keep]
+    stats['kept'] = len(lat)
+    return lat, lon, stats
+
+
+# simplifyChunks - simplifyTrack as a stream: takes and yields chunks of
+# (x, y) metric (UTM) coordinates, holding back the last `window` points
+# of every chunk, and any stop they are part of, for the next one. Each
+# chunk is simplified between the last point already yielded and the
+# points held back, so the result stays within `tolerance` of the track
+# while memory stays that of a chunk; the chunk ends are kept as
+# Douglas-Peucker end points. Counts of the removed points are added to
+# stats, a dict like simplifyTrack's.
+def simplifyChunks(chunks, tolerance=0.05, stationaryRadius=0.25, window=5, stats=None):
+    if stats is None:
+        stats = {}
+    for k in ('points', 'stationary', 'duplicates', 'douglasPeucker', 'kept'):
+        stats.setdefault(k, 0)
+    carryX = np.zeros(0)
+    carryY = np.zeros(0)
+    last = None
+    chunks = iter(chunks)
+    done = False
+    while not done:
+        part = next(chunks, None)
+        if part is None:
+            done = True
+            x, y = carryX, carryY
+        else:
+            stats['points'] += len(part[0])
+            x = np.r_[carryX, part[0]]
+            y = np.r_[carryY, part[1]]
+        starts, ends = stationaryRuns(x, y, stationaryRadius, window)
+        cut = len(x)
+        if not done:
+            # the window test of the last points needs the next chunk
+            cut = len(x) - window
+            touching = np.flatnonzero(ends > cut)
+            if len(touching):
+                cut = min(cut, starts[touching[0]])
+            if cut <= 0:
+                carryX, carryY = x, y
+                continue
+        inside = ends <= cut
+        carryX, carryY = x[cut:], y[cut:]
+        x, y = collapseRuns((x[:cut], y[:cut]), starts[inside], ends[inside])
+        stats['stationary'] += int(cut - len(x))
+        if last is not None:
+            x = np.r_[last[0], x]
+            y = np.r_[last[1], y]
+        if len(x) == 0:
+            continue
+        keep = dropDuplicates(x, y)
+        stats['duplicates'] += int(len(keep) - keep.sum())
+        x, y = x[keep], y[keep]
+        keep = douglasPeucker(x, y, tolerance)
+        stats['douglasPeucker'] += int(len(keep) - keep.sum())
+        x, y = x[keep], y[keep]
+        if last is not None:
+            x, y = x[1:], y[1:]  # yielded with the previous chunk
+        if len(x) == 0:
+            continue
+        last = (x[-1], y[-1])
+        stats['kept'] += len(x)
+        yield x, y
+
+
+# simplifyWaypoints - simplifyTrack for the [[lat, lon], ...] lists of
+# ingest.loadRoute
+def simplifyWaypoints(waypoints, tolerance=0.05, stationaryRadius=0.25, window=5):
+    a = np.asarray(waypoints, dtype=float)
+    lat, lon, stats = simplifyTrack(a[:, 0], a[:, 1], tolerance, stationaryRadius, window)
+    return np.c_[lat, lon].tolist(), stats
+
+
+# describe - one line summary of simplifyTrack's stats
+def describe(stats):
+    n = stats['points']
+    return ('%d -> %d points (%.1f%% fewer): %d stationary, %d duplicates, %d by Douglas-Peucker'
+            % (n, stats['kept'], 100.0 * (n - stats['kept']) / max(n, 1), stats['stationary'],
+               stats['duplicates'], stats['douglasPeucker']))
+
+
+# routeLoadTime - seconds to project and smooth a waypoint list the way
+# the rover does (best of `repeat`), and the smoothed point count
+def routeLoadTime(waypoints, spacing, repeat=3):
+    from trover import route
+    best = None
+    for r in range(repeat):
+        t0 = time.perf_counter()
+        sxx, syy, suu = route.smoothWaypoints(route.projectWaypoints(waypoints), spacing)
+        dt = time.perf_counter() - t0
+        best = dt if best is None else min(best, dt)
+    return best, len(sxx)
+
+
+def main(argv=None):
+    from trover import ingest
+    from trover import route
+    parser = argparse.ArgumentParser(description='Simplify a recorded track (any format trover.ingest reads).')
+    parser.add_argument('track')
+    parser.add_argument('-o', '--output', help='write the simplified track here')
+    parser.add_argument('--tolerance', type=float, default=0.05, help='Douglas-Peucker tolerance (m)')
+    parser.add_argument('--stationary-radius', type=float, default=0.25, help='(m)')
+    parser.add_argument('--window', type=int, default=5, help="fixes a stop must last")
+    parser.add_argument('--spacing', type=float, default=route.spacingBetweenCoarseWaypoints,
+                        help='smoothing spacing used for the load time report (m)')
+    args = parser.parse_args(argv)
+
+    waypoints = ingest.loadRoute(args.track)
+    t0 = time.perf_counter()
+    simple, stats = simplifyWaypoints(waypoints, args.tolerance, args.stationary_radius, args.window)
+    dt = time.perf_counter() - t0
+    print(describe(stats))
+    print('Simplified in %.1f ms' % (dt * 1e3))
+    before, nBefore = routeLoadTime(waypoints, args.spacing)
+    after, nAfter = routeLoadTime(simple, args.spacing)
+    print('Project + smooth: %.1f ms (%d points) -> %.1f ms (%d points)'
+          % (before * 1e3, nBefore, after * 1e3, nAfter))
+    if args.output:
+        f = open(args.output, 'w')
+        for lat, lon in simple:
+            f.write('%.10f,%.10f\n' % (lat, lon))
+        f.close()
+        print('Written to %s' % args.output)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
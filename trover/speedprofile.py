@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+# speedprofile - plans how fast T-Rover can drive every point of a route.
+#
+# purePursuit() only steers; the throttle used to be fixed. speedTable()
+# works out, once when the route is loaded, the fastest speed for every
+# route point that keeps the rover within
+#
+#   maxSpeed     m/s anywhere
+#   latAccel     m/s^2 sideways in turns: v <= sqrt(latAccel / |curvature|)
+#   longAccel    m/s^2 speeding up and braking
+#
+# The curvature of a point is the turning angle between the chords to the
+# points `window` metres before and after it, over their mean length: the
+# rover follows the route smoothed over its look ahead distance, not the
+# 5 cm kinks between recorded fixes. The per-point curvature of
+# densify = adaptive (trover/route.py) is the curvature of those kinks:
+# on ccsvtrack.txt it reaches 200 1/m and would plan the loop at a third
+# of the speed, so it is not used here. A forward pass then limits how
+# fast the rover can get anywhere from a standing start and a backward
+# pass how fast it can be and still brake for the turns ahead. Both
+# passes are closed forms over cumulative arrays, with v^2 linear in
+# distance,
+#
+#   forward   v_i^2 = S_i + min over j <= i of (vcap_j^2 - S_j),  S = 2 a s
+#   backward  v_i^2 = min over j >= i of (vcap_j^2 + S_j) - S_i
+#
+# so the whole plan is a handful of vectorized O(n) operations. Finally
+# each entry becomes the slowest planned speed between it and the point L
+# metres before it: the control loop looks the speed up at the index of
+# the goal point (an O(1) table read), and the rover is still up to L
+# behind that point, in the turn the goal point has already left.
+#
+# Usage (from the repository root), to see the plan of a route:
+#   python3 -m trover.speedprofile ccsvtrack.txt --max-speed 3 --lat-accel 1
+import argparse
+import sys
+
+import numpy as np
+
+
+# arcLength - distance along the polyline x, y from its first point
+def arcLength(x, y):
+    s = np.zeros(len(x))
+    np.cumsum(np.hypot(np.diff(x), np.diff(y)), out=s[1:])
+    return s
+
+
+# windowCurvature - curvature (1/m) at every point of the polyline x, y
+# (arc length s), from the points `window` metres before and after it
+def windowCurvature(x, y, s, window):
+    n = len(s)
+    i = np.arange(n)
+    a = np.maximum(np.searchsorted(s, s - window, 'right') - 1, 0)
+    b = np.minimum(np.searchsorted(s, s + window, 'left'), n - 1)
+    ax = x - x[a]
+    ay = y - y[a]
+    bx = x[b] - x
+    by = y[b] - y
+    la = np.hypot(ax, ay)
+    lb = np.hypot(bx, by)
+    phi = np.arctan2(ax * by - ay * bx, ax * bx + ay * by)
+    ok = (la > 0) & (lb > 0) & (a < i) & (b > i)
+    return np.where(ok, 2 * phi / np.where(ok, la + lb, 1.0), 0.0)
+
+
+# planSpeeds - the fastest speed at arc lengths s with the given
+# curvature, starting and ending at startSpeed / endSpeed (m/s)
+def planSpeeds(s, kappa, maxSpeed, latAccel, longAccel, startSpeed=0.0, endSpeed=0.0):
+    k = np.abs(kappa)
+    cap2 = np.where(k > 0, latAccel / np.where(k > 0, k, 1.0), np.inf)
+    cap2 = np.minimum(cap2, maxSpeed ** 2)
+    cap2[0] = min(cap2[0], startSpeed ** 2)
+    cap2[-1] = min(cap2[-1], endSpeed ** 2)
+    S = 2 * longAccel * s
+    forward = S + np.minimum.accumulate(cap2 - S)
+    backward = np.minimum.accumulate((cap2 + S)[::-1])[::-1] - S
+    return np.sqrt(np.maximum(np.minimum(forward, backward), 0.0))
+
+
+# lookbackMin - for every point, the smallest v of the points within
+# `distance` metres before it (itself included)
+def lookbackMin(v, s, distance):
+    n = len(v)
+    start = np.searchsorted(s, s - distance, 'left')
+    # reduceat over [start_i, i + 1) pairs; the odd results are discarded
+    idx = np.c_[start, np.arange(1, n + 1)].ravel()[:-1]
+    return np.minimum.reduceat(v, idx)[::2]
+
+
+# speedTable - planned speed (m/s, float32) of every route point for a
+# rover with look ahead L. minSpeed keeps the rover moving at the start
+# and end of the route, where the plan would stand still.
+def speedTable(x, y, L, maxSpeed=2.0, latAccel=1.0, longAccel=0.5, minSpeed=0.5):
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    s = arcLength(x, y)
+    kappa = windowCurvature(x, y, s, L / 2)
+    v = planSpeeds(s, kappa, maxSpeed, latAccel, longAccel, minSpeed, minSpeed)
+    return lookbackMin(np.maximum(v, minSpeed), s, L).astype(np.float32)
+
+
+# planTime - seconds to drive the route following the table
+def planTime(x, y, table):
+    step = np.hypot(np.diff(x), np.diff(y))
+    v = np.asarray(table, dtype=float)
+    return float(np.sum(2 * step / (v[:-1] + v[1:])))
+
+
+def main(argv=None):
+    from trover import ingest
+    from trover import pipeline
+    parser = argparse.ArgumentParser(description='Plan the speed profile of a route.')
+    parser.add_argument('route')
+    parser.add_argument('--L', type=float, default=3.0, help='look ahead distance (m)')
+    parser.add_argument('--spacing', type=float, default=0.05, help='route spacing (m)')
+    parser.add_argument('--max-speed', type=float, default=2.0, help='(m/s)')
+    parser.add_argument('--lat-accel', type=float, default=1.0, help='(m/s^2)')
+    parser.add_argument('--long-accel', type=float, default=0.5, help='(m/s^2)')
+    parser.add_argument('--min-speed', type=float, default=0.5, help='(m/s)')
+    args = parser.parse_args(argv)
+
+    r = pipeline.compileRoute(ingest.loadRoute(args.route), spacing=args.spacing)
+    x, y = r.xyArrays()
+    table = speedTable(x, y, args.L, args.max_speed, args.lat_accel, args.long_accel, args.min_speed)
+    length = arcLength(x, y)[-1]
+    print('%d route points, %.1f m' % (len(x), length))
+    print('speed min %.2f, mean %.2f, max %.2f m/s' % (table.min(), table.mean(), table.max()))
+    print('planned time %.1f s (%.1f s if all of it were driven at %.2f m/s)'
+          % (planTime(x, y, table), length / args.max_speed, args.max_speed))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
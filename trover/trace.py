@@ -0,0 +1,219 @@
+# trace - fix-to-servo latency tracing.
+#
+# With tracing on, termux_trover.py appends a trace to every GPS datagram:
+#
+#   heading,lat,lon,quality,hdop,sats,traceId,nmeaUtc,phoneRecv,phoneSend
+#
+# where nmeaUtc is the UTC time of the fix from the GGA sentence and
+# phoneRecv/phoneSend are the phone's wall clock when the NMEA arrived from
+# the USB bridge and when the datagram was sent. The Raspberry Pi adds its
+# own receive time and the time the control loop picked the fix up and
+# wrote the servo. Every trace is cut into stages:
+#
+#   receiver->phone  nmeaUtc   -> phoneRecv  (receiver, USB, bridge app)
+#   phone parse      phoneRecv -> phoneSend  (termux_trover.py)
+#   wifi             phoneSend -> piRecv     (hotspot UDP)
+#   loop wait        piRecv    -> tick start (listener thread, 100 ms loop)
+#   control          tick start -> servo write
+#   fix->servo       nmeaUtc   -> servo write (whole pipeline)
+#
+# Phone and Pi clocks are not the same, so the Pi estimates the offset
+# with NTP style SYNC exchanges over the same UDP link (ClockOffset) and
+# moves phone times onto its own clock. nmeaUtc is treated as being on the
+# phone's clock, i.e. the phone is assumed to keep network time. Both ends
+# read SYNC packets with kernel receive timestamps where the OS offers them
+# (recvfromStamped), so the time a packet sat in the socket while the
+# reader slept does not bias the offset.
+import math
+import socket
+import struct
+import sys
+import threading
+import time
+
+SO_TIMESTAMP = getattr(socket, 'SO_TIMESTAMP', 29 if sys.platform.startswith('linux') else None)
+
+
+STAGES = ('receiver->phone', 'phone parse', 'wifi', 'loop wait', 'control', 'fix->servo')
+
+
+# utcSeconds - seconds since midnight of a datetime.time (pynmea2's
+# msg.timestamp), or None.
+def utcSeconds(t):
+    if t is None:
+        return None
+    return t.hour * 3600 + t.minute * 60 + t.second + t.microsecond * 1e-6
+
+
+# utcToEpoch - turns an NMEA UTC time of day into a Unix time, using a
+# nearby Unix time `now` to pick the day (handles midnight rollover).
+def utcToEpoch(secondsOfDay, now):
+    day = math.floor(now / 86400.0) * 86400.0
+    t = day + secondsOfDay
+    if t - now > 43200:
+        t -= 86400
+    elif now - t > 43200:
+        t += 86400
+    return t
+
+
+# enableRecvTimestamps - asks the kernel to timestamp datagrams arriving
+# on sock. Returns False if the platform cannot.
+def enableRecvTimestamps(sock):
+    if SO_TIMESTAMP is None or not hasattr(sock, 'recvmsg'):
+        return False
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, SO_TIMESTAMP, 1)
+    except OSError:
+        return False
+    return True
+
+
+# recvfromStamped - like sock.recvfrom() but also returns the arrival time
+# (Unix time): the kernel timestamp if enableRecvTimestamps() worked,
+# otherwise the time recvfrom returned.
+def recvfromStamped(sock, bufsize):
+    if SO_TIMESTAMP is None or not hasattr(sock, 'recvmsg'):
+        data, addr = sock.recvfrom(bufsize)
+        return data, addr, time.time()
+    data, ancdata, flags, addr = sock.recvmsg(bufsize, socket.CMSG_SPACE(16))
+    for level, kind, cdata in ancdata:
+        if level == socket.SOL_SOCKET and kind == SO_TIMESTAMP and len(cdata) >= struct.calcsize('ll'):
+            sec, usec = struct.unpack('ll', cdata[:struct.calcsize('ll')])
+            return data, addr, sec + usec * 1e-6
+    return data, addr, time.time()
+
+
+# Histogram - log spaced latency histogram from 100 us to 100 s with 10
+# bins per decade, plus count/min/max/sum. record() is O(1).
+class Histogram:
+    LOW = 1e-4
+    PER_DECADE = 10
+    BINS = 60
+
+    def __init__(self):
+        self.counts = [0] * (self.BINS + 2)  # [under, bins..., over]
+        self.n = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def record(self, seconds):
+        if seconds < self.LOW:
+            k = 0
+        else:
+            k = int(math.log10(seconds / self.LOW) * self.PER_DECADE) + 1
+            if k > self.BINS:
+                k = self.BINS + 1
+        self.counts[k] += 1
+        self.n += 1
+        self.total += seconds
+        if seconds < self.min:
+            self.min = seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    # upperEdge - upper edge (seconds) of bin k
+    def upperEdge(self, k):
+        if k == 0:
+            return self.LOW
+        return self.LOW * 10 ** (k / self.PER_DECADE)
+
+    # percentile - approximate percentile (0-100) from the bins, reported
+    # as the upper edge of the bin it falls in (clamped to min/max).
+    def percentile(self, p):
+        if self.n == 0:
+            return math.nan
+        want = p / 100.0 * self.n
+        run = 0
+        for k, c in enumerate(self.counts):
+            run += c
+            if run >= want and c:
+                return min(max(self.upperEdge(k), self.min), self.max)
+        return self.max
+
+    def mean(self):
+        return self.total / self.n if self.n else math.nan
+
+
+# ClockOffset - estimates (phone clock - Pi clock) from NTP style
+# exchanges. t1 = Pi send, t2 = phone receive, t3 = phone send, t4 = Pi
+# receive. The sample with the smallest round trip out of the last
+# `window` is used, since it is the one least disturbed by queuing.
+class ClockOffset:
+    def __init__(self, window=16):
+        self.window = window
+        self.samples = []
+        self.offset = 0.0
+        self.delay = math.inf
+        self.valid = False
+
+    def addSample(self, t1, t2, t3, t4):
+        delay = (t4 - t1) - (t3 - t2)
+        offset = ((t2 - t1) + (t3 - t4)) / 2.0
+        self.samples.append((delay, offset))
+        if len(self.samples) > self.window:
+            del self.samples[0]
+        self.delay, self.offset = min(self.samples)
+        self.valid = True
+
+    # toLocal - converts a phone timestamp to the Pi clock
+    def toLocal(self, tPhone):
+        return tPhone - self.offset
+
+
+# LatencyTracer - collects per stage latency histograms on the Pi.
+class LatencyTracer:
+    def __init__(self):
+        self.hist = dict((s, Histogram()) for s in STAGES)
+        self.clock = ClockOffset()
+        self.lastTraceId = None
+        self.traces = 0
+        self.lock = threading.Lock()
+
+    # recordTick - records one control tick. fix is the trace tuple stored
+    # by the datagram decoder: (traceId, nmeaUtc, phoneRecv, phoneSend,
+    # piRecv). The phone side stages are recorded once per fix, the age of
+    # the fix at the servo on every tick that uses it.
+    def recordTick(self, fix, tickStart, servoWrite):
+        traceId, nmeaUtc, phoneRecv, phoneSend, piRecv = fix
+        h = self.hist
+        with self.lock:
+            h['control'].record(servoWrite - tickStart)
+            if traceId != self.lastTraceId:
+                self.lastTraceId = traceId
+                self.traces += 1
+                h['loop wait'].record(tickStart - piRecv)
+                h['phone parse'].record(phoneSend - phoneRecv)
+                if self.clock.valid:
+                    h['wifi'].record(piRecv - self.clock.toLocal(phoneSend))
+                if nmeaUtc is not None:
+                    h['receiver->phone'].record(phoneRecv - utcToEpoch(nmeaUtc, phoneRecv))
+            if nmeaUtc is not None and self.clock.valid:
+                h['fix->servo'].record(servoWrite - self.clock.toLocal(utcToEpoch(nmeaUtc, phoneRecv)))
+
+    # report - text table of every stage plus a histogram of fix->servo
+    def report(self):
+        with self.lock:
+            lines = ['Latency trace: %d fixes, clock offset %+.1f ms (round trip %.1f ms)'
+                     % (self.traces, self.clock.offset * 1e3, self.clock.delay * 1e3),
+                     '%-16s %7s %9s %9s %9s %9s %9s' % ('stage', 'n', 'min ms', 'mean ms', 'p50 ms', 'p99 ms', 'max ms')]
+            for s in STAGES:
+                hs = self.hist[s]
+                if hs.n == 0:
+                    lines.append('%-16s %7d' % (s, 0))
+                    continue
+                lines.append('%-16s %7d %9.2f %9.2f %9.2f %9.2f %9.2f'
+                             % (s, hs.n, hs.min * 1e3, hs.mean() * 1e3, hs.percentile(50) * 1e3,
+                                hs.percentile(99) * 1e3, hs.max * 1e3))
+            for s in STAGES:
+                hs = self.hist[s]
+                if hs.n == 0:
+                    continue
+                lines.append(' ')
+                lines.append('%s histogram:' % s)
+                top = max(hs.counts)
+                for k, c in enumerate(hs.counts):
+                    if c:
+                        lines.append('  <%9.2f ms %7d %s' % (hs.upperEdge(k) * 1e3, c, '#' * max(1, int(40 * c / top))))
+            return '\n'.join(lines)
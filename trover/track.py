@@ -0,0 +1,63 @@
+# track - course and speed from the last few GPS fixes.
+#
+# The RMC sentence carries the course; GGA does not. A receiver set up for
+# GGA only at a high rate (or an RMC without a course, which the bridge
+# sends as 'None') leaves the Pi without a heading. TrackHistory keeps
+# the projected fixes and their times in a NumPy ring buffer and fits a
+# straight line to x(t) and y(t) over the last `window` seconds by least
+# squares: the slope is the velocity, so every fix in the window counts
+# and the noise of any one of them is averaged out, unlike the difference
+# of the last two fixes. The course is only reported once the rover has
+# moved at least minDistance over the window; standing still, GPS noise
+# would otherwise spin the course around.
+import math
+
+import numpy as np
+
+
+# TrackHistory - the ring buffer of `size` fixes
+class TrackHistory:
+    def __init__(self, size=64, window=1.0, minDistance=0.5):
+        self.t = np.zeros(size)
+        self.x = np.zeros(size)
+        self.y = np.zeros(size)
+        self.size = size
+        self.window = window
+        self.minDistance = minDistance
+        self.n = 0  # fixes added
+        self.origin = None  # first fix; positions are kept relative to it
+
+    # add - a fix at UTM (x, y) measured at time t
+    def add(self, t, x, y):
+        if self.origin is None:
+            self.origin = (x, y)
+        i = self.n % self.size
+        self.t[i] = t
+        self.x[i] = x - self.origin[0]
+        self.y[i] = y - self.origin[1]
+        self.n += 1
+
+    # estimate - (course in radians counter-clockwise from East or None,
+    # speed in m/s) over the fixes of the last `window` seconds
+    def estimate(self):
+        m = min(self.n, self.size)
+        if m < 2:
+            return None, 0.0
+        t = self.t[:m]
+        last = self.t[(self.n - 1) % self.size]
+        sel = t >= last - self.window
+        tt = t[sel]
+        if len(tt) < 2:
+            return None, 0.0
+        dt = tt - tt.mean()
+        var = dt @ dt
+        if var <= 0:
+            return None, 0.0
+        xx = self.x[:m][sel]
+        yy = self.y[:m][sel]
+        vx = dt @ (xx - xx.mean()) / var
+        vy = dt @ (yy - yy.mean()) / var
+        speed = math.hypot(vx, vy)
+        if speed * (tt.max() - tt.min()) < self.minDistance:
+            return None, speed
+        return math.atan2(vy, vx), speed